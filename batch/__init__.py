@@ -0,0 +1,2 @@
+from .manifest import load_manifest, JOB_OPTIONS
+from .batch_runner import run_batch, STAGES
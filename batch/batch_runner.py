@@ -0,0 +1,397 @@
+import json
+import os
+import pickle
+import shutil
+import time
+import traceback
+from multiprocessing import Pool
+import numpy as np
+import pandas as pd
+from utils import (Detections,
+                   CourtKeypoints,
+                   read_video_frames,
+                   read_video_chunks,
+                   batch_frames,
+                   save_video,
+                   get_video_fps,
+                   FrameScaler)
+from mini_court import MiniCourt
+from trackers import CourtTracker
+from detection_cache import DetectionCache
+from pipeline import load_models, export_models, analyze_detections, annotate_frames
+from .manifest import load_manifest
+
+# Stages of a job in order, each one is checkpointed in the job's directory
+STAGES = ["detect", "analyze", "annotate"]
+
+# Job options each stage uses, see JOB_OPTIONS. Changing one only runs its stage
+# and the stages after it again
+STAGE_OPTIONS = {
+    "detect": ["batch_size", "detection_size", "static_court", "court_change_threshold"],
+    "analyze": ["projection"],
+    "annotate": ["chunk_size", "codec", "fps"]
+}
+
+# Models of the current worker process, loaded once by init_worker and reused by every job
+worker_models = None
+
+def init_worker(player_model_path, ball_model_path, court_model_path, cache_dir, cache_size_mb, model_options):
+    """
+    Loads the models once per worker process so every job reuses them.
+    """
+    global worker_models
+
+    # Every worker evicts the shared cache, so all of them need the same size limit
+    cache = DetectionCache(cache_dir, max_size_bytes=cache_size_mb * 1024 ** 2) if cache_dir is not None else None
+    worker_models = load_models(player_model_path, ball_model_path, court_model_path, cache=cache,
+                                **model_options)
+
+class JobCheckpoints:
+    """
+    Files of one job inside its directory of the work directory. Every stage
+    writes its results to a temporary path first and renames it when done, so
+    a job that was interrupted resumes after the last complete stage.
+    """
+    def __init__(self, job_dir):
+        self.job_dir = job_dir
+        self.detections_dir = os.path.join(job_dir, "detections")
+        self.analysis_path = os.path.join(job_dir, "analysis.pkl")
+        self.status_path = os.path.join(job_dir, "job.json")
+
+    def prepare(self, stage_keys):
+        """
+        Creates the job directory and drops the checkpoints of the first stage whose
+        key changed (another input video, other models or other options the stage
+        uses) and of every stage after it, see get_stage_keys.
+        """
+        os.makedirs(self.job_dir, exist_ok=True)
+
+        status = self.load_status() or {"status": "pending"}
+        old_keys = status.get("keys", {})
+
+        for i, stage in enumerate(STAGES):
+            if old_keys.get(stage) != stage_keys[stage]:
+                self.clear(STAGES[i:])
+                status["status"] = "pending"
+                break
+
+        status["keys"] = stage_keys
+        self.save_status(status)
+
+    def clear(self, stages):
+        """
+        Deletes the checkpoints of the given stages. The output video of a job
+        is only written over, it stops counting as done once the status isn't.
+        """
+        if "detect" in stages and os.path.isdir(self.detections_dir):
+            shutil.rmtree(self.detections_dir)
+
+        if "analyze" in stages and os.path.exists(self.analysis_path):
+            os.remove(self.analysis_path)
+
+    def load_status(self):
+        if not os.path.exists(self.status_path):
+            return None
+
+        with open(self.status_path) as f:
+            return json.load(f)
+
+    def save_status(self, status):
+        def write(path):
+            with open(path, "w") as f:
+                json.dump(status, f, indent=2)
+
+        write_atomically(self.status_path, write)
+
+    def is_done(self, stage, job):
+        if stage == "detect":
+            return os.path.isdir(self.detections_dir)
+
+        if stage == "analyze":
+            return os.path.exists(self.analysis_path)
+
+        status = self.load_status()
+
+        return status is not None and status["status"] == "done" and os.path.exists(job["output"])
+
+def write_atomically(path, write):
+    """
+    Calls write with a temporary path next to path and then moves the result to
+    path, so path either doesn't exist or is complete. The temporary path keeps
+    the extension, which picks the container of a video.
+    """
+    root, extension = os.path.splitext(path)
+    temporary_path = f"{root}.tmp{extension}"
+
+    if os.path.isdir(temporary_path):
+        shutil.rmtree(temporary_path)
+
+    write(temporary_path)
+    os.replace(temporary_path, path)
+
+def get_stage_keys(job, model_paths):
+    """
+    Returns what the checkpoint of each stage of a job depends on: the input video
+    (by path, size and modification time), the models and the job's options the
+    stage uses. Each key holds the ones of the stages before it, so a stage runs
+    again whenever an earlier one does.
+    """
+    input_stat = os.stat(job["input"])
+
+    key = {"input": os.path.abspath(job["input"]),
+           "size": input_stat.st_size,
+           "mtime": input_stat.st_mtime,
+           "models": model_paths}
+    stage_keys = {}
+
+    for stage in STAGES:
+        key = {**key, stage: {name: job["options"].get(name) for name in STAGE_OPTIONS[stage]}}
+        stage_keys[stage] = json.dumps(key, sort_keys=True)
+
+    return stage_keys
+
+def detect_job(job, checkpoints):
+    """
+    Detects players and the ball and tracks the court in a single pass over the
+    video, and saves the detections.
+    """
+    player_tracker, ball_tracker, court_line_detector = worker_models
+    options = job["options"]
+    batch_size = options.get("batch_size", 1)
+
+    # Every video starts new tracks
+    player_tracker.reset_tracks()
+    ball_tracker.reset_tracks()
+
+    # All detectors run on the same downscaled copy of each frame, see FrameScaler
+    frame_scaler = FrameScaler(options.get("detection_size"))
+
+    # A static court is only predicted on the first frame of the video
+    change_threshold = float("inf") if options.get("static_court") else options.get("court_change_threshold", 0.4)
+    court_tracker = CourtTracker(court_line_detector, change_threshold=change_threshold, frame_scaler=frame_scaler)
+
+    player_detections = []
+    ball_detections = []
+    frame_num = 0
+
+    for frames in batch_frames(frame_scaler.downscale_frames(read_video_frames(job["input"])), batch_size):
+        player_detections.extend(player_tracker.detect_next_frames(frames))
+        ball_detections.extend(ball_tracker.detect_batch(frames))
+        court_tracker.track(frames, start_frame=frame_num)
+        frame_num += len(frames)
+
+    player_detections.extend(player_tracker.flush_frames())
+
+    def save(detections_dir):
+        os.makedirs(detections_dir)
+        frame_scaler.remap_detections(Detections.from_dicts(player_detections)).save(
+            os.path.join(detections_dir, "player_detections"))
+        frame_scaler.remap_detections(Detections.from_dicts(ball_detections)).save(
+            os.path.join(detections_dir, "ball_detections"))
+        court_tracker.court_keypoints.save(os.path.join(detections_dir, "court_keypoints.npz"))
+
+    write_atomically(checkpoints.detections_dir, save)
+
+    return frame_num
+
+def analyze_job(job, checkpoints):
+    """
+    Runs the post-processing on the saved detections and saves the analysis.
+    """
+    player_tracker, ball_tracker, _ = worker_models
+
+    player_detections = Detections.load(os.path.join(checkpoints.detections_dir, "player_detections"), mmap_mode=None)
+    ball_detections = Detections.load(os.path.join(checkpoints.detections_dir, "ball_detections"), mmap_mode=None)
+    court_keypoints = CourtKeypoints.load(os.path.join(checkpoints.detections_dir, "court_keypoints.npz"))
+
+    frame_shape = next(read_video_frames(job["input"])).shape
+    mini_court = MiniCourt(np.empty(frame_shape, dtype=np.uint8))
+
+    analysis = analyze_detections(player_tracker, ball_tracker, mini_court,
+                                  player_detections, ball_detections, court_keypoints,
+                                  projection=job["options"].get("projection", "height"),
+                                  fps=get_video_fps(job["input"]))
+
+    def write(path):
+        with open(path, "wb") as f:
+            pickle.dump(analysis, f)
+
+    write_atomically(checkpoints.analysis_path, write)
+
+    return len(player_detections)
+
+def annotate_job(job, checkpoints):
+    """
+    Draws the saved analysis onto the video and writes the output video.
+    """
+    player_tracker, ball_tracker, court_line_detector = worker_models
+    options = job["options"]
+
+    with open(checkpoints.analysis_path, "rb") as f:
+        analysis = pickle.load(f)
+
+    mini_court = None
+
+    def annotated_frames():
+        nonlocal mini_court
+
+        for start_frame, frames in read_video_chunks(job["input"], options.get("chunk_size", 64)):
+            if mini_court is None:
+                mini_court = MiniCourt(frames[0])
+
+            yield from annotate_frames(frames, start_frame,
+                                       player_tracker, ball_tracker, court_line_detector,
+                                       mini_court, analysis)
+
+    os.makedirs(os.path.dirname(os.path.abspath(job["output"])), exist_ok=True)
+    write_atomically(job["output"],
+                     lambda path: save_video(annotated_frames(), path,
+                                             fps=options.get("fps") or get_video_fps(job["input"]),
+                                             codec=options.get("codec", "MJPG")))
+
+    return len(analysis["player_detections"])
+
+def run_job(job, work_dir, model_paths):
+    """
+    Runs the stages of a job that aren't checkpointed yet. Errors are caught so
+    one broken video doesn't stop the batch.
+
+    :return: dictionary with the job's status, number of frames and seconds per stage
+    """
+    checkpoints = JobCheckpoints(os.path.join(work_dir, job["id"]))
+    report = {"id": job["id"], "input": job["input"], "output": job["output"], "status": "done", "frames": None}
+    start_time = time.perf_counter()
+
+    try:
+        checkpoints.prepare(get_stage_keys(job, model_paths))
+
+        # Stages finished by an earlier run are skipped, up to the first one that
+        # has to run again, after which every stage works on new results
+        resuming = True
+
+        for stage, run_stage in zip(STAGES, [detect_job, analyze_job, annotate_job]):
+            if resuming and checkpoints.is_done(stage, job):
+                report[f"{stage}_seconds"] = None
+                continue
+
+            resuming = False
+
+            # An old output isn't done anymore once an earlier stage ran again
+            status = checkpoints.load_status()
+            status["status"] = "running"
+            checkpoints.save_status(status)
+
+            stage_start_time = time.perf_counter()
+            status["frames"] = run_stage(job, checkpoints)
+            report[f"{stage}_seconds"] = time.perf_counter() - stage_start_time
+            checkpoints.save_status(status)
+
+        status = checkpoints.load_status()
+        status["status"] = "done"
+        checkpoints.save_status(status)
+        report["frames"] = status.get("frames")
+    except Exception as error:
+        report["status"] = "failed"
+        report["error"] = repr(error)
+
+        os.makedirs(checkpoints.job_dir, exist_ok=True)
+
+        with open(os.path.join(checkpoints.job_dir, "error.txt"), "w") as f:
+            f.write(traceback.format_exc())
+
+    report["total_seconds"] = time.perf_counter() - start_time
+
+    return report
+
+def run_job_in_worker(args):
+    """
+    Calls run_job with a tuple of arguments, for Pool.imap_unordered.
+    """
+    return run_job(*args)
+
+def run_batch(manifest_path, work_dir, player_model_path, ball_model_path, court_model_path,
+              num_workers=1, output_dir="outputs", cache_dir=None, cache_size_mb=1024, num_threads=None,
+              model_options=None, job_defaults=None):
+    """
+    Analyzes every video of a manifest with a pool of worker processes. Each
+    worker loads the models once and then runs whole jobs, one video at a time.
+    A job's detections, analysis and output are checkpointed in
+    work_dir/<job id>, so running the same manifest again only redoes what
+    didn't finish or depends on an input, model or option that changed. A
+    timing report of all jobs is printed and written to work_dir/report.csv.
+
+    :param manifest_path: manifest of the videos to analyze, see load_manifest
+    :param work_dir: directory of the checkpoints and the report
+    :param num_workers: number of worker processes, each running one job at a time
+    :param output_dir: directory of outputs the manifest doesn't give
+    :param cache_dir: optional directory of a DetectionCache shared by the workers
+    :param cache_size_mb: size limit of the shared DetectionCache in megabytes
+    :param num_threads: number of CPU threads used for inference by each worker, defaults to
+                        the CPUs split evenly across the workers so they don't compete
+    :param model_options: keyword arguments of load_models shared by all jobs
+                          (court_backend, ball_roi_tracking, player_keyframe_interval, ...)
+    :param job_defaults: options of every job the manifest doesn't override, see JOB_OPTIONS
+    :return: pandas DataFrame of the report, one row per job
+    """
+    jobs = load_manifest(manifest_path, output_dir=output_dir, defaults=job_defaults)
+    os.makedirs(work_dir, exist_ok=True)
+
+    if num_threads is None:
+        num_threads = max(1, os.cpu_count() // num_workers)
+
+    model_options = {**(model_options or {}), "num_threads": num_threads}
+    model_paths = {"player": player_model_path, "ball": ball_model_path, "court": court_model_path,
+                   **{name: value for name, value in model_options.items() if name != "num_threads"}}
+
+    # Exports are written once here, the workers only load them
+    export_models(player_model_path, ball_model_path, court_model_path,
+                  court_backend=model_options.get("court_backend", "eager"),
+                  player_model_format=model_options.get("player_model_format", "pytorch"),
+                  ball_model_format=model_options.get("ball_model_format", "pytorch"))
+
+    reports = []
+
+    with Pool(min(num_workers, len(jobs)) or 1, initializer=init_worker,
+              initargs=(player_model_path, ball_model_path, court_model_path, cache_dir, cache_size_mb,
+                        model_options)) as pool:
+        # Jobs are handed out one at a time, so a long video doesn't hold up a queue of short ones
+        for report in pool.imap_unordered(run_job_in_worker, [(job, work_dir, model_paths) for job in jobs]):
+            print(f"[{len(reports) + 1}/{len(jobs)}] {report['id']} {report['status']} "
+                  f"in {report['total_seconds']:.1f} s")
+            reports.append(report)
+
+    # Report in manifest order
+    job_order = {job["id"]: i for i, job in enumerate(jobs)}
+    reports.sort(key=lambda report: job_order[report["id"]])
+
+    report = pd.DataFrame(reports, columns=["id", "status", "frames",
+                                            *[f"{stage}_seconds" for stage in STAGES],
+                                            "total_seconds", "input", "output", "error"])
+    # Only jobs that ran every stage in this run have a meaningful throughput
+    ran_every_stage = report[[f"{stage}_seconds" for stage in STAGES]].notna().all(axis=1)
+    report["frames_per_second"] = (report["frames"] / report["total_seconds"]).where(ran_every_stage)
+    report.to_csv(os.path.join(work_dir, "report.csv"), index=False)
+
+    print_report(report)
+
+    return report
+
+def print_report(report):
+    """
+    Prints the timing report, stages resumed from a checkpoint show as "-".
+    """
+    print(f"{'job':<24}{'status':<10}{'frames':>8}"
+          + "".join(f"{stage + ' s':>12}" for stage in STAGES)
+          + f"{'total s':>10}{'frames/s':>10}")
+
+    for _, row in report.iterrows():
+        stage_columns = "".join(f"{'-':>12}" if pd.isna(row[f"{stage}_seconds"]) else f"{row[f'{stage}_seconds']:>12.1f}"
+                                for stage in STAGES)
+        frames = "-" if pd.isna(row["frames"]) else int(row["frames"])
+        frames_per_second = "-" if pd.isna(row["frames_per_second"]) else f"{row['frames_per_second']:.1f}"
+
+        print(f"{row['id']:<24}{row['status']:<10}{frames:>8}{stage_columns}"
+              f"{row['total_seconds']:>10.1f}{frames_per_second:>10}")
+
+        if row["status"] == "failed":
+            print(f"    {row['error']}")
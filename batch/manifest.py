@@ -0,0 +1,78 @@
+import json
+import os
+
+# Options a job of the manifest can set for itself, everything else (models,
+# cache, keyframes) is shared by all jobs since the models are loaded once
+JOB_OPTIONS = ["projection", "static_court", "court_change_threshold", "batch_size", "chunk_size", "codec", "fps",
+               "detection_size"]
+
+def load_manifest(manifest_path, output_dir="outputs", defaults=None):
+    """
+    Returns the list of jobs in a manifest. Every job is a dictionary with an
+    "id", an "input" video path, an "output" video path and "options".
+
+    The manifest is one of:
+    .json: a list of jobs, or {"defaults": {...}, "jobs": [...]}
+    .jsonl: one job per line
+    anything else: one input video path per line
+
+    A job is either an input path or a dictionary with "input" and optionally
+    "id", "output" and any of JOB_OPTIONS. Relative paths are relative to the
+    manifest. Jobs without an id are named after their input file, jobs without
+    an output are written to output_dir/<id>.avi.
+
+    :param manifest_path: path to the manifest file
+    :param output_dir: directory of outputs not given in the manifest
+    :param defaults: options of every job, overridden by the manifest's
+                     "defaults" and then by the job itself
+    """
+    with open(manifest_path) as f:
+        if manifest_path.endswith(".json"):
+            manifest = json.load(f)
+        elif manifest_path.endswith(".jsonl"):
+            manifest = [json.loads(line) for line in f if line.strip()]
+        else:
+            manifest = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+    if isinstance(manifest, dict):
+        defaults = {**(defaults or {}), **manifest.get("defaults", {})}
+        manifest = manifest["jobs"]
+
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_path))
+    jobs = []
+    job_ids = set()
+
+    for entry in manifest:
+        if isinstance(entry, str):
+            entry = {"input": entry}
+
+        entry = dict(entry)
+        input_video_path = os.path.join(manifest_dir, entry.pop("input"))
+        job_id = entry.pop("id", None) or os.path.splitext(os.path.basename(input_video_path))[0]
+        output_video_path = entry.pop("output", None)
+
+        # Videos with the same file name in different directories get numbered
+        if job_id in job_ids:
+            job_id = f"{job_id}_{len(jobs)}"
+
+        job_ids.add(job_id)
+
+        if output_video_path is None:
+            output_video_path = os.path.join(output_dir, f"{job_id}.avi")
+        else:
+            output_video_path = os.path.join(manifest_dir, output_video_path)
+
+        unknown_options = set(entry) - set(JOB_OPTIONS)
+
+        if unknown_options:
+            raise ValueError(f"Unknown options {sorted(unknown_options)} for job {job_id}, "
+                             f"jobs can set {JOB_OPTIONS}")
+
+        jobs.append({
+            "id": job_id,
+            "input": input_video_path,
+            "output": output_video_path,
+            "options": {**(defaults or {}), **entry}
+        })
+
+    return jobs
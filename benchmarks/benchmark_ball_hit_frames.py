@@ -0,0 +1,79 @@
+"""
+Checks that the vectorized BallTracker.get_ball_hit_frames returns the same
+frames as the original loop implementation and compares their run times on a
+synthetic trajectory.
+
+Run from the repository root:
+    python -m benchmarks.benchmark_ball_hit_frames --frames 1000000
+"""
+import argparse
+import time
+import pandas as pd
+from trackers import BallTracker
+from benchmarks.synthetic import generate_ball_detections
+
+def get_ball_hit_frames_reference(ball_positions):
+    """
+    The original loop implementation of BallTracker.get_ball_hit_frames,
+    kept here as the reference for the equivalence check.
+    """
+    ball_positions = [x.get(1, []) for x in ball_positions]
+    df_ball_positions = pd.DataFrame(ball_positions, columns=["x1", "y1", "x2", "y2"])
+    df_ball_positions["mid_y"] = (df_ball_positions["y1"] + df_ball_positions["y2"]) / 2
+    df_ball_positions["mid_y_rolling_mean"] = df_ball_positions["mid_y"].rolling(window=5, min_periods=1, center=False).mean()
+    df_ball_positions["delta_y"] = df_ball_positions["mid_y_rolling_mean"].diff()
+    df_ball_positions["ball_hit"] = 0
+    minimum_frames_for_hit = 25
+
+    for i in range(1, len(df_ball_positions) - int(1.2 * minimum_frames_for_hit)):
+        negative_pos_change = df_ball_positions["delta_y"].iloc[i] > 0 and df_ball_positions["delta_y"].iloc[i + 1] < 0
+        positive_pos_change = df_ball_positions["delta_y"].iloc[i] < 0 and df_ball_positions["delta_y"].iloc[i + 1] > 0
+
+        if negative_pos_change or positive_pos_change:
+            frame_count = 0
+
+            for j in range(i + 1, i + 1 + int(1.2 * minimum_frames_for_hit)):
+                negative_pos_change_after = df_ball_positions["delta_y"].iloc[i] > 0 and df_ball_positions["delta_y"].iloc[j] < 0
+                positive_pos_change_after = df_ball_positions["delta_y"].iloc[i] < 0 and df_ball_positions["delta_y"].iloc[j] > 0
+
+                if negative_pos_change and negative_pos_change_after or positive_pos_change and positive_pos_change_after:
+                    frame_count += 1
+
+            if frame_count >= minimum_frames_for_hit:
+                df_ball_positions.loc[i, "ball_hit"] = 1
+
+    return df_ball_positions[df_ball_positions["ball_hit"] == 1].index.tolist()
+
+def time_call(function, *args):
+    """
+    Returns the result of function(*args) and how long it took in seconds.
+    """
+    start_time = time.perf_counter()
+    result = function(*args)
+
+    return result, time.perf_counter() - start_time
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark BallTracker.get_ball_hit_frames")
+    parser.add_argument("--frames", type=int, default=1_000_000, help="length of the synthetic trajectory")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-reference", action="store_true",
+                        help="only time the vectorized implementation")
+    args = parser.parse_args()
+
+    ball_detections = generate_ball_detections(args.frames, seed=args.seed)
+
+    # BallTracker only needs a model for detection, which isn't used here
+    ball_tracker = BallTracker.__new__(BallTracker)
+    hit_frames, vectorized_time = time_call(ball_tracker.get_ball_hit_frames, ball_detections)
+    print(f"vectorized: {vectorized_time:.3f}s ({len(hit_frames)} hits over {args.frames} frames)")
+
+    if not args.skip_reference:
+        reference_hit_frames, reference_time = time_call(get_ball_hit_frames_reference, ball_detections)
+        print(f"reference:  {reference_time:.3f}s ({reference_time / vectorized_time:.1f}x slower)")
+
+        assert hit_frames == reference_hit_frames, "vectorized hit frames differ from the reference"
+        print("hit frames match the reference")
+
+if __name__ == "__main__":
+    main()
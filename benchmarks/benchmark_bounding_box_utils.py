@@ -0,0 +1,136 @@
+"""
+Checks that the array versions of the bounding box utilities give the same
+results as the original one-box-at-a-time functions and compares their run
+times over all detections of a synthetic video.
+
+Run from the repository root:
+    python -m benchmarks.benchmark_bounding_box_utils --frames 100000
+"""
+import argparse
+import math
+import time
+import numpy as np
+from utils import (get_centers_of_boxes,
+                   distances_between_points,
+                   get_foot_positions,
+                   get_closest_keypoint_indices,
+                   get_bounding_box_heights)
+from benchmarks.synthetic import generate_rally, generate_court_keypoints
+
+# The original scalar implementations, kept here as the reference
+
+def get_center_of_box_reference(bounding_box):
+    x1, y1, x2, y2 = bounding_box
+    center_x = int((x1 + x2) / 2)
+    center_y = int((y1 + y2) / 2)
+
+    return (center_x, center_y)
+
+def distance_between_points_reference(p1, p2):
+    x1, y1 = p1
+    x2, y2 = p2
+
+    return math.sqrt(math.pow(x2 - x1, 2) + math.pow(y2 - y1, 2))
+
+def get_foot_position_reference(player_bounding_box):
+    x1, y1, x2, y2 = player_bounding_box
+
+    return (int((x1 + x2) / 2), y2)
+
+def get_closest_keypoint_index_reference(point, court_keypoints, keypoint_indices):
+    closest_distance = float("inf")
+    keypoint_index = keypoint_indices[0]
+
+    for index in keypoint_indices:
+        keypoint = court_keypoints[index * 2], court_keypoints[index * 2 + 1]
+        distance = abs(point[1] - keypoint[1])
+
+        if distance < closest_distance:
+            closest_distance = distance
+            keypoint_index = index
+
+    return keypoint_index
+
+def get_bounding_box_height_reference(bounding_box):
+    return bounding_box[3] - bounding_box[1]
+
+def get_closest_court_distances_reference(boxes, court_keypoints):
+    """
+    The loop of the original filter_players_helper: the distance from every box
+    center to its closest court keypoint.
+    """
+    min_distances = []
+
+    for bounding_box in boxes:
+        player_center = get_center_of_box_reference(bounding_box)
+        min_distance = float("inf")
+
+        for i in range(0, len(court_keypoints), 2):
+            distance = distance_between_points_reference((court_keypoints[i], court_keypoints[i + 1]), player_center)
+            min_distance = min(min_distance, distance)
+
+        min_distances.append(min_distance)
+
+    return min_distances
+
+def get_closest_court_distances(boxes, court_keypoints):
+    return distances_between_points(court_keypoints.reshape(-1, 2)[None],
+                                    get_centers_of_boxes(boxes)[:, None]).min(axis=1)
+
+def time_call(function, *args):
+    """
+    Returns the result of function(*args) and how long it took in seconds.
+    """
+    start_time = time.perf_counter()
+    result = function(*args)
+
+    return result, time.perf_counter() - start_time
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the array bounding box utilities")
+    parser.add_argument("--frames", type=int, default=100_000, help="length of the synthetic video")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    player_detections, _ = generate_rally(args.frames, seed=args.seed)
+    boxes_list = [bounding_box for player_dict in player_detections for bounding_box in player_dict.values()]
+    boxes = np.array(boxes_list)
+    court_keypoints = generate_court_keypoints(1280, 720).astype(np.float64)
+    keypoint_indices = [0, 2, 12, 13]
+
+    feet_list = [get_foot_position_reference(bounding_box) for bounding_box in boxes_list]
+    feet = np.array(feet_list)
+
+    cases = [
+        ("get_center_of_box",
+         lambda: [get_center_of_box_reference(bounding_box) for bounding_box in boxes_list],
+         lambda: get_centers_of_boxes(boxes)),
+        ("get_foot_position",
+         lambda: [get_foot_position_reference(bounding_box) for bounding_box in boxes_list],
+         lambda: get_foot_positions(boxes)),
+        ("get_bounding_box_height",
+         lambda: [get_bounding_box_height_reference(bounding_box) for bounding_box in boxes_list],
+         lambda: get_bounding_box_heights(boxes)),
+        ("get_closest_keypoint_index",
+         lambda: [get_closest_keypoint_index_reference(foot, court_keypoints, keypoint_indices) for foot in feet_list],
+         lambda: get_closest_keypoint_indices(feet, court_keypoints, keypoint_indices)),
+        ("closest court distance",
+         lambda: get_closest_court_distances_reference(boxes_list, court_keypoints),
+         lambda: get_closest_court_distances(boxes, court_keypoints))
+    ]
+
+    print(f"{len(boxes)} boxes over {args.frames} frames")
+    print(f"{'function':<28}{'scalar s':>10}{'array s':>10}{'speedup':>10}")
+
+    for name, reference, vectorized in cases:
+        reference_result, reference_time = time_call(reference)
+        result, vectorized_time = time_call(vectorized)
+
+        assert np.array_equal(np.asarray(reference_result), result), f"{name} differs from the reference"
+
+        print(f"{name:<28}{reference_time:>10.3f}{vectorized_time:>10.4f}{reference_time / vectorized_time:>9.0f}x")
+
+    print("all results match the references")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Checks that the Compositor draws the same pixels as the original chain of
+per-overlay passes over the frames, and compares their per-frame cost for
+different numbers of render workers on a synthetic rally.
+
+Run from the repository root:
+    python -m benchmarks.benchmark_compositor --frames 48 --resolution 1080p --workers 1 2 4
+"""
+import argparse
+import tempfile
+import time
+import cv2
+import numpy as np
+from pipeline import annotate_frames
+from utils import draw_player_stats, as_court_keypoints
+from benchmarks.benchmark_suite import SyntheticFixture, RESOLUTIONS
+
+def annotate_frames_reference(frames, start_frame, player_tracker, ball_tracker, court_line_detector, mini_court,
+                              analysis):
+    """
+    The original annotation, walking all frames once per overlay, kept here as
+    the reference for the equivalence check.
+    """
+    end_frame = start_frame + len(frames)
+    court_keypoints = as_court_keypoints(analysis["court_keypoints"]).get_per_frame(range(start_frame, end_frame))
+
+    output_video_frames = court_line_detector.draw_keypoints_on_video(frames, court_keypoints)
+    output_video_frames = player_tracker.draw_bounding_boxes(output_video_frames,
+                                                             analysis["player_detections"][start_frame:end_frame])
+    output_video_frames = ball_tracker.draw_bounding_boxes(output_video_frames,
+                                                           analysis["ball_detections"][start_frame:end_frame])
+    output_video_frames = mini_court.draw_mini_court(output_video_frames)
+    output_video_frames = mini_court.draw_points_on_mini_court(output_video_frames,
+                                                               analysis["player_mini_court_detections"],
+                                                               color=(255, 0, 0), start_frame=start_frame)
+    output_video_frames = mini_court.draw_points_on_mini_court(output_video_frames,
+                                                               analysis["ball_mini_court_detections"],
+                                                               start_frame=start_frame)
+    output_video_frames = draw_player_stats(output_video_frames, analysis["player_stats"].get_columns(start_frame, end_frame))
+
+    for i, frame in enumerate(output_video_frames, start=start_frame):
+        cv2.putText(frame, f"Frame: {i}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+
+    return output_video_frames
+
+def time_per_frame(annotate, fixture):
+    """
+    Returns (annotated frames, milliseconds per frame) of annotating copies of
+    the fixture's frames with fresh models.
+    """
+    player_tracker, ball_tracker, court_line_detector = fixture.load_models()
+    mini_court = fixture.create_mini_court()
+    frames = fixture.copy_frames()
+
+    start_time = time.perf_counter()
+    frames = annotate(frames, 0, player_tracker, ball_tracker, court_line_detector, mini_court, fixture.analysis)
+    elapsed_time = time.perf_counter() - start_time
+
+    return frames, elapsed_time / len(frames) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the single pass Compositor against the per-overlay passes")
+    parser.add_argument("--frames", type=int, default=48, help="length of the synthetic video")
+    parser.add_argument("--resolution", choices=list(RESOLUTIONS), default="1080p")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="numbers of render workers to time")
+    args = parser.parse_args()
+
+    width, height = RESOLUTIONS[args.resolution]
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        fixture = SyntheticFixture(f"{work_dir}/synthetic.avi", args.frames, width, height)
+
+    reference_frames, reference_time = time_per_frame(annotate_frames_reference, fixture)
+    print(f"{'per-overlay passes':<24}{reference_time:>8.2f} ms/frame")
+
+    for num_workers in args.workers:
+        def annotate(*annotate_args):
+            return annotate_frames(*annotate_args, num_workers=num_workers)
+
+        frames, compositor_time = time_per_frame(annotate, fixture)
+
+        assert all(np.array_equal(frame, reference_frame) for frame, reference_frame in zip(frames, reference_frames)), \
+            f"compositor with {num_workers} workers differs from the per-overlay passes"
+
+        print(f"{f'compositor, {num_workers} workers':<24}{compositor_time:>8.2f} ms/frame "
+              f"({reference_time / compositor_time:.2f}x), pixel-identical")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Compares the original CourtLineDetector.predict (PIL transforms, one image at
+a time, model left in training mode) with the optimized backends. Reports the
+latency of a single image, the throughput of predict_batch for different batch
+sizes and how far the keypoints move compared with the original.
+
+Run from the repository root:
+    python -m benchmarks.benchmark_court_line_detector --images 32 --batch-sizes 1 4 8
+
+Without --model the benchmark runs on random weights, which is enough to
+compare the speed but not the keypoints.
+"""
+import os
+
+# Hide any GPU so the benchmark always measures CPU inference
+os.environ["CUDA_VISIBLE_DEVICES"] = ""
+
+import argparse
+import copy
+import tempfile
+import time
+from itertools import islice
+import numpy as np
+import cv2
+import torch
+from torchvision import transforms, models
+from court_line_detector import CourtLineDetector, BACKENDS
+from utils import read_video_frames
+
+def create_reference_predict(detector, train_mode=True):
+    """
+    Returns the original predict, running a copy of the detector's model.
+
+    :param train_mode: leave the model in training mode like the original did,
+                       False isolates the difference the preprocessing makes
+    """
+    model = copy.deepcopy(detector.model).to(memory_format=torch.contiguous_format)
+    model.train(train_mode)
+
+    image_transforms = transforms.Compose([
+        transforms.ToPILImage(),
+        transforms.Resize((224, 224)),
+        transforms.ToTensor(),
+        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+    ])
+
+    def predict(image):
+        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        image_tensor = image_transforms(image_rgb).unsqueeze(0)
+
+        with torch.no_grad():
+            outputs = model(image_tensor)
+
+        keypoints = outputs.squeeze().cpu().numpy()
+        original_h, original_w = image.shape[:2]
+        keypoints[::2] *= original_w
+        keypoints[1::2] *= original_h
+
+        return keypoints
+
+    return predict
+
+def save_random_weights(model_path):
+    """
+    Saves randomly initialized weights of the keypoints CNN to model_path.
+    """
+    model = models.resnet50(pretrained=False)
+    model.fc = torch.nn.Linear(model.fc.in_features, 14*2)
+    torch.save(model.state_dict(), model_path)
+
+def time_latency(predict, images):
+    """
+    Returns the median milliseconds predict takes for a single image.
+    """
+    # Warm up so one-time setup (e.g. TorchScript optimization passes) isn't counted
+    predict(images[0])
+
+    durations = []
+
+    for image in images:
+        start_time = time.perf_counter()
+        predict(image)
+        durations.append(time.perf_counter() - start_time)
+
+    return float(np.median(durations)) * 1000
+
+def time_throughput(detector, images, batch_size):
+    """
+    Returns the images/sec of predict_batch with the given batch size.
+    """
+    detector.batch_size = batch_size
+    detector.predict_batch(images[:batch_size])
+
+    start_time = time.perf_counter()
+    detector.predict_batch(images)
+
+    return len(images) / (time.perf_counter() - start_time)
+
+def get_max_difference(keypoints, reference_keypoints):
+    """
+    Returns the largest distance in pixels between matching keypoints.
+    """
+    differences = np.stack(keypoints).reshape(-1, 14, 2) - np.stack(reference_keypoints).reshape(-1, 14, 2)
+
+    return float(np.sqrt((differences ** 2).sum(axis=2)).max())
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the court keypoints CNN on the CPU")
+    parser.add_argument("--video", default="inputs/input_video.mp4")
+    parser.add_argument("--model", default=None, help="keypoints CNN weights, random weights if not given")
+    parser.add_argument("--images", type=int, default=32, help="number of video frames to run through each backend")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=BACKENDS)
+    parser.add_argument("--num-threads", type=int, default=None, help="number of CPU threads, default keeps PyTorch's")
+    args = parser.parse_args()
+
+    images = list(islice(read_video_frames(args.video), args.images))
+
+    with tempfile.TemporaryDirectory() as model_dir:
+        model_path = args.model
+
+        if model_path is None:
+            model_path = os.path.join(model_dir, "keypoints_model.pth")
+            save_random_weights(model_path)
+
+        reference_detector = CourtLineDetector(model_path, num_threads=args.num_threads)
+        reference_predict = create_reference_predict(reference_detector)
+        reference_keypoints = [reference_predict(image) for image in images]
+        reference_latency = time_latency(reference_predict, images)
+
+        # Same model in eval mode with the original preprocessing
+        eval_predict = create_reference_predict(reference_detector, train_mode=False)
+        eval_keypoints = [eval_predict(image) for image in images]
+
+        print(f"{'backend':<14}{'latency ms':>12}"
+              + "".join(f"{f'batch {batch_size} img/s':>16}" for batch_size in args.batch_sizes)
+              + f"{'max px vs original':>20}{'max px vs eval':>16}")
+        print(f"{'original':<14}{reference_latency:>12.1f}"
+              + "".join(f"{1000 / reference_latency:>16.1f}" if batch_size == 1 else f"{'-':>16}"
+                        for batch_size in args.batch_sizes)
+              + f"{0.0:>20.2f}{get_max_difference(reference_keypoints, eval_keypoints):>16.2f}")
+
+        for backend in args.backends:
+            try:
+                detector = CourtLineDetector(model_path, backend=backend, num_threads=args.num_threads)
+            except ImportError as error:
+                # ONNX Runtime is optional
+                print(f"{backend:<14}skipped, {error}")
+                continue
+
+            keypoints = detector.predict_batch(images)
+            latency = time_latency(detector.predict, images)
+            throughputs = [time_throughput(detector, images, batch_size) for batch_size in args.batch_sizes]
+
+            print(f"{backend:<14}{latency:>12.1f}"
+                  + "".join(f"{throughput:>16.1f}" for throughput in throughputs)
+                  + f"{get_max_difference(keypoints, reference_keypoints):>20.2f}"
+                  + f"{get_max_difference(keypoints, eval_keypoints):>16.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Reports detection throughput (frames/sec) of PlayerTracker and BallTracker
+for different batch sizes on the CPU.
+
+Run from the repository root:
+    python -m benchmarks.benchmark_detection_batch_size --frames 96 --batch-sizes 1 4 8 16
+"""
+import os
+
+# Hide any GPU so the benchmark always measures CPU throughput
+os.environ["CUDA_VISIBLE_DEVICES"] = ""
+
+import argparse
+import time
+from itertools import islice
+from trackers import PlayerTracker, BallTracker
+from utils import read_video_frames
+
+def benchmark_tracker(create_tracker, frames, batch_size):
+    """
+    Returns the frames/sec of detect_frames for the given batch size.
+
+    :param create_tracker: callable returning a fresh tracker object
+    :param frames: list of NumPy arrays representing video frames
+    :param batch_size: number of frames passed through the model at once
+    """
+    # A fresh tracker per run so track state doesn't carry over between batch sizes
+    tracker = create_tracker()
+
+    # Warm up so model setup isn't counted in the timing
+    tracker.detect_frames(frames[:batch_size], batch_size=batch_size)
+
+    start_time = time.perf_counter()
+    tracker.detect_frames(frames, batch_size=batch_size)
+    elapsed_time = time.perf_counter() - start_time
+
+    return len(frames) / elapsed_time
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batched YOLO inference on the CPU")
+    parser.add_argument("--video", default="inputs/input_video.mp4")
+    parser.add_argument("--player-model", default="models/yolo11x.pt")
+    parser.add_argument("--ball-model", default="models/yolo11x_best_tennis_ball_detector.pt")
+    parser.add_argument("--frames", type=int, default=96, help="number of frames to run through each model")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+
+    frames = list(islice(read_video_frames(args.video), args.frames))
+
+    trackers = {
+        "PlayerTracker": lambda: PlayerTracker(args.player_model),
+        "BallTracker": lambda: BallTracker(args.ball_model),
+    }
+
+    print(f"{'tracker':<15}{'batch size':>12}{'frames/sec':>12}")
+
+    for name, create_tracker in trackers.items():
+        for batch_size in args.batch_sizes:
+            frames_per_second = benchmark_tracker(create_tracker, frames, batch_size)
+            print(f"{name:<15}{batch_size:>12}{frames_per_second:>12.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Evaluation of detector variants for a deployment. Runs the player or ball
+tracker with each variant (smaller weights and/or an exported or quantized
+format, see load_yolo_model) on a clip and reports its speed next to how well
+its boxes agree with the reference model's.
+
+The reference model's detections of the clip are kept in a DetectionCache, so
+it only runs on the first evaluation of a clip and later runs compare against
+the cached boxes.
+
+Run from the repository root:
+    python -m benchmarks.benchmark_detector_variants --detector player --frames 120 \
+        --variants models/yolo11x.pt:onnx models/yolo11x.pt:onnx_int8 models/yolo11s.pt
+
+A variant is PATH or PATH:FORMAT, with FORMAT one of pytorch (default), onnx
+and onnx_int8. Boxes agree when their IoU is at least --min-iou.
+"""
+import os
+
+# Hide any GPU so the benchmark always measures CPU throughput
+os.environ["CUDA_VISIBLE_DEVICES"] = ""
+
+import argparse
+import time
+from itertools import islice
+import numpy as np
+from trackers import PlayerTracker, BallTracker, MODEL_FORMATS
+from detection_cache import DetectionCache
+from utils import read_video_frames
+
+TRACKERS = {"player": PlayerTracker, "ball": BallTracker}
+REFERENCE_MODELS = {"player": "models/yolo11x.pt", "ball": "models/yolo11x_best_tennis_ball_detector.pt"}
+
+def parse_variant(variant):
+    """
+    Returns the (model path, model format) of a PATH or PATH:FORMAT variant.
+    """
+    model_path, _, model_format = variant.rpartition(":")
+
+    if not model_path or model_format not in MODEL_FORMATS:
+        return variant, "pytorch"
+
+    return model_path, model_format
+
+def get_pairwise_ious(boxes_1, boxes_2):
+    """
+    Returns the (N, M) intersection over union of every box of an (N, 4) array
+    with every box of an (M, 4) array.
+    """
+    boxes_1 = boxes_1[:, None]
+    boxes_2 = boxes_2[None]
+
+    width = np.minimum(boxes_1[..., 2], boxes_2[..., 2]) - np.maximum(boxes_1[..., 0], boxes_2[..., 0])
+    height = np.minimum(boxes_1[..., 3], boxes_2[..., 3]) - np.maximum(boxes_1[..., 1], boxes_2[..., 1])
+    intersection = np.clip(width, 0, None) * np.clip(height, 0, None)
+
+    area_1 = (boxes_1[..., 2] - boxes_1[..., 0]) * (boxes_1[..., 3] - boxes_1[..., 1])
+    area_2 = (boxes_2[..., 2] - boxes_2[..., 0]) * (boxes_2[..., 3] - boxes_2[..., 1])
+
+    return intersection / np.maximum(area_1 + area_2 - intersection, 1e-9)
+
+def compare(reference_detections, detections, min_iou):
+    """
+    Returns (precision, recall, mean IoU of the matched boxes) of detections
+    against the reference. In every frame the pair of boxes with the highest
+    IoU is matched first, track IDs don't matter.
+    """
+    num_matched = 0
+    matched_ious = []
+
+    for frame_num in range(reference_detections.num_frames):
+        reference_boxes = reference_detections.coords[reference_detections.frame_offsets[frame_num]:
+                                                      reference_detections.frame_offsets[frame_num + 1]]
+        boxes = detections.coords[detections.frame_offsets[frame_num]:detections.frame_offsets[frame_num + 1]]
+
+        if len(reference_boxes) == 0 or len(boxes) == 0:
+            continue
+
+        ious = get_pairwise_ious(reference_boxes, boxes)
+
+        while True:
+            row, column = np.unravel_index(np.argmax(ious), ious.shape)
+
+            if ious[row, column] < min_iou:
+                break
+
+            num_matched += 1
+            matched_ious.append(ious[row, column])
+            ious[row] = -1
+            ious[:, column] = -1
+
+    precision = num_matched / max(len(detections.track_ids), 1)
+    recall = num_matched / max(len(reference_detections.track_ids), 1)
+
+    return precision, recall, float(np.mean(matched_ious)) if matched_ious else float("nan")
+
+def run_tracker(tracker, frames, batch_size):
+    """
+    Returns the (Detections, seconds) of detecting frames, after a warm-up
+    frame so one-time setup of the model isn't timed.
+    """
+    tracker.detect_frames(frames[:1])
+    tracker.reset_tracks()
+
+    start_time = time.perf_counter()
+    detections = tracker.detect_frames(frames, batch_size=batch_size)
+
+    return detections, time.perf_counter() - start_time
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the speed and agreement of detector variants")
+    parser.add_argument("--video", default="inputs/input_video.mp4")
+    parser.add_argument("--detector", choices=list(TRACKERS), default="player")
+    parser.add_argument("--reference", default=None, help="reference weights, by default the ones main.py uses")
+    parser.add_argument("--variants", nargs="+", default=None,
+                        help="PATH or PATH:FORMAT of each variant, by default the reference in every format")
+    parser.add_argument("--frames", type=int, default=120, help="number of frames of the clip")
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--min-iou", type=float, default=0.5, help="IoU at which two boxes agree")
+    parser.add_argument("--cache-dir", default="benchmarks/results/detector_cache",
+                        help="DetectionCache the reference detections are kept in")
+    args = parser.parse_args()
+
+    tracker_class = TRACKERS[args.detector]
+    reference_path = args.reference or REFERENCE_MODELS[args.detector]
+    variants = args.variants or [f"{reference_path}:{model_format}" for model_format in MODEL_FORMATS]
+
+    frames = list(islice(read_video_frames(args.video), args.frames))
+
+    reference_tracker = tracker_class(reference_path, cache=DetectionCache(args.cache_dir))
+    reference_detections = reference_tracker.detect_frames(frames, batch_size=args.batch_size)
+
+    print(f"{len(frames)} frames, {len(reference_detections.track_ids)} reference {args.detector} boxes "
+          f"of {reference_path}")
+    print(f"{'variant':<44}{'frames/sec':>12}{'speedup':>10}{'precision':>11}{'recall':>8}{'mean IoU':>10}")
+
+    first_seconds = None
+
+    for variant in variants:
+        model_path, model_format = parse_variant(variant)
+        tracker = tracker_class(model_path, model_format=model_format)
+        detections, seconds = run_tracker(tracker, frames, args.batch_size)
+        precision, recall, mean_iou = compare(reference_detections, detections, args.min_iou)
+
+        # Speedups are relative to the first variant
+        first_seconds = first_seconds or seconds
+
+        print(f"{f'{model_path} ({model_format})':<44}{len(frames) / seconds:>12.2f}{first_seconds / seconds:>10.2f}"
+              f"{precision:>11.3f}{recall:>8.3f}{mean_iou:>10.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Compares detecting players, the ball and the court keypoints on the source
+frames of a synthetic video with detecting them on one shared downscaled copy
+per frame (see FrameScaler), and reports how far the remapped boxes and
+keypoints end up from the ones found on the source frames.
+
+Run from the repository root:
+    python -m benchmarks.benchmark_frame_scaling --frames 24 --resolution 4K --sizes 1920 1280 640
+"""
+import argparse
+import tempfile
+import time
+import numpy as np
+from trackers import CourtTracker
+from utils import FrameScaler, get_centers_of_boxes
+from benchmarks.benchmark_suite import SyntheticFixture, RESOLUTIONS
+
+def detect(fixture, detection_size):
+    """
+    Returns ((player Detections, ball Detections, CourtKeypoints), seconds) of
+    running every detector on the fixture's frames downscaled to detection_size.
+    """
+    player_tracker, ball_tracker, court_line_detector = fixture.load_models()
+
+    start_time = time.perf_counter()
+
+    frame_scaler = FrameScaler(detection_size)
+    frames = list(frame_scaler.downscale_frames(fixture.frames))
+
+    player_detections = player_tracker.detect_frames(frames, batch_size=fixture.batch_size, frame_scaler=frame_scaler)
+    ball_detections = ball_tracker.detect_frames(frames, batch_size=fixture.batch_size, frame_scaler=frame_scaler)
+    court_keypoints = CourtTracker(court_line_detector, frame_scaler=frame_scaler).track(frames)
+
+    return (player_detections, ball_detections, court_keypoints), time.perf_counter() - start_time
+
+def get_center_error(detections, reference_detections):
+    """
+    Returns the mean and largest distance in source pixels between the box centers
+    of detections and the reference, matched by frame and track ID.
+    """
+    errors = []
+
+    for frame_dict, reference_dict in zip(detections, reference_detections):
+        for track_id, reference_box in reference_dict.items():
+            if track_id in frame_dict:
+                centers = get_centers_of_boxes(np.array([frame_dict[track_id], reference_box]))
+                errors.append(np.linalg.norm(centers[0] - centers[1]))
+
+    return (float(np.mean(errors)), float(np.max(errors))) if errors else (float("nan"), float("nan"))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark detecting on shared downscaled frames")
+    parser.add_argument("--frames", type=int, default=24, help="length of the synthetic video")
+    parser.add_argument("--resolution", choices=list(RESOLUTIONS), default="4K")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1920, 1280, 640],
+                        help="longest sides of the downscaled frames to time")
+    args = parser.parse_args()
+
+    width, height = RESOLUTIONS[args.resolution]
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        fixture = SyntheticFixture(f"{work_dir}/synthetic.avi", args.frames, width, height)
+
+    (reference_players, reference_ball, reference_court), reference_time = detect(fixture, None)
+    reference_keypoints = reference_court.get_per_frame(np.arange(args.frames))
+
+    print(f"{'detection size':<16}{'ms/frame':>10}{'speedup':>9}{'player px':>11}{'max':>8}"
+          f"{'ball px':>9}{'max':>8}{'keypoint px':>13}")
+    print(f"{f'{width}x{height}':<16}{reference_time / args.frames * 1000:>10.2f}{1.0:>9.2f}"
+          f"{0.0:>11.2f}{0.0:>8.2f}{0.0:>9.2f}{0.0:>8.2f}{0.0:>13.2f}")
+
+    for detection_size in args.sizes:
+        (player_detections, ball_detections, court_keypoints), seconds = detect(fixture, detection_size)
+
+        player_error, player_max_error = get_center_error(player_detections, reference_players)
+        ball_error, ball_max_error = get_center_error(ball_detections, reference_ball)
+        keypoint_error = np.abs(court_keypoints.get_per_frame(np.arange(args.frames)) - reference_keypoints).max()
+
+        print(f"{detection_size:<16}{seconds / args.frames * 1000:>10.2f}{reference_time / seconds:>9.2f}"
+              f"{player_error:>11.2f}{player_max_error:>8.2f}{ball_error:>9.2f}{ball_max_error:>8.2f}"
+              f"{keypoint_error:>13.2f}")
+
+if __name__ == "__main__":
+    main()
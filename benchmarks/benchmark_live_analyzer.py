@@ -0,0 +1,86 @@
+"""
+Checks that LiveAnalyzer gives the same annotated frames and player stats
+whatever track IDs the tracker assigns to the players, under both mini court
+projections, and compares its per-frame cost.
+
+MiniCourt and PlayerStats only know the players 1 and 2, so the live analysis
+has to renumber the players it picks like PlayerTrackFilter.pick_players does.
+The synthetic rally numbers the players 1 and 2, the run with shifted IDs
+gives them tracker IDs like a long-running tracker would (e.g. 3 and 5).
+
+Run from the repository root:
+    python -m benchmarks.benchmark_live_analyzer --frames 480
+"""
+import argparse
+import time
+import numpy as np
+from mini_court import MiniCourt
+from live import LiveAnalyzer
+from benchmarks.synthetic import generate_rally, generate_court_keypoints, draw_synthetic_frame
+from benchmarks.stubs import load_stub_models
+
+# Tracker IDs given to the people of the synthetic rally in the shifted run,
+# in PERSON_COLORS order (the two players first, then umpire and line judge).
+# The players keep their order, the one with the smaller ID is player 1
+SHIFTED_IDS = [3, 5, 8, 2]
+
+def run_live_analyzer(base_frame, court_keypoints, player_detections, ball_detections, projection):
+    """
+    Runs LiveAnalyzer over the detections and returns (annotated frames, ball
+    hit frames, player stats dataframe, milliseconds per frame).
+    """
+    player_tracker, ball_tracker, court_line_detector = load_stub_models(
+        court_keypoints, (base_frame.shape[1], base_frame.shape[0]))
+    analyzer = LiveAnalyzer(player_tracker, ball_tracker, court_line_detector, MiniCourt(base_frame),
+                            projection=projection)
+
+    annotated_frames = []
+    start_time = time.perf_counter()
+
+    for frame_num, (player_dict, ball_dict) in enumerate(zip(player_detections, ball_detections)):
+        completed_frames = analyzer.add(frame_num, base_frame.copy(), player_dict, ball_dict, court_keypoints)
+        annotated_frames.extend(frame for _, frame, _ in completed_frames)
+
+    annotated_frames.extend(frame for _, frame, _ in analyzer.flush())
+    frame_time = (time.perf_counter() - start_time) / len(player_detections) * 1000
+
+    return (annotated_frames, analyzer.ball_hit_frames,
+            analyzer.player_stats.to_dataframe(len(player_detections)), frame_time)
+
+def main():
+    parser = argparse.ArgumentParser(description="Check LiveAnalyzer with arbitrary track IDs")
+    parser.add_argument("--frames", type=int, default=480, help="number of frames of the synthetic rally")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    court_keypoints = generate_court_keypoints(args.width, args.height)
+    player_detections, ball_detections = generate_rally(args.frames, args.width, args.height, seed=args.seed)
+
+    # The court without anyone on it, the annotations are drawn over it
+    base_frame = draw_synthetic_frame(args.width, args.height, court_keypoints, {}, {})
+
+    shifted_player_detections = [{SHIFTED_IDS[track_id - 1]: bounding_box for track_id, bounding_box in player_dict.items()}
+                                 for player_dict in player_detections]
+
+    for projection in ["height", "homography"]:
+        frames, hit_frames, stats, frame_time = run_live_analyzer(
+            base_frame, court_keypoints, player_detections, ball_detections, projection)
+        shifted_frames, shifted_hit_frames, shifted_stats, shifted_frame_time = run_live_analyzer(
+            base_frame, court_keypoints, shifted_player_detections, ball_detections, projection)
+
+        # The shots of the rally should make it into the stats, not only the hit frames
+        assert len(hit_frames) > 1, f"{projection}: no ball hits detected"
+        assert stats.iloc[-1].abs().sum() > 0, f"{projection}: no shots recorded in the player stats"
+
+        assert shifted_hit_frames == hit_frames, f"{projection}: ball hits differ with shifted track IDs"
+        assert shifted_stats.equals(stats), f"{projection}: player stats differ with shifted track IDs"
+        assert len(shifted_frames) == len(frames) and all(np.array_equal(a, b) for a, b in zip(shifted_frames, frames)), \
+            f"{projection}: annotated frames differ with shifted track IDs"
+
+        print(f"{projection}: {len(hit_frames)} ball hits, same frames and stats with track IDs "
+              f"{SHIFTED_IDS[:2]} as with [1, 2], {frame_time:.2f} / {shifted_frame_time:.2f} ms/frame")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Compares the multi-frame player filter (PlayerTrackFilter) with the original
+filter picking the two tracks closest to the court in the first frame, on a
+synthetic rally whose tracks the "tracker" keeps losing: every person gets a
+new track ID every so often, with a few frames missing around the switch.
+
+For each filter it reports how many of the players' detections are kept, how
+many kept detections aren't a player's, whether each output ID stays one
+person, and how long filtering takes.
+
+Run from the repository root:
+    python -m benchmarks.benchmark_player_filter --frames 200000 --mean-track-length 300
+"""
+import argparse
+import time
+import numpy as np
+from trackers import PlayerTrackFilter
+from utils import Detections, get_centers_of_boxes, distances_between_points
+from benchmarks.synthetic import generate_rally, generate_court_keypoints
+
+def fragment_tracks(player_detections, mean_track_length, max_missing=6, seed=0):
+    """
+    Returns (Detections, person of each row) where every person's track is cut
+    into tracks with new IDs, about mean_track_length frames long. Up to
+    max_missing frames around each cut lose the person's detection. New IDs are
+    handed out in order of first appearance, like a tracker does.
+
+    :param player_detections: list of dictionaries of person IDs to bounding boxes
+    """
+    rng = np.random.default_rng(seed)
+    detections = Detections.from_dicts(player_detections)
+    frame_indices = detections.frame_indices
+    persons = detections.track_ids
+    num_frames = detections.num_frames
+
+    segment_of_row = np.zeros(len(persons), dtype=np.int64)
+    keep = np.ones(len(persons), dtype=bool)
+
+    for person in np.unique(persons):
+        rows = np.flatnonzero(persons == person)
+        cuts = np.sort(rng.choice(np.arange(1, num_frames), size=max(num_frames // mean_track_length, 0), replace=False))
+
+        # Segment number of each row of the person, and the frames lost around each cut
+        segment_of_row[rows] = np.searchsorted(cuts, frame_indices[rows], side="right")
+        missing = rng.integers(0, max_missing + 1, size=len(cuts))
+        distance_after_cut = frame_indices[rows] - np.concatenate(([0], cuts))[segment_of_row[rows]]
+        keep[rows] &= ~((segment_of_row[rows] > 0) & (distance_after_cut < missing[segment_of_row[rows] - 1]))
+
+    # IDs by order of the first frame of every (person, segment)
+    keys = persons * (num_frames + 1) + segment_of_row
+    unique_keys, first_rows, key_indices = np.unique(keys[keep], return_index=True, return_inverse=True)
+    new_ids = np.empty(len(unique_keys), dtype=np.int64)
+    new_ids[np.argsort(first_rows, kind="stable")] = np.arange(1, len(unique_keys) + 1)
+
+    fragmented = Detections.from_arrays(frame_indices[keep], new_ids[key_indices], detections.coords[keep], num_frames)
+
+    return fragmented, persons[keep]
+
+def filter_players_reference(court_keypoints, player_detections):
+    """
+    The original filter_players: the two tracks closest to a court keypoint in the
+    first frame, kept for the whole video.
+    """
+    first_frame = player_detections[0]
+    ids = list(first_frame.keys())
+    centers = get_centers_of_boxes(np.array(list(first_frame.values())))
+    min_distances = distances_between_points(court_keypoints.reshape(-1, 2)[None], centers[:, None]).min(axis=1)
+    order = np.argsort(min_distances, kind="stable")
+
+    return player_detections.filter_track_ids([ids[order[0]], ids[order[1]]])
+
+def evaluate(filtered, detections, persons):
+    """
+    Returns (recall, impurity, consistent): the fraction of the players' rows
+    kept, the fraction of kept rows that aren't a player's and whether every
+    output ID is a single person.
+    """
+    # Rows are matched on (frame, box), the filters keep the coordinates untouched
+    row_keys = {(int(frame_num), tuple(box)): int(person)
+                for frame_num, box, person in zip(detections.frame_indices, detections.coords.tolist(), persons)}
+    kept_persons = np.array([row_keys[(int(frame_num), tuple(box))]
+                             for frame_num, box in zip(filtered.frame_indices, filtered.coords.tolist())])
+
+    is_player = np.isin(kept_persons, [1, 2])
+    recall = is_player.sum() / np.isin(persons, [1, 2]).sum()
+    impurity = 1 - is_player.mean() if len(kept_persons) else 0.0
+    consistent = all(len(np.unique(kept_persons[filtered.track_ids == track_id])) == 1
+                     for track_id in np.unique(filtered.track_ids))
+
+    return recall, impurity, consistent
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark multi-frame player filtering on fragmented tracks")
+    parser.add_argument("--frames", type=int, default=20_000, help="length of the synthetic video")
+    parser.add_argument("--mean-track-length", type=int, default=300, help="average frames before a track is lost")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    player_detections, _ = generate_rally(args.frames, seed=args.seed)
+    detections, persons = fragment_tracks(player_detections, args.mean_track_length, seed=args.seed)
+    court_keypoints = generate_court_keypoints(1280, 720).astype(np.float64)
+
+    print(f"{len(detections.track_ids)} detections of {len(np.unique(detections.track_ids))} tracks "
+          f"over {args.frames} frames")
+    print(f"{'filter':<14}{'recall':>8}{'impurity':>10}{'IDs consistent':>16}{'time s':>9}")
+
+    for name, filter_players in [("first frame", filter_players_reference),
+                                 ("multi-frame", PlayerTrackFilter().filter)]:
+        start_time = time.perf_counter()
+        filtered = filter_players(court_keypoints, detections)
+        elapsed_time = time.perf_counter() - start_time
+
+        recall, impurity, consistent = evaluate(filtered, detections, persons)
+        print(f"{name:<14}{recall:>8.3f}{impurity:>10.3f}{str(consistent):>16}{elapsed_time:>9.3f}")
+
+if __name__ == "__main__":
+    main()
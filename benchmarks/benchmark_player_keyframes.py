@@ -0,0 +1,178 @@
+"""
+Quality report for keyframe player detection. Runs PlayerTracker on every
+frame and then in keyframe mode with different maximum intervals and gap
+fills, and reports for each how much faster it is, how many frames went
+through the model and how far the players' positions and speeds are from
+detecting every frame. Use it on a clip of a job's video to pick the
+throughput/accuracy trade-off for that job.
+
+Run from the repository root:
+    python -m benchmarks.benchmark_player_keyframes --frames 240 --intervals 2 4 8
+
+Players are the two picked by filter_players when --court-model is given,
+otherwise every track that is in at least half of the frames.
+"""
+import os
+
+# Hide any GPU so the benchmark always measures CPU throughput
+os.environ["CUDA_VISIBLE_DEVICES"] = ""
+
+import argparse
+import time
+from itertools import islice
+import cv2
+import numpy as np
+from trackers import PlayerTracker, GAP_FILL_MODES
+from court_line_detector import CourtLineDetector
+from utils import read_video_frames
+
+def run_tracker(tracker, frames, batch_size):
+    """
+    Returns the (Detections, seconds) of detecting players in frames.
+    """
+    start_time = time.perf_counter()
+    player_detections = tracker.detect_frames(frames, batch_size=batch_size)
+
+    return player_detections, time.perf_counter() - start_time
+
+def get_track_boxes(player_detections, track_id):
+    """
+    Returns a (num_frames, 4) array of a track's boxes, NaN where it wasn't detected.
+    """
+    boxes = np.full((len(player_detections), 4), np.nan)
+
+    for frame_num, player_dict in enumerate(player_detections):
+        if track_id in player_dict:
+            boxes[frame_num] = player_dict[track_id]
+
+    return boxes
+
+def get_iou(boxes_1, boxes_2):
+    """
+    Returns the intersection over union of matching rows of two (N, 4) box arrays.
+    """
+    width = np.minimum(boxes_1[:, 2], boxes_2[:, 2]) - np.maximum(boxes_1[:, 0], boxes_2[:, 0])
+    height = np.minimum(boxes_1[:, 3], boxes_2[:, 3]) - np.maximum(boxes_1[:, 1], boxes_2[:, 1])
+    intersection = np.clip(width, 0, None) * np.clip(height, 0, None)
+
+    area_1 = (boxes_1[:, 2] - boxes_1[:, 0]) * (boxes_1[:, 3] - boxes_1[:, 1])
+    area_2 = (boxes_2[:, 2] - boxes_2[:, 0]) * (boxes_2[:, 3] - boxes_2[:, 1])
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.nan_to_num(intersection / (area_1 + area_2 - intersection))
+
+def match_track(reference_boxes, player_detections):
+    """
+    Returns the boxes of the track in player_detections that overlaps the reference
+    track in the most frames, which is its ID if the IDs were kept consistent.
+    """
+    track_ids = np.unique(player_detections.track_ids)
+    best_boxes = np.full_like(reference_boxes, np.nan)
+    best_matches = 0
+
+    for track_id in track_ids:
+        boxes = get_track_boxes(player_detections, track_id)
+        matches = int((get_iou(reference_boxes, boxes) > 0.5).sum())
+
+        if matches > best_matches:
+            best_boxes, best_matches = boxes, matches
+
+    return best_boxes
+
+def get_centers(boxes):
+    return np.stack(((boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2), axis=1)
+
+def get_speeds(boxes, fps, window=5):
+    """
+    Returns the speed of a box center in pixels per second over the last window frames.
+    """
+    centers = get_centers(boxes)
+    speeds = np.full(len(boxes), np.nan)
+    speeds[window:] = np.linalg.norm(centers[window:] - centers[:-window], axis=1) * fps / window
+
+    return speeds
+
+def compare(reference_tracks, player_detections, fps):
+    """
+    Returns (mean center error, 95th percentile center error, mean speed error,
+    fraction of frames where the matched track overlaps the reference) over all
+    reference tracks. Frames where the matched track is missing count as an
+    infinite center error.
+    """
+    center_errors = []
+    speed_errors = []
+    num_consistent = 0
+    num_reference = 0
+
+    for reference_boxes in reference_tracks:
+        boxes = match_track(reference_boxes, player_detections)
+        detected = ~np.isnan(reference_boxes[:, 0])
+
+        errors = np.linalg.norm(get_centers(boxes) - get_centers(reference_boxes), axis=1)[detected]
+        center_errors.append(np.where(np.isnan(errors), np.inf, errors))
+
+        speed_difference = np.abs(get_speeds(boxes, fps) - get_speeds(reference_boxes, fps))
+        speed_errors.append(speed_difference[~np.isnan(speed_difference)])
+
+        num_consistent += int((get_iou(reference_boxes, boxes)[detected] > 0.5).sum())
+        num_reference += int(detected.sum())
+
+    center_errors = np.concatenate(center_errors)
+    speed_errors = np.concatenate(speed_errors)
+    finite_errors = center_errors[np.isfinite(center_errors)]
+
+    return (float(finite_errors.mean()) if len(finite_errors) else float("nan"),
+            float(np.percentile(center_errors, 95)),
+            float(speed_errors.mean()) if len(speed_errors) else float("nan"),
+            num_consistent / max(num_reference, 1))
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare keyframe player detection with detecting every frame")
+    parser.add_argument("--video", default="inputs/input_video.mp4")
+    parser.add_argument("--player-model", default="models/yolo11x.pt")
+    parser.add_argument("--court-model", default=None, help="keypoints CNN weights, used to pick the two players")
+    parser.add_argument("--frames", type=int, default=240, help="number of frames to run through each mode")
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--intervals", type=int, nargs="+", default=[2, 4, 8], help="maximum keyframe intervals")
+    parser.add_argument("--motion", type=float, default=0.15, help="keyframe motion in player heights")
+    parser.add_argument("--gap-fills", nargs="+", choices=GAP_FILL_MODES, default=GAP_FILL_MODES)
+    args = parser.parse_args()
+
+    frames = list(islice(read_video_frames(args.video), args.frames))
+
+    capture = cv2.VideoCapture(args.video)
+    fps = capture.get(cv2.CAP_PROP_FPS) or 24
+    capture.release()
+
+    reference_tracker = PlayerTracker(args.player_model)
+    reference_detections, reference_seconds = run_tracker(reference_tracker, frames, args.batch_size)
+
+    if args.court_model is not None:
+        court_keypoints = CourtLineDetector(args.court_model).predict(frames[0])
+        track_ids = np.unique(reference_tracker.filter_players(court_keypoints, reference_detections).track_ids)
+    else:
+        track_ids, counts = np.unique(reference_detections.track_ids, return_counts=True)
+        track_ids = track_ids[counts >= len(frames) / 2]
+
+    reference_tracks = [get_track_boxes(reference_detections, track_id) for track_id in track_ids]
+
+    print(f"{len(frames)} frames, {len(reference_tracks)} players compared")
+    print(f"{'mode':<18}{'frames/sec':>12}{'speedup':>10}{'model %':>10}"
+          f"{'mean px':>10}{'p95 px':>10}{'speed px/s':>12}{'same ID %':>11}")
+    print(f"{'every frame':<18}{len(frames) / reference_seconds:>12.2f}{1.0:>10.2f}{100.0:>10.1f}"
+          f"{0.0:>10.2f}{0.0:>10.2f}{0.0:>12.2f}{100.0:>11.1f}")
+
+    for gap_fill in args.gap_fills:
+        for interval in args.intervals:
+            tracker = PlayerTracker(args.player_model, keyframe_interval=interval, keyframe_motion=args.motion,
+                                    gap_fill=gap_fill)
+            player_detections, seconds = run_tracker(tracker, frames, args.batch_size)
+            mean_error, p95_error, speed_error, consistency = compare(reference_tracks, player_detections, fps)
+            model_share = tracker.keyframe_filler.num_keyframes / len(frames) if interval > 1 else 1.0
+
+            print(f"{f'{gap_fill} {interval}':<18}{len(frames) / seconds:>12.2f}{reference_seconds / seconds:>10.2f}"
+                  f"{model_share * 100:>10.1f}{mean_error:>10.2f}{p95_error:>10.2f}{speed_error:>12.2f}"
+                  f"{consistency * 100:>11.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Checks that the ROI-based draw_player_stats draws the same frames as the
+original full-frame implementation and compares their per-frame cost at
+1080p and 4K.
+
+Run from the repository root:
+    python -m benchmarks.benchmark_player_stats --frames 240
+"""
+import argparse
+import time
+import numpy as np
+import cv2
+from utils.draw_player_stats import PlayerStatsPanel
+from benchmarks.synthetic import generate_player_stats
+
+RESOLUTIONS = {"1080p": (1080, 1920), "4K": (2160, 3840)}
+
+def draw_player_stats_reference(output_video_frames, player_stats):
+    """
+    The original draw_player_stats, which copies and blends the whole frame and
+    draws every text on every frame, kept here as the reference.
+    """
+    for index, row in player_stats.iterrows():
+        frame = output_video_frames[index]
+        shapes = np.zeros_like(frame, dtype=np.uint8)
+
+        width = 350
+        height = 230
+
+        start_x = frame.shape[1]-400
+        start_y = frame.shape[0]-500
+        end_x = start_x+width
+        end_y = start_y+height
+
+        overlay = frame.copy()
+        cv2.rectangle(overlay, (start_x, start_y), (end_x, end_y), (0, 0, 0), -1)
+        alpha = 0.5
+        cv2.addWeighted(overlay, alpha, frame, 1 - alpha, 0, frame)
+
+        texts = [("     Player 1     Player 2", (80, 30), 0.6, 2),
+                 ("Shot Speed", (10, 80), 0.45, 1),
+                 (f"{row['player_1_last_shot_speed']:.1f} km/h    {row['player_2_last_shot_speed']:.1f} km/h", (130, 80), 0.5, 2),
+                 ("Player Speed", (10, 120), 0.45, 1),
+                 (f"{row['player_1_last_player_speed']:.1f} km/h    {row['player_2_last_player_speed']:.1f} km/h", (130, 120), 0.5, 2),
+                 ("avg. S. Speed", (10, 160), 0.45, 1),
+                 (f"{row['player_1_average_shot_speed']:.1f} km/h    {row['player_2_average_shot_speed']:.1f} km/h", (130, 160), 0.5, 2),
+                 ("avg. P. Speed", (10, 200), 0.45, 1),
+                 (f"{row['player_1_average_player_speed']:.1f} km/h    {row['player_2_average_player_speed']:.1f} km/h", (130, 200), 0.5, 2)]
+
+        for text, (x, y), font_scale, thickness in texts:
+            cv2.putText(frame, text, (start_x+x, start_y+y), cv2.FONT_HERSHEY_SIMPLEX, font_scale, (255, 255, 255), thickness)
+
+    return output_video_frames
+
+def time_per_frame(function, frames, player_stats):
+    """
+    Returns how long function took per frame in milliseconds. Draws onto frames in place.
+    """
+    start_time = time.perf_counter()
+    function(frames, player_stats)
+
+    return (time.perf_counter() - start_time) / len(frames) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark draw_player_stats")
+    parser.add_argument("--frames", type=int, default=240, help="number of frames drawn per resolution")
+    parser.add_argument("--check-frames", type=int, default=8, help="number of frames compared with the reference")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    player_stats = generate_player_stats(args.frames, seed=args.seed)
+
+    for name, (height, width) in RESOLUTIONS.items():
+        # A few distinct frames are enough, the cost doesn't depend on the content.
+        # Frames are drawn over again and again, which keeps memory use low at 4K
+        base_frames = [rng.integers(0, 256, size=(height, width, 3), dtype=np.uint8) for _ in range(4)]
+
+        # Both implementations should draw the same frames
+        check_frames = [base_frames[i % len(base_frames)].copy() for i in range(args.check_frames)]
+        panel_frames = PlayerStatsPanel().draw([frame.copy() for frame in check_frames], player_stats)
+        reference_frames = draw_player_stats_reference(check_frames, player_stats.iloc[:args.check_frames])
+
+        # Anti-aliased text edges are blended from the sprite instead of being drawn
+        # onto the frame, which can round differently by one intensity level
+        differences = [np.abs(a.astype(np.int16) - b) for a, b in zip(panel_frames, reference_frames)]
+        assert max(difference.max() for difference in differences) <= 1, "panel frames differ from the reference"
+        differing_pixels = sum(int(difference.any(axis=2).sum()) for difference in differences)
+
+        frames = [base_frames[i % len(base_frames)] for i in range(args.frames)]
+        panel_time = time_per_frame(PlayerStatsPanel().draw, frames, player_stats)
+        reference_time = time_per_frame(draw_player_stats_reference, frames, player_stats)
+
+        print(f"{name}: panel {panel_time:.3f} ms/frame, reference {reference_time:.3f} ms/frame "
+              f"({reference_time / panel_time:.1f}x slower), "
+              f"{differing_pixels / len(check_frames):.1f} text edge pixels per frame off by one")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Checks that calculate_player_stats copes with ball hits where the players or
+the ball aren't on the mini court, and compares its cost with the complete
+detections.
+
+The "height" projection only places the ball in frames with a player, so a
+hit while both players are occluded has no ball position either. The players
+are removed from the frames of every third hit of a synthetic rally, the
+shots starting or ending at those hits have to be left out of the stats and
+all other shots counted, the occluded hits still split the shots around them.
+
+Run from the repository root:
+    python -m benchmarks.benchmark_player_stats_gaps --frames 960
+"""
+import argparse
+import time
+from mini_court import MiniCourt
+from pipeline import analyze_detections, calculate_player_stats
+from player_stats.player_stats import PLAYER_TOTALS
+from utils import Detections
+from benchmarks.synthetic import generate_rally, generate_court_keypoints, draw_synthetic_frame
+from benchmarks.stubs import load_stub_models
+
+def analyze(court_keypoints, frame, player_dicts, ball_dicts, projection):
+    """
+    Returns (analysis, MiniCourt) of the synthetic detections.
+    """
+    player_tracker, ball_tracker, _ = load_stub_models(court_keypoints, (frame.shape[1], frame.shape[0]))
+    mini_court = MiniCourt(frame)
+    analysis = analyze_detections(player_tracker, ball_tracker, mini_court,
+                                  Detections.from_dicts(player_dicts), Detections.from_dicts(ball_dicts),
+                                  court_keypoints, projection=projection)
+
+    return analysis, mini_court
+
+def get_number_of_shots(player_stats):
+    """
+    Returns the number of shots counted for both players together.
+    """
+    return int(player_stats.snapshots[-1][:, PLAYER_TOTALS.index("number_of_shots")].sum())
+
+def time_calculate_player_stats(analysis, mini_court, repeats=20):
+    """
+    Returns how long calculate_player_stats took per call in milliseconds.
+    """
+    start_time = time.perf_counter()
+
+    for _ in range(repeats):
+        calculate_player_stats(analysis["ball_hit_frames"],
+                               analysis["player_mini_court_detections"],
+                               analysis["ball_mini_court_detections"],
+                               mini_court)
+
+    return (time.perf_counter() - start_time) / repeats * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Check calculate_player_stats with missing positions at hits")
+    parser.add_argument("--frames", type=int, default=960, help="number of frames of the synthetic rally")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    court_keypoints = generate_court_keypoints(args.width, args.height)
+    player_dicts, ball_dicts = generate_rally(args.frames, args.width, args.height, seed=args.seed, miss_rate=0)
+    frame = draw_synthetic_frame(args.width, args.height, court_keypoints, {}, {})
+
+    for projection in ["height", "homography"]:
+        analysis, mini_court = analyze(court_keypoints, frame, player_dicts, ball_dicts, projection)
+        hit_frames = analysis["ball_hit_frames"]
+        assert len(hit_frames) >= 4, f"{projection}: too few ball hits to check"
+
+        # Both players occluded at every third hit, the hits themselves stay the same
+        # since the ball is still detected
+        occluded_frames = set(hit_frames[2::3])
+        occluded_player_dicts = [{} if frame_num in occluded_frames else player_dict
+                                 for frame_num, player_dict in enumerate(player_dicts)]
+        occluded_analysis, _ = analyze(court_keypoints, frame, occluded_player_dicts, ball_dicts, projection)
+        assert occluded_analysis["ball_hit_frames"] == hit_frames, f"{projection}: occlusion changed the ball hits"
+
+        missing_ball_hits = sum(1 not in occluded_analysis["ball_mini_court_detections"][frame_num]
+                                for frame_num in hit_frames)
+
+        # A shot is counted unless it starts or ends at an occluded hit
+        expected_number_of_shots = sum(start not in occluded_frames and end not in occluded_frames
+                                       for start, end in zip(hit_frames, hit_frames[1:]))
+        number_of_shots = get_number_of_shots(analysis["player_stats"])
+        occluded_number_of_shots = get_number_of_shots(occluded_analysis["player_stats"])
+
+        assert number_of_shots == len(hit_frames) - 1, f"{projection}: shots missing with complete detections"
+        assert occluded_number_of_shots == expected_number_of_shots, \
+            f"{projection}: {occluded_number_of_shots} shots counted with occlusions, expected {expected_number_of_shots}"
+
+        complete_time = time_calculate_player_stats(analysis, mini_court)
+        occluded_time = time_calculate_player_stats(occluded_analysis, mini_court)
+
+        print(f"{projection}: {len(hit_frames)} ball hits, {len(occluded_frames)} occluded "
+              f"({missing_ball_hits} without a ball position), {number_of_shots} shots counted "
+              f"with complete detections and {occluded_number_of_shots} with occlusions, "
+              f"{complete_time:.3f} / {occluded_time:.3f} ms per call")
+
+if __name__ == "__main__":
+    main()
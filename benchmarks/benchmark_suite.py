@@ -0,0 +1,389 @@
+"""
+End-to-end benchmark suite on a synthetic rally, so regressions can be
+measured on any machine without model weights or input videos, offline and on
+the CPU. A synthetic court video of the chosen length and resolution is
+written to a temporary directory, then every post-processing and drawing
+stage is timed in isolation on its synthetic detections, along with video
+I/O and the whole pipeline with stub detectors (see benchmarks.stubs).
+
+Every run is saved as a JSON file in the results directory, with the
+configuration, the machine and the git commit. --compare prints the change
+of every stage against an earlier run.
+
+Run from the repository root:
+    python -m benchmarks.benchmark_suite --frames 240 --resolution 720p
+    python -m benchmarks.benchmark_suite --stages get_ball_hit_frames draw_mini_court --compare latest
+"""
+import os
+
+# Hide any GPU so the suite always measures the CPU
+os.environ["CUDA_VISIBLE_DEVICES"] = ""
+
+import argparse
+import glob
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from itertools import chain
+import cv2
+import numpy as np
+from utils import (Detections,
+                   read_video,
+                   read_video_frames,
+                   read_video_chunks,
+                   save_video,
+                   draw_player_stats)
+from mini_court import MiniCourt
+from trackers import CourtTracker
+from pipeline import analyze_detections, calculate_player_stats, annotate_frames
+from benchmarks.synthetic import write_synthetic_video
+from benchmarks.stubs import load_stub_models
+
+RESOLUTIONS = {"720p": (1280, 720), "1080p": (1920, 1080), "4K": (3840, 2160)}
+
+class SyntheticFixture:
+    """
+    A synthetic video with its frames, ground truth detections and the analysis
+    of them, shared by all benchmarks of a run.
+    """
+    def __init__(self, video_path, num_frames, width, height, fps=24, seed=0, batch_size=8, chunk_size=32):
+        self.video_path = video_path
+        self.num_frames = num_frames
+        self.frame_size = (width, height)
+        self.fps = fps
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+
+        self.court_keypoints, player_dicts, ball_dicts = write_synthetic_video(video_path, num_frames, width, height,
+                                                                               fps=fps, seed=seed)
+        self.player_detections = Detections.from_dicts(player_dicts)
+        self.ball_detections = Detections.from_dicts(ball_dicts)
+        self.frames = read_video(video_path)
+
+        # Inputs of the later stages, produced by the earlier ones
+        player_tracker, ball_tracker, _ = self.load_models()
+        self.analysis = analyze_detections(player_tracker, ball_tracker, self.create_mini_court(),
+                                           self.player_detections, self.ball_detections, self.court_keypoints)
+
+    def load_models(self):
+        return load_stub_models(self.court_keypoints, self.frame_size)
+
+    def create_mini_court(self):
+        return MiniCourt(self.frames[0])
+
+    def copy_frames(self):
+        """
+        Returns copies of the frames for the drawing benchmarks, which draw in place.
+        """
+        return [frame.copy() for frame in self.frames]
+
+# Every benchmark takes the fixture and returns a function running the stage
+# once, so the setup (fresh objects, copies of the frames) isn't timed
+
+def benchmark_interpolate_ball_positions(fixture):
+    _, ball_tracker, _ = fixture.load_models()
+
+    return lambda: ball_tracker.interpolate_ball_positions(fixture.ball_detections)
+
+def benchmark_get_ball_hit_frames(fixture):
+    _, ball_tracker, _ = fixture.load_models()
+
+    return lambda: ball_tracker.get_ball_hit_frames(fixture.analysis["ball_detections"])
+
+def benchmark_filter_players(fixture):
+    player_tracker, _, _ = fixture.load_models()
+
+    return lambda: player_tracker.filter_players(fixture.court_keypoints, fixture.player_detections)
+
+def benchmark_mini_court_height(fixture):
+    mini_court = fixture.create_mini_court()
+
+    return lambda: mini_court.convert_bounding_boxes_to_mini_court_coordinates(fixture.analysis["player_detections"],
+                                                                               fixture.analysis["ball_detections"],
+                                                                               fixture.court_keypoints,
+                                                                               projection="height")
+
+def benchmark_mini_court_homography(fixture):
+    mini_court = fixture.create_mini_court()
+
+    return lambda: mini_court.convert_bounding_boxes_to_mini_court_coordinates(fixture.analysis["player_detections"],
+                                                                               fixture.analysis["ball_detections"],
+                                                                               fixture.court_keypoints,
+                                                                               projection="homography")
+
+def benchmark_calculate_player_stats(fixture):
+    mini_court = fixture.create_mini_court()
+
+    return lambda: calculate_player_stats(fixture.analysis["ball_hit_frames"],
+                                          fixture.analysis["player_mini_court_detections"],
+                                          fixture.analysis["ball_mini_court_detections"],
+                                          mini_court)
+
+def benchmark_draw_court_keypoints(fixture):
+    _, _, court_line_detector = fixture.load_models()
+    frames = fixture.copy_frames()
+
+    return lambda: court_line_detector.draw_keypoints_on_video(frames, fixture.court_keypoints)
+
+def benchmark_draw_player_boxes(fixture):
+    player_tracker, _, _ = fixture.load_models()
+    frames = fixture.copy_frames()
+
+    return lambda: player_tracker.draw_bounding_boxes(frames, fixture.analysis["player_detections"])
+
+def benchmark_draw_ball_boxes(fixture):
+    _, ball_tracker, _ = fixture.load_models()
+    frames = fixture.copy_frames()
+
+    return lambda: ball_tracker.draw_bounding_boxes(frames, fixture.analysis["ball_detections"])
+
+def benchmark_draw_mini_court(fixture):
+    mini_court = fixture.create_mini_court()
+    frames = fixture.copy_frames()
+
+    return lambda: mini_court.draw_mini_court(frames)
+
+def benchmark_draw_mini_court_points(fixture):
+    mini_court = fixture.create_mini_court()
+    frames = fixture.copy_frames()
+
+    def run():
+        mini_court.draw_points_on_mini_court(frames, fixture.analysis["player_mini_court_detections"],
+                                             color=(255, 0, 0))
+        mini_court.draw_points_on_mini_court(frames, fixture.analysis["ball_mini_court_detections"])
+
+    return run
+
+def benchmark_draw_player_stats(fixture):
+    frames = fixture.copy_frames()
+    player_stats = fixture.analysis["player_stats"].get_columns(0, fixture.num_frames)
+
+    return lambda: draw_player_stats(frames, player_stats)
+
+def benchmark_annotate_frames(fixture):
+    player_tracker, ball_tracker, court_line_detector = fixture.load_models()
+    mini_court = fixture.create_mini_court()
+    frames = fixture.copy_frames()
+
+    return lambda: annotate_frames(frames, 0, player_tracker, ball_tracker, court_line_detector, mini_court,
+                                   fixture.analysis)
+
+def benchmark_video_read(fixture):
+    return lambda: sum(1 for _ in read_video_frames(fixture.video_path))
+
+def benchmark_video_write(fixture):
+    output_video_path = os.path.join(os.path.dirname(fixture.video_path), "video_write.avi")
+
+    return lambda: save_video(fixture.frames, output_video_path, fps=fixture.fps)
+
+def benchmark_end_to_end(fixture):
+    """
+    The streaming path of main.main, with the stub detectors.
+    """
+    output_video_path = os.path.join(os.path.dirname(fixture.video_path), "end_to_end.avi")
+
+    def run():
+        player_tracker, ball_tracker, court_line_detector = fixture.load_models()
+        mini_court = MiniCourt(next(read_video_frames(fixture.video_path)))
+
+        player_detections = player_tracker.detect_frames(read_video_frames(fixture.video_path),
+                                                         batch_size=fixture.batch_size)
+        ball_detections = ball_tracker.detect_frames(read_video_frames(fixture.video_path),
+                                                     batch_size=fixture.batch_size)
+
+        court_tracker = CourtTracker(court_line_detector)
+        court_keypoints = court_tracker.track(read_video_frames(fixture.video_path))
+
+        analysis = analyze_detections(player_tracker, ball_tracker, mini_court,
+                                      player_detections, ball_detections, court_keypoints)
+
+        chunks = read_video_chunks(fixture.video_path, fixture.chunk_size)
+        output_video_chunks = (annotate_frames(frames, start_frame,
+                                               player_tracker, ball_tracker, court_line_detector,
+                                               mini_court, analysis)
+                               for start_frame, frames in chunks)
+
+        save_video(chain.from_iterable(output_video_chunks), output_video_path, fps=fixture.fps)
+
+    return run
+
+BENCHMARKS = {
+    "interpolate_ball_positions": benchmark_interpolate_ball_positions,
+    "get_ball_hit_frames": benchmark_get_ball_hit_frames,
+    "filter_players": benchmark_filter_players,
+    "mini_court_height": benchmark_mini_court_height,
+    "mini_court_homography": benchmark_mini_court_homography,
+    "calculate_player_stats": benchmark_calculate_player_stats,
+    "draw_court_keypoints": benchmark_draw_court_keypoints,
+    "draw_player_boxes": benchmark_draw_player_boxes,
+    "draw_ball_boxes": benchmark_draw_ball_boxes,
+    "draw_mini_court": benchmark_draw_mini_court,
+    "draw_mini_court_points": benchmark_draw_mini_court_points,
+    "draw_player_stats": benchmark_draw_player_stats,
+    "annotate_frames": benchmark_annotate_frames,
+    "video_read": benchmark_video_read,
+    "video_write": benchmark_video_write,
+    "end_to_end": benchmark_end_to_end
+}
+
+def run_benchmark(benchmark, fixture, repeat):
+    """
+    Returns the seconds of each of repeat runs of a benchmark, each with a fresh setup.
+    """
+    seconds = []
+
+    for _ in range(repeat):
+        run = benchmark(fixture)
+
+        start_time = time.perf_counter()
+        run()
+        seconds.append(time.perf_counter() - start_time)
+
+    return seconds
+
+def get_git_commit():
+    """
+    Returns the current commit, with "-dirty" if there are uncommitted changes,
+    or None outside a git checkout.
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                                capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return commit + "-dirty" if status else commit
+
+def get_machine():
+    return {
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__
+    }
+
+def find_latest_result(results_dir, exclude=None):
+    """
+    Returns the path of the newest result in results_dir other than exclude, None if there is none.
+    """
+    paths = sorted(path for path in glob.glob(os.path.join(results_dir, "*.json")) if path != exclude)
+
+    return paths[-1] if paths else None
+
+def print_results(results, baseline=None, threshold=0.1):
+    """
+    Prints the median time and frames/sec of every stage and, given a baseline
+    run, how much each changed. Returns the stages more than threshold slower
+    than in the baseline.
+    """
+    regressions = []
+    baseline_stages = baseline["stages"] if baseline is not None else {}
+
+    print(f"{'stage':<28}{'median ms':>11}{'min ms':>10}{'frames/s':>11}{'baseline ms':>13}{'change':>9}")
+
+    for stage, stage_results in results["stages"].items():
+        line = (f"{stage:<28}{stage_results['median_seconds'] * 1000:>11.1f}{stage_results['min_seconds'] * 1000:>10.1f}"
+                f"{stage_results['frames_per_second']:>11.1f}")
+
+        if stage in baseline_stages:
+            baseline_seconds = baseline_stages[stage]["median_seconds"]
+            change = stage_results["median_seconds"] / baseline_seconds - 1
+            line += f"{baseline_seconds * 1000:>13.1f}{change:>+9.0%}"
+
+            if change > threshold:
+                line += "  slower"
+                regressions.append(stage)
+
+        print(line)
+
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage on a synthetic rally")
+    parser.add_argument("--frames", type=int, default=240, help="length of the synthetic video")
+    parser.add_argument("--resolution", choices=list(RESOLUTIONS), default="720p")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="runs of every stage, the median is reported")
+    parser.add_argument("--stages", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS),
+                        help="stages to run, all by default")
+    parser.add_argument("--results-dir", default="benchmarks/results", help="directory the runs are saved in")
+    parser.add_argument("--label", default=None, help="name stored with the run, e.g. the change being measured")
+    parser.add_argument("--no-save", action="store_true", help="don't save this run")
+    parser.add_argument("--compare", default=None, metavar="RESULT",
+                        help="earlier result file to compare with, or 'latest' for the newest saved run")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="slowdown against the compared run that counts as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true",
+                        help="exit with status 1 if a stage regressed, e.g. in CI")
+    args = parser.parse_args()
+
+    width, height = RESOLUTIONS[args.resolution]
+    config = {"frames": args.frames, "resolution": args.resolution, "seed": args.seed, "repeat": args.repeat}
+
+    baseline = None
+    baseline_path = find_latest_result(args.results_dir) if args.compare == "latest" else args.compare
+
+    if args.compare is not None:
+        if baseline_path is None:
+            print(f"No saved runs in {args.results_dir} to compare with")
+        else:
+            with open(baseline_path) as f:
+                baseline = json.load(f)
+
+            if baseline["config"] != config:
+                print(f"Warning: {baseline_path} was run with {baseline['config']}, not {config}")
+
+    results = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "label": args.label,
+        "git_commit": get_git_commit(),
+        "config": config,
+        "machine": get_machine(),
+        "stages": {}
+    }
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        print(f"Writing a {args.frames} frame {args.resolution} synthetic video")
+        fixture = SyntheticFixture(os.path.join(work_dir, "synthetic.avi"), args.frames, width, height,
+                                   seed=args.seed)
+
+        for stage in args.stages:
+            seconds = run_benchmark(BENCHMARKS[stage], fixture, args.repeat)
+            median_seconds = statistics.median(seconds)
+
+            results["stages"][stage] = {
+                "seconds": seconds,
+                "median_seconds": median_seconds,
+                "min_seconds": min(seconds),
+                "frames_per_second": args.frames / median_seconds
+            }
+
+    if baseline is not None:
+        print(f"Compared with {baseline_path} ({baseline['git_commit']}, {baseline['timestamp']})")
+
+    regressions = print_results(results, baseline, args.threshold)
+
+    if not args.no_save:
+        os.makedirs(args.results_dir, exist_ok=True)
+        result_name = f"{datetime.now():%Y%m%d-%H%M%S}_{results['git_commit'] or 'unknown'}.json"
+        result_path = os.path.join(args.results_dir, result_name)
+
+        with open(result_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+        print(f"Saved to {result_path}")
+
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
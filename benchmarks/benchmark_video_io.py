@@ -0,0 +1,103 @@
+"""
+Compares reading and writing a video frame by frame on the main thread (the
+original read_video_frames/save_video) with the threaded VideoDecoder and
+VideoEncoder, with some simulated per-frame work in between like the
+annotation does. Also reports the output file size of each codec.
+
+Run from the repository root:
+    python -m benchmarks.benchmark_video_io --frames 240 --codecs MJPG mp4v
+"""
+import argparse
+import os
+import tempfile
+import time
+import cv2
+from utils import VideoDecoder, VideoEncoder, get_video_fps
+
+def read_frames_synchronously(video_path, num_frames):
+    """
+    The original read_video_frames.
+    """
+    cap = cv2.VideoCapture(video_path)
+
+    for _ in range(num_frames):
+        ret, frame = cap.read()
+
+        if not ret:
+            break
+
+        yield frame
+
+    cap.release()
+
+def write_frames_synchronously(frames, output_video_path, fps, codec):
+    """
+    The original save_video, with the frame rate and codec as parameters.
+    """
+    out = None
+
+    for frame in frames:
+        if out is None:
+            out = cv2.VideoWriter(output_video_path, cv2.VideoWriter_fourcc(*codec), fps,
+                                  (frame.shape[1], frame.shape[0]))
+
+        out.write(frame)
+
+    if out is not None:
+        out.release()
+
+def process(frames, work_iterations):
+    """
+    Stands in for detection and annotation, blurring each frame in place.
+    """
+    for frame in frames:
+        for _ in range(work_iterations):
+            cv2.GaussianBlur(frame, (5, 5), 0, dst=frame)
+
+        yield frame
+
+def run_synchronous(video_path, output_video_path, num_frames, fps, codec, work_iterations):
+    frames = read_frames_synchronously(video_path, num_frames)
+    write_frames_synchronously(process(frames, work_iterations), output_video_path, fps, codec)
+
+def run_threaded(video_path, output_video_path, num_frames, fps, codec, work_iterations):
+    frames = VideoDecoder(video_path, end_frame=num_frames, num_held=1)
+
+    with VideoEncoder(output_video_path, fps=fps, codec=codec) as encoder:
+        for frame in process(frames, work_iterations):
+            encoder.write(frame)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark threaded video decoding and encoding")
+    parser.add_argument("--video", default="inputs/input_video.mp4")
+    parser.add_argument("--frames", type=int, default=240, help="number of frames to read and write")
+    parser.add_argument("--codecs", nargs="+", default=["MJPG", "mp4v"],
+                        help="four character codes for OpenCV or ffmpeg encoders (threaded only)")
+    parser.add_argument("--work", type=int, default=2, help="blurs per frame standing in for the annotation")
+    args = parser.parse_args()
+
+    fps = get_video_fps(args.video)
+
+    print(f"{'codec':<10}{'I/O':<12}{'frames/sec':>12}{'size MB':>10}")
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        for codec in args.codecs:
+            extension = ".avi" if codec == "MJPG" else ".mp4"
+            runs = {"threaded": run_threaded}
+
+            # The original writer only knows OpenCV's four character codes
+            if len(codec) == 4:
+                runs = {"synchronous": run_synchronous, **runs}
+
+            for name, run in runs.items():
+                output_video_path = os.path.join(output_dir, f"{name}_{codec}{extension}")
+
+                start_time = time.perf_counter()
+                run(args.video, output_video_path, args.frames, fps, codec, args.work)
+                elapsed_time = time.perf_counter() - start_time
+
+                size = os.path.getsize(output_video_path) / 1024 ** 2
+                print(f"{codec:<10}{name:<12}{args.frames / elapsed_time:>12.1f}{size:>10.1f}")
+
+if __name__ == "__main__":
+    main()
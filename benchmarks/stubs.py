@@ -0,0 +1,134 @@
+"""
+Stand-ins for the YOLO models and the court keypoints CNN, so the pipeline
+can run end to end on synthetic videos (see benchmarks.synthetic) without
+model weights or a GPU. The trackers around the stubs are the real ones, only
+the inference is replaced.
+"""
+import cv2
+import numpy as np
+from trackers import PlayerTracker, BallTracker
+from court_line_detector import CourtLineDetector
+from court_line_detector.court_line_detector import IMAGE_MEAN, IMAGE_STD
+from benchmarks.synthetic import PERSON_COLORS, BALL_COLOR
+
+class StubBoxes:
+    """
+    One detected box, with the attributes of an ultralytics box the trackers read.
+    """
+    def __init__(self, track_id, bounding_box, class_id=0):
+        self.id = np.array([track_id])
+        self.xyxy = np.array([bounding_box])
+        self.cls = np.array([class_id])
+
+class StubResults:
+    """
+    Detections of one image, with the attributes of an ultralytics Result the trackers read.
+    """
+    def __init__(self, boxes, names):
+        self.boxes = boxes
+        self.names = names
+
+class ColorBlobModel:
+    """
+    Detects solid colored blobs instead of people or balls: every color of
+    colors is a track whose ID is its index plus 1, and its box is the bounding
+    box of the pixels of that color. Works on whole frames, crops and resized
+    frames alike, so every detection mode of the trackers can run on it.
+    """
+    def __init__(self, colors, class_name, tolerance=50, min_area=4):
+        """
+        :param colors: list of BGR colors to detect
+        :param class_name: class name reported for every detection
+        :param tolerance: largest difference per channel from the color, video
+                          compression changes the colors a little
+        :param min_area: fewest pixels of a color that count as a detection
+        """
+        self.colors = colors
+        self.names = {0: class_name}
+        self.tolerance = tolerance
+        self.min_area = min_area
+
+    def detect(self, image):
+        boxes = []
+
+        for track_id, color in enumerate(self.colors, start=1):
+            lower = np.clip(np.array(color) - self.tolerance, 0, 255).astype(np.uint8)
+            upper = np.clip(np.array(color) + self.tolerance, 0, 255).astype(np.uint8)
+            mask = cv2.inRange(image, lower, upper)
+
+            if cv2.countNonZero(mask) < self.min_area:
+                continue
+
+            # Synthetic videos have one blob of every color, so all its pixels are the box
+            x, y, width, height = cv2.boundingRect(mask)
+            boxes.append(StubBoxes(track_id, [float(x), float(y), float(x + width), float(y + height)]))
+
+        return StubResults(boxes, self.names)
+
+    def predict(self, images, **kwargs):
+        return [self.detect(image) for image in images]
+
+    def track(self, images, **kwargs):
+        # Colors never change, so IDs stay the same without a tracker
+        return self.predict(images)
+
+class StubPlayerTracker(PlayerTracker):
+    """
+    PlayerTracker detecting the colored people of a synthetic video.
+    """
+    def load_model(self, model_path):
+        return ColorBlobModel(PERSON_COLORS, "person")
+
+class StubBallTracker(BallTracker):
+    """
+    BallTracker detecting the colored ball of a synthetic video.
+    """
+    def load_model(self, model_path):
+        return ColorBlobModel([BALL_COLOR], "tennis ball", min_area=2)
+
+class StubCourtLineDetector(CourtLineDetector):
+    """
+    CourtLineDetector returning known court keypoints instead of running the
+    CNN. Images are still preprocessed like for the model, so only the forward
+    pass is missing from its timings.
+    """
+    def __init__(self, court_keypoints, frame_size, batch_size=8):
+        """
+        :param court_keypoints: flat array of (x, y) court keypoints of the synthetic video
+        :param frame_size: (width, height) of the video's frames
+        :param batch_size: maximum number of images per forward pass in predict_batch
+        """
+        width, height = frame_size
+
+        # Keypoints scaled to [0, 1] like the model outputs them
+        self.normalized_keypoints = np.asarray(court_keypoints, dtype=np.float32).copy()
+        self.normalized_keypoints[::2] /= width
+        self.normalized_keypoints[1::2] /= height
+
+        self.backend = "stub"
+        self.batch_size = batch_size
+        self.input_scale = 1 / (255 * IMAGE_STD)
+        self.input_offset = -IMAGE_MEAN / IMAGE_STD
+        self.keypoints_sprite = (None, None)
+        self.cache = None
+
+    def run_model(self, batch):
+        return np.repeat(self.normalized_keypoints[None], len(batch), axis=0)
+
+def load_stub_models(court_keypoints, frame_size, ball_roi_tracking=False,
+                     player_keyframe_interval=1, player_keyframe_motion=0.15, player_gap_fill="interpolate"):
+    """
+    Returns the (PlayerTracker, BallTracker, CourtLineDetector) of a synthetic
+    video, like pipeline.load_models does for real ones.
+
+    :param court_keypoints: flat array of (x, y) court keypoints of the synthetic video
+    :param frame_size: (width, height) of the video's frames
+    """
+    player_tracker = StubPlayerTracker("stub",
+                                       keyframe_interval=player_keyframe_interval,
+                                       keyframe_motion=player_keyframe_motion,
+                                       gap_fill=player_gap_fill)
+    ball_tracker = StubBallTracker("stub", roi_tracking=ball_roi_tracking)
+    court_line_detector = StubCourtLineDetector(court_keypoints, frame_size)
+
+    return player_tracker, ball_tracker, court_line_detector
@@ -0,0 +1,245 @@
+"""
+Synthetic videos, detections and stats so benchmarks can run without model
+weights or input videos.
+"""
+import cv2
+import numpy as np
+import pandas as pd
+import constants
+from utils.draw_player_stats import PLAYER_STATS_COLUMNS
+
+# Solid BGR colors of the people and the ball in synthetic videos, the stub
+# models in benchmarks.stubs find them by color. The first two people are the
+# players, the others stand off the court (umpire, line judge) so
+# filter_players has someone to filter out
+PERSON_COLORS = [(40, 40, 220), (220, 60, 40), (200, 40, 200), (200, 200, 40)]
+BALL_COLOR = (40, 230, 230)
+COURT_COLOR = (70, 120, 50)
+LINE_COLOR = (255, 255, 255)
+
+# Court lines as pairs of keypoint indices
+COURT_LINES = [(0, 1), (2, 3), (0, 2), (1, 3), (4, 6), (5, 7), (8, 9), (10, 11), (12, 13)]
+
+# Where the corners of the doubles court are in the frame, as fractions of its
+# width and height (far left, far right, near left, near right)
+COURT_CORNERS = [(0.34, 0.22), (0.66, 0.22), (0.14, 0.86), (0.86, 0.86)]
+
+def generate_ball_detections(num_frames, seed=0, miss_rate=0.1):
+    """
+    Returns a list of dictionaries mapping the ball ID to bounding box
+    coordinates for a synthetic rally. The ball travels back and forth between
+    the far and near baseline with a shot every 40 to 90 frames, with pixel
+    noise and frames where the ball wasn't detected.
+
+    :param num_frames: number of frames to generate
+    :param seed: seed for the random number generator
+    :param miss_rate: fraction of frames without a ball detection
+    """
+    rng = np.random.default_rng(seed)
+
+    # Frame numbers of the shots, the ball changes direction at each one
+    shot_lengths = rng.integers(40, 90, size=num_frames // 40 + 2)
+    shot_frames = np.concatenate(([0], np.cumsum(shot_lengths)))
+
+    # Ball alternates between the far (small y) and near (large y) side of the court
+    shot_y = np.where(np.arange(len(shot_frames)) % 2 == 0, 150.0, 650.0)
+    shot_x = rng.uniform(300, 1000, size=len(shot_frames))
+
+    frame_nums = np.arange(num_frames)
+    center_x = np.interp(frame_nums, shot_frames, shot_x) + rng.normal(0, 1.5, num_frames)
+    center_y = np.interp(frame_nums, shot_frames, shot_y) + rng.normal(0, 1.5, num_frames)
+    detected = rng.random(num_frames) >= miss_rate
+
+    boxes = np.stack([center_x - 6, center_y - 6, center_x + 6, center_y + 6], axis=1).tolist()
+
+    return [{1: box} if is_detected else {} for box, is_detected in zip(boxes, detected)]
+
+def generate_player_stats(num_frames, seed=0):
+    """
+    Returns a dataframe with one row of player stats per frame, like the one
+    calculate_player_stats returns. The stats change on a synthetic shot every
+    40 to 90 frames and stay the same in between.
+
+    :param num_frames: number of frames to generate
+    :param seed: seed for the random number generator
+    """
+    rng = np.random.default_rng(seed)
+
+    shot_lengths = rng.integers(40, 90, size=num_frames // 40 + 2)
+    shot_frames = np.concatenate(([0], np.cumsum(shot_lengths)))
+
+    # Index of the last shot at or before every frame
+    last_shot = np.searchsorted(shot_frames, np.arange(num_frames), side="right") - 1
+
+    shot_stats = rng.uniform(0, 120, size=(len(shot_frames), len(PLAYER_STATS_COLUMNS)))
+
+    return pd.DataFrame(shot_stats[last_shot], columns=PLAYER_STATS_COLUMNS)
+
+def get_court_homography(width, height):
+    """
+    Returns the homography from court coordinates in meters (x across the court
+    from the far left doubles corner, y towards the camera from the far
+    baseline) to pixels of a width x height frame.
+    """
+    court_length = 2 * constants.HALF_COURT_LENGTH
+    court_corners = np.float32([[0, 0],
+                                [constants.DOUBLES_LINE_WIDTH, 0],
+                                [0, court_length],
+                                [constants.DOUBLES_LINE_WIDTH, court_length]])
+    frame_corners = np.float32([[x * width, y * height] for x, y in COURT_CORNERS])
+
+    return cv2.getPerspectiveTransform(court_corners, frame_corners)
+
+def project_court_points(homography, points):
+    """
+    Returns the (N, 2) pixel positions of (N, 2) court positions in meters.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 1, 2)
+
+    return cv2.perspectiveTransform(points, homography).reshape(-1, 2)
+
+def generate_court_keypoints(width, height):
+    """
+    Returns the 14 court keypoints of a synthetic court seen from behind the
+    near baseline, as the flat (x, y) array CourtLineDetector.predict returns.
+
+    :param width: frame width in pixels
+    :param height: frame height in pixels
+    """
+    court_length = 2 * constants.HALF_COURT_LENGTH
+    singles_left = constants.DOUBLES_ALLEY_DIFF
+    singles_right = constants.DOUBLES_LINE_WIDTH - constants.DOUBLES_ALLEY_DIFF
+    far_service_line = constants.NO_MANS_LAND_WIDTH
+    near_service_line = court_length - constants.NO_MANS_LAND_WIDTH
+    center = constants.DOUBLES_LINE_WIDTH / 2
+
+    # Same order as the keypoints model and MiniCourt.set_mini_court_keypoints
+    court_points = [(0, 0), (constants.DOUBLES_LINE_WIDTH, 0),
+                    (0, court_length), (constants.DOUBLES_LINE_WIDTH, court_length),
+                    (singles_left, 0), (singles_right, 0),
+                    (singles_left, court_length), (singles_right, court_length),
+                    (singles_left, far_service_line), (singles_right, far_service_line),
+                    (singles_left, near_service_line), (singles_right, near_service_line),
+                    (center, far_service_line), (center, near_service_line)]
+
+    return project_court_points(get_court_homography(width, height), court_points).ravel().astype(np.float32)
+
+def generate_rally(num_frames, width=1280, height=720, seed=0, miss_rate=0.1):
+    """
+    Returns the (player_detections, ball_detections) of a synthetic rally, lists
+    of dictionaries of IDs to bounding boxes like the trackers return. The two
+    players move along their baselines, two more people stand beside the court
+    and the ball flies from one player to the other with a shot every 40 to 90
+    frames. The ball is missing in about miss_rate of the frames.
+
+    :param num_frames: number of frames to generate
+    :param width: frame width in pixels
+    :param height: frame height in pixels
+    :param seed: seed for the random number generator
+    :param miss_rate: fraction of frames without a ball
+    """
+    rng = np.random.default_rng(seed)
+    homography = get_court_homography(width, height)
+    court_length = 2 * constants.HALF_COURT_LENGTH
+    frame_nums = np.arange(num_frames)
+
+    # Feet of the players in court meters, side to side behind their baselines
+    player_positions = []
+
+    for baseline_y, phase in [(-1.0, 0.0), (court_length + 1.0, np.pi / 2)]:
+        x = (constants.DOUBLES_LINE_WIDTH / 2 + 3.0 * np.sin(frame_nums / 35 + phase)
+             + rng.normal(0, 0.05, num_frames))
+        y = baseline_y + 0.8 * np.sin(frame_nums / 50 + phase) + rng.normal(0, 0.05, num_frames)
+        player_positions.append(np.stack([x, y], axis=1))
+
+    # Umpire by the net post and a line judge behind the far right corner, barely moving
+    for x, y in [(-3.0, constants.HALF_COURT_LENGTH), (constants.DOUBLES_LINE_WIDTH + 5.0, -6.0)]:
+        player_positions.append(np.stack([x + rng.normal(0, 0.02, num_frames),
+                                          y + rng.normal(0, 0.02, num_frames)], axis=1))
+
+    player_detections = [{} for _ in range(num_frames)]
+
+    for track_id, positions in enumerate(player_positions, start=1):
+        feet = project_court_points(homography, positions)
+
+        # Pixels per meter where the person stands, from a point a meter to the side
+        scale = np.linalg.norm(project_court_points(homography, positions + [1.0, 0.0]) - feet, axis=1)
+        box_height = 1.9 * scale
+        box_width = 0.45 * box_height
+
+        for frame_num in range(num_frames):
+            x, y = feet[frame_num]
+            player_detections[frame_num][track_id] = [float(x - box_width[frame_num] / 2),
+                                                      float(y - box_height[frame_num]),
+                                                      float(x + box_width[frame_num] / 2),
+                                                      float(y)]
+
+    # Shots alternate between the players, the ball flies from one to the other
+    shot_lengths = rng.integers(40, 90, size=num_frames // 40 + 2)
+    shot_frames = np.concatenate(([0], np.cumsum(shot_lengths)))
+    shot_index = np.searchsorted(shot_frames, frame_nums, side="right") - 1
+    progress = (frame_nums - shot_frames[shot_index]) / shot_lengths[np.minimum(shot_index, len(shot_lengths) - 1)]
+
+    hitter = shot_index % 2
+    start = np.stack(player_positions[:2], axis=1)[frame_nums, hitter]
+    end = np.stack(player_positions[:2], axis=1)[frame_nums, 1 - hitter]
+    ball_ground = start + (end - start) * progress[:, None]
+    ball_pixels = project_court_points(homography, ball_ground)
+
+    # The ball flies in a low arc above the ground, one meter up at its highest
+    scale = np.linalg.norm(project_court_points(homography, ball_ground + [1.0, 0.0]) - ball_pixels, axis=1)
+    ball_pixels[:, 1] -= (1.0 + 4 * progress * (1 - progress)) * scale
+    ball_radius = np.maximum(0.12 * scale, 3.0)
+
+    detected = rng.random(num_frames) >= miss_rate
+    ball_detections = [{1: [float(x - r), float(y - r), float(x + r), float(y + r)]} if is_detected else {}
+                       for (x, y), r, is_detected in zip(ball_pixels, ball_radius, detected)]
+
+    return player_detections, ball_detections
+
+def draw_synthetic_frame(width, height, court_keypoints, player_dict, ball_dict):
+    """
+    Returns a BGR frame with the court, the people as solid rectangles in
+    PERSON_COLORS (by track ID) and the ball as a BALL_COLOR disc.
+    """
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    frame[:] = COURT_COLOR
+
+    points = np.asarray(court_keypoints).reshape(-1, 2).astype(np.int32)
+
+    for start, end in COURT_LINES:
+        cv2.line(frame, tuple(points[start]), tuple(points[end]), LINE_COLOR, max(height // 240, 1))
+
+    for track_id, (x1, y1, x2, y2) in player_dict.items():
+        cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), PERSON_COLORS[track_id - 1], -1)
+
+    for x1, y1, x2, y2 in ball_dict.values():
+        cv2.circle(frame, (int((x1 + x2) / 2), int((y1 + y2) / 2)), int(round((x2 - x1) / 2)), BALL_COLOR, -1)
+
+    return frame
+
+def write_synthetic_video(video_path, num_frames, width=1280, height=720, fps=24, seed=0, miss_rate=0.1):
+    """
+    Writes a synthetic rally (see generate_rally) as an MJPG video and returns
+    (court_keypoints, player_detections, ball_detections), what a perfect
+    detector would find in it.
+
+    :param video_path: path of the video file to write
+    :param num_frames: number of frames to generate
+    :param width: frame width in pixels
+    :param height: frame height in pixels
+    :param fps: frame rate stored in the video
+    :param seed: seed for the random number generator
+    :param miss_rate: fraction of frames without a ball
+    """
+    court_keypoints = generate_court_keypoints(width, height)
+    player_detections, ball_detections = generate_rally(num_frames, width, height, seed=seed, miss_rate=miss_rate)
+
+    out = cv2.VideoWriter(video_path, cv2.VideoWriter_fourcc(*"MJPG"), fps, (width, height))
+
+    for player_dict, ball_dict in zip(player_detections, ball_detections):
+        out.write(draw_synthetic_frame(width, height, court_keypoints, player_dict, ball_dict))
+
+    out.release()
+
+    return court_keypoints, player_detections, ball_detections
@@ -0,0 +1,2 @@
+from .compositor import Compositor
+from .layers import CourtKeypointsLayer, DetectionsLayer, MiniCourtLayer, PlayerStatsLayer, FrameNumberLayer
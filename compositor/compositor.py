@@ -0,0 +1,81 @@
+from concurrent.futures import ThreadPoolExecutor
+from instrumentation import profiler, profile_stage, profiled
+
+class Compositor:
+    """
+    Draws all overlays of the annotated video in a single pass over the frames.
+    Overlays register as layers, objects with a name and a draw(frame, frame_num)
+    method that draws onto the frame in place. Every frame gets all layers, in
+    the order they were added, before the next frame is started, so a frame is
+    still in the CPU caches while it is annotated instead of being read back
+    from memory once per overlay.
+
+    By default (num_workers=1) the frames are drawn on the calling thread and
+    no thread pool is created. With num_workers above 1 the frames are split
+    among a pool of threads. OpenCV releases the GIL while drawing and blending,
+    but the layers are light and the threads' overhead outweighs what they can
+    overlap: benchmarks.benchmark_compositor measured 2 and 4 workers at about
+    0.5x and 0.3x the speed of one, at 1080p and 4K. The pool can only help with
+    heavy layers and idle cores, so measure before raising it. A frame is always
+    drawn by a single thread with all layers in order, so the output doesn't
+    depend on the number of workers.
+    """
+    def __init__(self, layers=None, num_workers=1):
+        """
+        :param layers: list of layers, drawn first to last
+        :param num_workers: number of threads frames are rendered on, 1 renders on the
+                            calling thread without a pool
+        """
+        self.layers = list(layers) if layers is not None else []
+        self.num_workers = num_workers
+
+    def add_layer(self, layer):
+        """
+        Adds a layer drawn on top of the layers added before it.
+        """
+        self.layers.append(layer)
+
+    def render_frames(self, frames, frame_nums):
+        """
+        Draws every layer onto each frame in place.
+        """
+        if not profiler.enabled:
+            for frame, frame_num in zip(frames, frame_nums):
+                for layer in self.layers:
+                    layer.draw(frame, frame_num)
+
+            return
+
+        # Same as above, with the time of each layer measured
+        for frame, frame_num in zip(frames, frame_nums):
+            for layer in self.layers:
+                with profile_stage(layer.name, frames=1):
+                    layer.draw(frame, frame_num)
+
+    @profiled("Compositor.render", frames=1)
+    def render(self, frames, start_frame=0):
+        """
+        Draws every layer onto each frame in place and returns the frames.
+
+        :param frames: list of NumPy arrays representing consecutive video frames
+        :param start_frame: frame number of the first frame in frames
+        """
+        frame_nums = range(start_frame, start_frame + len(frames))
+        num_workers = min(self.num_workers, len(frames))
+
+        if num_workers <= 1:
+            self.render_frames(frames, frame_nums)
+            return frames
+
+        # Consecutive frames go to the same worker, so sprites that only change
+        # now and then (stats, court keypoints) are rebuilt as rarely as possible
+        part_size = -(-len(frames) // num_workers)
+        parts = [(frames[start:start + part_size], frame_nums[start:start + part_size])
+                 for start in range(0, len(frames), part_size)]
+
+        with ThreadPoolExecutor(max_workers=num_workers) as pool:
+            # Going through the results raises any error of a worker here
+            for _ in pool.map(lambda part: self.render_frames(*part), parts):
+                pass
+
+        return frames
@@ -0,0 +1,92 @@
+import cv2
+import numpy as np
+from utils.draw_player_stats import player_stats_panel
+
+# Every layer has a name, used as its stage by the profiler, and a draw(frame,
+# frame_num) method drawing onto the frame in place. Layers holding data of a
+# part of the video are given first_frame, the frame number of its first entry
+
+class CourtKeypointsLayer:
+    """
+    The court keypoints, drawn by a CourtLineDetector.
+    """
+    def __init__(self, court_line_detector, court_keypoints, first_frame=0, name="court_keypoints"):
+        """
+        :param court_line_detector: CourtLineDetector object
+        :param court_keypoints: flat array of (x, y) keypoint coordinates shared by all frames,
+                                or an (N, 28) array with the keypoints of each frame
+        """
+        self.court_line_detector = court_line_detector
+        self.court_keypoints = np.asarray(court_keypoints)
+        self.first_frame = first_frame
+        self.name = name
+
+    def draw(self, frame, frame_num):
+        keypoints = self.court_keypoints
+
+        if keypoints.ndim > 1:
+            keypoints = keypoints[frame_num - self.first_frame]
+
+        return self.court_line_detector.draw_keypoints_on_frame(frame, keypoints)
+
+class DetectionsLayer:
+    """
+    Detections of each frame, drawn by a function taking a frame and the
+    frame's dictionary of IDs to coordinates, e.g.
+    PlayerTracker.draw_bounding_boxes_on_frame or MiniCourt.draw_points_on_frame.
+    """
+    def __init__(self, draw_detections, detections, first_frame=0, name=None):
+        """
+        :param draw_detections: function drawing one frame's detections, draw_detections(frame, detection_dict)
+        :param detections: Detections (or list of dictionaries) of IDs to coordinates
+        :param name: name of the layer, by default the name of draw_detections
+        """
+        self.draw_detections = draw_detections
+        self.detections = detections
+        self.first_frame = first_frame
+        self.name = name or getattr(draw_detections, "__qualname__", "detections")
+
+    def draw(self, frame, frame_num):
+        return self.draw_detections(frame, self.detections[frame_num - self.first_frame])
+
+class MiniCourtLayer:
+    """
+    The mini court's background and lines.
+    """
+    def __init__(self, mini_court, name="mini_court"):
+        self.mini_court = mini_court
+        self.name = name
+
+    def draw(self, frame, frame_num):
+        return self.mini_court.draw_mini_court_on_frame(frame)
+
+class PlayerStatsLayer:
+    """
+    The player stats panel.
+    """
+    def __init__(self, player_stats, first_frame=0, panel=None, name="player_stats"):
+        """
+        :param player_stats: columns of player stats, one value per frame. A dictionary
+                             of column names to arrays or a dataframe
+        :param panel: PlayerStatsPanel drawing the panel, by default the one draw_player_stats uses
+        """
+        self.panel = panel or player_stats_panel
+        self.stats = self.panel.get_stats_rows(player_stats, 0, None)
+        self.first_frame = first_frame
+        self.name = name
+
+    def draw(self, frame, frame_num):
+        return self.panel.draw_frame(frame, self.stats[frame_num - self.first_frame])
+
+class FrameNumberLayer:
+    """
+    The frame number in the top left corner, which helps with debugging and
+    figuring out where in the video we are.
+    """
+    def __init__(self, name="frame_number"):
+        self.name = name
+
+    def draw(self, frame, frame_num):
+        cv2.putText(frame, f"Frame: {frame_num}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+
+        return frame
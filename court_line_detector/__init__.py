@@ -1 +1 @@
-from .court_line_detector import CourtLineDetector
\ No newline at end of file
+from .court_line_detector import CourtLineDetector, BACKENDS, get_onnx_export
\ No newline at end of file
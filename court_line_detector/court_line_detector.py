@@ -1,47 +1,242 @@
+import os
+import tempfile
 import torch
-from torchvision import transforms, models
+from torchvision import models
 import cv2
+import numpy as np
+from utils import OverlaySprite
+from instrumentation import profiled
+
+# Ways the keypoints CNN can be run, see CourtLineDetector
+BACKENDS = ["eager", "torchscript", "onnx"]
+
+# Input size and ImageNet statistics the CNN was trained with
+INPUT_SIZE = 224
+IMAGE_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+IMAGE_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+def load_keypoints_model(model_path):
+    """
+    Returns the keypoints CNN with the weights at model_path, ready for inference.
+
+    :param model_path: path to the keypoints CNN weights
+    """
+    # Have to set up correct model architecture before loading parameters
+    model = models.resnet50(pretrained=False)
+    model.fc = torch.nn.Linear(model.fc.in_features, 14*2)
+
+    # state_dict is a Python dictionary that maps each layer to its
+    # parameter tensor
+    model.load_state_dict(torch.load(model_path, map_location="cpu"))
+
+    # Uses the BatchNorm statistics collected during training. In training mode
+    # every prediction would depend on the other images in its batch and
+    # update the statistics as a side effect
+    model.eval()
+
+    # Convolutions are faster on the CPU with channels last, which is also
+    # the (height, width, channels) layout of the preprocessed images
+    return model.to(memory_format=torch.channels_last)
+
+def get_onnx_export(model_path, model=None):
+    """
+    Returns the path of the ONNX export of the keypoints CNN, next to the weights,
+    exporting it first if there is no export of the current weights yet. Pools of
+    worker processes call this before starting the workers, so they all find the
+    export instead of writing it at the same time.
+
+    :param model_path: path to the keypoints CNN weights
+    :param model: the CNN loaded from model_path, loaded here if an export is needed
+    """
+    onnx_path = os.path.splitext(model_path)[0] + ".onnx"
+
+    if os.path.exists(onnx_path) and os.path.getmtime(onnx_path) >= os.path.getmtime(model_path):
+        return onnx_path
+
+    if model is None:
+        model = load_keypoints_model(model_path)
+
+    # The export is written to a temporary file and then renamed, so a process
+    # loading it never sees a half written file
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(onnx_path))) as export_dir:
+        export_path = os.path.join(export_dir, os.path.basename(onnx_path))
+        export_onnx(model, export_path)
+        os.replace(export_path, onnx_path)
+
+    return onnx_path
+
+def export_onnx(model, onnx_path):
+    """
+    Exports the keypoints CNN to an ONNX file that takes batches of any size.
+    """
+    example_images = torch.zeros(1, 3, INPUT_SIZE, INPUT_SIZE)
+
+    torch.onnx.export(model, example_images, onnx_path,
+                      input_names=["images"],
+                      output_names=["keypoints"],
+                      dynamic_axes={"images": {0: "batch"}, "keypoints": {0: "batch"}},
+                      dynamo=False)
 
 class CourtLineDetector:
-    def __init__(self, model_path):
-        # Have to set up correct model architecture before loading parameters
-        self.model = models.resnet50(pretrained=False)
-        self.model.fc = torch.nn.Linear(self.model.fc.in_features, 14*2)
-
-        # state_dict is a Python dictionary that maps each layer to its
-        # parameter tensor
-        self.model.load_state_dict(torch.load(model_path, map_location="cpu"))
-
-        self.transforms = transforms.Compose([
-        transforms.ToPILImage(),
-        transforms.Resize((224, 224)),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-        ])
-        
-    def predict(self, image):
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    def __init__(self, model_path, cache=None, backend="eager", num_threads=None, batch_size=8):
+        """
+        :param model_path: path to the keypoints CNN weights
+        :param cache: optional DetectionCache
+        :param backend: "eager" runs the PyTorch model as is, "torchscript" a frozen traced
+                        copy of it and "onnx" an export of it with ONNX Runtime. The ONNX
+                        file is written next to the weights and only exported again when
+                        the weights are newer, see get_onnx_export
+        :param num_threads: number of CPU threads used for inference, None keeps the default
+        :param batch_size: maximum number of images per forward pass in predict_batch
+        """
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend: {backend}")
+
+        if num_threads is not None:
+            torch.set_num_threads(num_threads)
+
+        self.model = load_keypoints_model(model_path)
+
+        self.backend = backend
+        self.batch_size = batch_size
+
+        if backend == "torchscript":
+            self.scripted_model = self.get_torchscript_model()
+        elif backend == "onnx":
+            self.onnx_session = self.get_onnx_session(get_onnx_export(model_path, self.model), num_threads)
+
+        # Normalize as (pixel / 255 - mean) / std folded into one multiply and add
+        self.input_scale = 1 / (255 * IMAGE_STD)
+        self.input_offset = -IMAGE_MEAN / IMAGE_STD
 
-        # Transforms returns a PyTorch tensor
-        # Uses unsqueeze(0) to add a batch dimension as PyTorch
-        # models expect a batched input
-        image_tensor = self.transforms(image_rgb).unsqueeze(0)
+        # (frame shape and keypoints, sprite of the drawn keypoints), rebuilt only when
+        # the keypoints or frame size change. Kept as one tuple so threads drawing
+        # different frames never pair a sprite with another sprite's keypoints
+        self.keypoints_sprite = (None, None)
+
+        # Optional DetectionCache, keypoints are keyed on the model weights and the frame
+        self.cache = cache
+
+        if cache is not None:
+            self.cache_namespace = cache.get_namespace("court_keypoints", model_path,
+                                                       {"input_size": INPUT_SIZE,
+                                                        "preprocessing": "cv2",
+                                                        "backend": backend})
+
+    def get_torchscript_model(self):
+        """
+        Returns the model traced and frozen with TorchScript, which folds the
+        BatchNorm layers into the convolutions and drops the Python overhead.
+        """
+        example_images = torch.zeros(1, 3, INPUT_SIZE, INPUT_SIZE).to(memory_format=torch.channels_last)
 
-        # Disables gradient computation and saves memory
         with torch.no_grad():
-            outputs = self.model(image_tensor)
+            traced_model = torch.jit.trace(self.model, example_images)
+
+        return torch.jit.optimize_for_inference(torch.jit.freeze(traced_model))
 
-        # Removes batch dimension, moves tensor to CPU (required for NumPy conversion),
-        # then converts to NumPy array
-        keypoints = outputs.squeeze().cpu().numpy()
+    def get_onnx_session(self, onnx_path, num_threads):
+        """
+        Returns an ONNX Runtime session of the model exported to onnx_path.
+        """
+        import onnxruntime
 
-        # Scale keypoints from [0, 1] back to original image dimensions
-        original_h, original_w = image.shape[:2]
-        keypoints[::2] *= original_w
-        keypoints[1::2] *= original_h
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        if num_threads is not None:
+            options.intra_op_num_threads = num_threads
+
+        return onnxruntime.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+
+    def predict(self, image):
+        """
+        Returns the 14 court keypoints of an image as a flat array of
+        (x, y) coordinates in the image's pixel space.
+
+        :param image: a NumPy array representing a single BGR video frame
+        """
+        return self.predict_batch([image])[0]
+
+    def predict_batch(self, images):
+        """
+        Returns the court keypoints of every image, see predict. Images go
+        through the model batch_size at a time.
+
+        :param images: list of NumPy arrays representing BGR video frames
+        """
+        if self.cache is None:
+            return self.predict_keypoints(images)
+
+        return self.cache.lookup_or_compute(self.cache_namespace,
+                                            images,
+                                            self.predict_keypoints,
+                                            lambda keypoints: keypoints.astype(np.float32).tobytes(),
+                                            lambda value: np.frombuffer(value, dtype=np.float32).copy())
+
+    def preprocess(self, images):
+        """
+        Returns a (N, 224, 224, 3) float32 array of the images resized, converted
+        to RGB and normalized like the training transforms, without the round
+        trip through PIL.
+
+        :param images: list of NumPy arrays representing BGR video frames
+        """
+        batch = np.empty((len(images), INPUT_SIZE, INPUT_SIZE, 3), dtype=np.float32)
+
+        for i, image in enumerate(images):
+            # Area interpolation is the closest to PIL's antialiased resize when shrinking,
+            # resizing first makes the color conversion and normalization work on few pixels
+            resized_image = cv2.resize(image, (INPUT_SIZE, INPUT_SIZE), interpolation=cv2.INTER_AREA)
+
+            rgb_image = cv2.cvtColor(resized_image, cv2.COLOR_BGR2RGB)
+
+            np.multiply(rgb_image, self.input_scale, out=batch[i])
+            batch[i] += self.input_offset
+
+        return batch
+
+    def run_model(self, batch):
+        """
+        Returns the (N, 28) model outputs, keypoints scaled to [0, 1], of a
+        preprocessed batch.
+        """
+        if self.backend == "onnx":
+            return self.onnx_session.run(None, {"images": np.ascontiguousarray(batch.transpose(0, 3, 1, 2))})[0]
+
+        # Permuting to (N, channels, height, width) keeps the channels last
+        # memory layout without copying
+        images = torch.from_numpy(batch).permute(0, 3, 1, 2)
+        model = self.scripted_model if self.backend == "torchscript" else self.model
+
+        # Like no_grad, but also skips the version counters autograd would need
+        with torch.inference_mode():
+            return model(images).numpy()
+
+    @profiled("CourtLineDetector.predict_keypoints", frames=1)
+    def predict_keypoints(self, images):
+        """
+        Runs the model on images, batch_size at a time, and returns the
+        keypoints of each in its own pixel space.
+        """
+        keypoints = []
+
+        for start in range(0, len(images), self.batch_size):
+            batch_images = images[start:start + self.batch_size]
+            outputs = self.run_model(self.preprocess(batch_images))
+
+            for image, image_keypoints in zip(batch_images, outputs):
+                image_keypoints = image_keypoints.copy()
+
+                # Scale keypoints from [0, 1] back to original image dimensions
+                original_h, original_w = image.shape[:2]
+                image_keypoints[::2] *= original_w
+                image_keypoints[1::2] *= original_h
+
+                keypoints.append(image_keypoints)
 
         return keypoints
-    
+
     def draw_keypoints(self, image, keypoints):
         for i in range(0, len(keypoints), 2):
             # Need to wrap in int() because the NumPy array contains floats
@@ -54,11 +249,42 @@ class CourtLineDetector:
 
         return image
     
+    @profiled("CourtLineDetector.draw_keypoints_on_video", frames=1)
     def draw_keypoints_on_video(self, video_frames, keypoints):
+        """
+        Draws the keypoints onto each frame in place. The keypoints only change
+        when the camera view does, so they are drawn once into a sprite that gets
+        stamped onto the frames until the keypoints change.
+
+        :param video_frames: list of NumPy arrays representing video frames
+        :param keypoints: flat array of (x, y) keypoint coordinates shared by all frames,
+                          or a (len(video_frames), 28) array with the keypoints of each frame
+        """
         output_video_frames = []
+        keypoints = np.asarray(keypoints)
+
+        if keypoints.ndim == 1:
+            keypoints = keypoints[None].repeat(len(video_frames), axis=0)
 
-        for frame in video_frames:
-            frame = self.draw_keypoints(frame, keypoints)
+        for frame, frame_keypoints in zip(video_frames, keypoints):
+            frame = self.draw_keypoints_on_frame(frame, frame_keypoints)
             output_video_frames.append(frame)
 
         return output_video_frames
+
+    def draw_keypoints_on_frame(self, frame, keypoints):
+        """
+        Draws the keypoints onto a single frame in place and returns it, see
+        draw_keypoints_on_video. Safe to call from several threads at once.
+
+        :param frame: NumPy array representing a video frame
+        :param keypoints: NumPy array of the frame's flat (x, y) keypoint coordinates
+        """
+        sprite_key = (frame.shape, keypoints.tobytes())
+        key, sprite = self.keypoints_sprite
+
+        if key != sprite_key:
+            sprite = OverlaySprite(frame.shape, lambda image: self.draw_keypoints(image, keypoints))
+            self.keypoints_sprite = (sprite_key, sprite)
+
+        return sprite.draw(frame)
@@ -0,0 +1 @@
+from .detection_cache import DetectionCache, get_stub_key
@@ -0,0 +1,237 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import numpy as np
+
+# Hashes of files, keyed by (path, size, modification time) so every file is
+# only hashed once per process as long as it doesn't change
+file_hashes = {}
+
+def hash_file(path):
+    """
+    Returns the hex digest of a file's contents, e.g. model weights or a video.
+
+    :param path: path to the file
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+    if key not in file_hashes:
+        file_hash = hashlib.blake2b(digest_size=16)
+
+        with open(path, "rb") as f:
+            # Read in 1 MB blocks so large files aren't loaded at once
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                file_hash.update(block)
+
+        file_hashes[key] = file_hash.hexdigest()
+
+    return file_hashes[key]
+
+def get_stub_key(video_path, model_path, params):
+    """
+    Returns the key of a tracker stub, which changes whenever the video, the model
+    weights or any of the detection parameters change, see Detections.is_saved.
+
+    :param video_path: path to the video the detections are of
+    :param model_path: path to the model weights
+    :param params: dictionary of detection parameters, e.g. {"detection_size": 640}
+    """
+    stub = {
+        "video": hash_file(video_path),
+        "model": hash_file(model_path),
+        "params": params
+    }
+
+    return hashlib.blake2b(json.dumps(stub, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+class DetectionCache:
+    """
+    On-disk, content-addressed cache of per-frame model outputs.
+
+    Every entry is keyed by a namespace (a hash of the model weights, the kind
+    of detector and its inference parameters, e.g. conf=0.15) and a hash of the
+    decoded frame's pixels. Because frames are addressed by content rather than
+    by video path and frame number, rerunning a different video or model never
+    reuses stale results, while a trimmed or extended clip reuses every frame it
+    shares with a previous run and only runs inference on the new frames.
+
+    Entries live in a SQLite database and the least recently used ones are
+    evicted once the cache grows past max_size_bytes.
+    """
+    def __init__(self, cache_dir="detection_cache_data", max_size_bytes=1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # A generous timeout lets several processes share the cache
+        self.connection = sqlite3.connect(os.path.join(cache_dir, "cache.sqlite"), timeout=60)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                namespace TEXT NOT NULL,
+                frame_hash BLOB NOT NULL,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (namespace, frame_hash)
+            )
+        """)
+        self.connection.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+        self.connection.commit()
+
+    def get_namespace(self, kind, model_path, params):
+        """
+        Returns the namespace of a detector, which changes whenever the model
+        weights or any of the inference parameters change.
+
+        :param kind: name of the detector, e.g. "ball"
+        :param model_path: path to the model weights
+        :param params: dictionary of inference parameters, e.g. {"conf": 0.15}
+        """
+        namespace = {
+            "kind": kind,
+            "model": hash_file(model_path),
+            "params": params
+        }
+
+        return hashlib.blake2b(json.dumps(namespace, sort_keys=True).encode(), digest_size=16).hexdigest()
+
+    @staticmethod
+    def hash_frame(frame):
+        """
+        Returns the digest of a frame's shape and pixels.
+
+        :param frame: a NumPy array representing a single video frame
+        """
+        frame_hash = hashlib.blake2b(str(frame.shape).encode(), digest_size=16)
+        frame_hash.update(np.ascontiguousarray(frame).data)
+
+        return frame_hash.digest()
+
+    def get_many(self, namespace, frame_hashes):
+        """
+        Returns the cached values for the given frames, None where a frame
+        isn't cached.
+
+        :param namespace: namespace returned by get_namespace
+        :param frame_hashes: list of frame hashes returned by hash_frame
+        """
+        values = {}
+
+        for frame_hash in set(frame_hashes):
+            row = self.connection.execute("SELECT value FROM entries WHERE namespace = ? AND frame_hash = ?",
+                                          (namespace, frame_hash)).fetchone()
+
+            if row is not None:
+                values[frame_hash] = row[0]
+
+        # Mark the hits as recently used so they are evicted last
+        now = time.time()
+        self.connection.executemany("UPDATE entries SET last_access = ? WHERE namespace = ? AND frame_hash = ?",
+                                    [(now, namespace, frame_hash) for frame_hash in values])
+        self.connection.commit()
+
+        return [values.get(frame_hash) for frame_hash in frame_hashes]
+
+    def put_many(self, namespace, frame_hashes, values):
+        """
+        Stores values for the given frames and evicts the least recently used
+        entries if the cache grew past its size limit.
+
+        :param namespace: namespace returned by get_namespace
+        :param frame_hashes: list of frame hashes returned by hash_frame
+        :param values: list of bytes, one per frame
+        """
+        now = time.time()
+        self.connection.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                                    [(namespace, frame_hash, value, len(value), now)
+                                     for frame_hash, value in zip(frame_hashes, values)])
+        self.connection.commit()
+
+        self.evict()
+
+    def evict(self):
+        """
+        Deletes the least recently used entries until the cache fits in max_size_bytes.
+        """
+        total_size = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+        if total_size <= self.max_size_bytes:
+            return
+
+        rows = self.connection.execute("SELECT namespace, frame_hash, size FROM entries ORDER BY last_access")
+        evicted = []
+
+        for namespace, frame_hash, size in rows:
+            if total_size <= self.max_size_bytes:
+                break
+
+            evicted.append((namespace, frame_hash))
+            total_size -= size
+
+        self.connection.executemany("DELETE FROM entries WHERE namespace = ? AND frame_hash = ?", evicted)
+        self.connection.commit()
+
+    def lookup_or_compute(self, namespace, frames, compute, encode, decode):
+        """
+        Returns one result per frame, taking cached results where possible and
+        calling compute once on all frames that aren't cached.
+
+        :param namespace: namespace returned by get_namespace
+        :param frames: list of NumPy arrays representing video frames
+        :param compute: function taking a list of frames and returning one result per frame
+        :param encode: function converting a result to bytes
+        :param decode: function converting bytes back to a result
+        """
+        frame_hashes = [self.hash_frame(frame) for frame in frames]
+        cached_values = self.get_many(namespace, frame_hashes)
+        results = [None if value is None else decode(value) for value in cached_values]
+
+        missing_indices = [i for i, value in enumerate(cached_values) if value is None]
+
+        if missing_indices:
+            computed_results = compute([frames[i] for i in missing_indices])
+
+            for i, result in zip(missing_indices, computed_results):
+                results[i] = result
+
+            self.put_many(namespace,
+                          [frame_hashes[i] for i in missing_indices],
+                          [encode(result) for result in computed_results])
+
+        return results
+
+    @staticmethod
+    def encode_detections(detection_dict):
+        """
+        Returns a dictionary of IDs to bounding boxes as bytes.
+        """
+        rows = [[track_id, *bounding_box] for track_id, bounding_box in detection_dict.items()]
+
+        return np.array(rows, dtype=np.float64).reshape(-1, 5).tobytes()
+
+    @staticmethod
+    def decode_detections(value):
+        """
+        Returns the dictionary of IDs to bounding boxes encoded by encode_detections.
+        """
+        rows = np.frombuffer(value, dtype=np.float64).reshape(-1, 5)
+
+        return {int(row[0]): row[1:].tolist() for row in rows}
+
+    @staticmethod
+    def encode_rows(rows):
+        """
+        Returns a 2D array of numbers, e.g. boxes with their confidence and class, as bytes.
+        """
+        return np.ascontiguousarray(rows, dtype=np.float64).tobytes()
+
+    @staticmethod
+    def decode_rows(value, num_columns):
+        """
+        Returns the (N, num_columns) array encoded by encode_rows.
+        """
+        return np.frombuffer(value, dtype=np.float64).reshape(-1, num_columns)
@@ -0,0 +1 @@
+from .stage_profiler import StageProfiler, profiler, profile_stage, profiled
@@ -0,0 +1,332 @@
+import cProfile
+import json
+import os
+import threading
+import time
+from functools import wraps
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, peak memory isn't reported there
+    resource = None
+
+def get_peak_rss_bytes():
+    """
+    Returns the largest resident set size of the process so far, None where unknown.
+    """
+    if resource is None:
+        return None
+
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class StageStats:
+    """
+    Counters of one stage, summed over all its calls.
+    """
+    def __init__(self):
+        self.calls = 0
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.frames = 0
+
+        # Process peak after the stage, and how much the stage raised it
+        self.peak_rss_bytes = None
+        self.rss_increase_bytes = 0
+
+class Stage:
+    """
+    A running stage, returned by StageProfiler.stage.
+    """
+    def __init__(self, profiler, name, frames):
+        self.profiler = profiler
+        self.name = name
+        self.frames = frames or 0
+
+    def add_frames(self, num_frames):
+        """
+        Counts frames the stage processed, for stages that only know how many at the end.
+        """
+        self.frames += num_frames
+
+    def __enter__(self):
+        stack = self.profiler.get_stack()
+        stack.append(self.name)
+        self.path = "/".join(stack)
+        self.profiler.register(self.path)
+
+        self.start_rss = get_peak_rss_bytes()
+        self.start_cpu = time.thread_time()
+        self.start_wall = time.perf_counter()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall_seconds = time.perf_counter() - self.start_wall
+        cpu_seconds = time.thread_time() - self.start_cpu
+        peak_rss = get_peak_rss_bytes()
+
+        self.profiler.get_stack().pop()
+        self.profiler.record(self.path, wall_seconds, cpu_seconds, self.frames, self.start_rss, peak_rss)
+
+class NullStage:
+    """
+    Stands in for Stage while profiling is off.
+    """
+    def add_frames(self, num_frames):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+NULL_STAGE = NullStage()
+
+class StageProfiler:
+    """
+    Collects wall time, CPU time, frames/sec and peak memory of named pipeline
+    stages. Stages nest, a stage started inside another one is recorded under
+    "outer/inner", separately per thread. CPU time is that of the thread
+    running the stage, so work done by other threads (decoding, encoding,
+    PyTorch's thread pool) shows up in their own stages or not at all.
+    Worker processes (--workers, --manifest) have profilers of their own that
+    aren't collected, only the main process is reported.
+
+    While disabled, stage() and functions decorated with profiled() only
+    check a flag, so the instrumentation can stay in place.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.stats = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.cprofile = None
+        self.start_time = None
+
+    def enable(self, cprofile=False):
+        """
+        Starts collecting stage counters, and with cprofile a cProfile of the
+        calling thread as well. Enabling again keeps the counters and only
+        starts cProfile if asked to.
+        """
+        if not self.enabled:
+            self.enabled = True
+            self.start_time = time.perf_counter()
+
+        if cprofile and self.cprofile is None:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    def disable(self):
+        self.enabled = False
+
+        if self.cprofile is not None:
+            self.cprofile.disable()
+
+    def reset(self):
+        """
+        Drops all counters collected so far.
+        """
+        with self.lock:
+            self.stats = {}
+
+    def get_stack(self):
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+
+        return self.local.stack
+
+    def stage(self, name, frames=None):
+        """
+        Returns a context manager measuring the code inside it as a stage.
+
+        :param name: name of the stage
+        :param frames: number of frames the stage processes, if known up front
+        """
+        if not self.enabled:
+            return NULL_STAGE
+
+        return Stage(self, name, frames)
+
+    def register(self, path):
+        """
+        Adds a stage when it's first entered, so stages are reported in the order they started.
+        """
+        if path not in self.stats:
+            with self.lock:
+                self.stats.setdefault(path, StageStats())
+
+    def record(self, path, wall_seconds, cpu_seconds, frames, start_rss, peak_rss):
+        with self.lock:
+            stats = self.stats.setdefault(path, StageStats())
+            stats.calls += 1
+            stats.wall_seconds += wall_seconds
+            stats.cpu_seconds += cpu_seconds
+            stats.frames += frames
+
+            if peak_rss is not None:
+                stats.peak_rss_bytes = max(stats.peak_rss_bytes or 0, peak_rss)
+                stats.rss_increase_bytes += peak_rss - start_rss
+
+    def get_report(self):
+        """
+        Returns a dictionary with the counters of every stage, in the order the
+        stages were first entered. self_seconds is the wall time not spent in
+        a nested stage.
+        """
+        with self.lock:
+            stats = dict(self.stats)
+
+        stages = []
+
+        for path, stage_stats in stats.items():
+            child_seconds = sum(child_stats.wall_seconds for child_path, child_stats in stats.items()
+                                if child_path.startswith(path + "/") and "/" not in child_path[len(path) + 1:])
+
+            stages.append({
+                "stage": path,
+                "calls": stage_stats.calls,
+                "wall_seconds": stage_stats.wall_seconds,
+                "self_seconds": max(stage_stats.wall_seconds - child_seconds, 0.0),
+                "cpu_seconds": stage_stats.cpu_seconds,
+                "frames": stage_stats.frames,
+                "frames_per_second": (stage_stats.frames / stage_stats.wall_seconds
+                                      if stage_stats.frames and stage_stats.wall_seconds > 0 else None),
+                "peak_rss_mb": (stage_stats.peak_rss_bytes / 1024 ** 2
+                                if stage_stats.peak_rss_bytes is not None else None),
+                "rss_increase_mb": stage_stats.rss_increase_bytes / 1024 ** 2
+            })
+
+        peak_rss = get_peak_rss_bytes()
+
+        return {
+            "total_seconds": time.perf_counter() - self.start_time if self.start_time is not None else None,
+            "peak_rss_mb": peak_rss / 1024 ** 2 if peak_rss is not None else None,
+            "stages": stages
+        }
+
+    def get_prometheus_text(self, report=None):
+        """
+        Returns the counters in the Prometheus text exposition format.
+        """
+        report = report or self.get_report()
+        metrics = [("tennis_stage_calls_total", "counter", "Number of times a pipeline stage ran", "calls"),
+                   ("tennis_stage_wall_seconds_total", "counter", "Wall time spent in a pipeline stage", "wall_seconds"),
+                   ("tennis_stage_self_seconds_total", "counter",
+                    "Wall time spent in a pipeline stage outside its nested stages", "self_seconds"),
+                   ("tennis_stage_cpu_seconds_total", "counter", "CPU time of the thread running a pipeline stage",
+                    "cpu_seconds"),
+                   ("tennis_stage_frames_total", "counter", "Frames processed by a pipeline stage", "frames"),
+                   ("tennis_stage_peak_rss_megabytes", "gauge", "Process peak memory after a pipeline stage",
+                    "peak_rss_mb")]
+        lines = []
+
+        for metric, metric_type, description, key in metrics:
+            lines.append(f"# HELP {metric} {description}")
+            lines.append(f"# TYPE {metric} {metric_type}")
+
+            for stage in report["stages"]:
+                if stage[key] is not None:
+                    lines.append(f'{metric}{{stage="{stage["stage"]}"}} {stage[key]}')
+
+        if report["peak_rss_mb"] is not None:
+            lines.append("# HELP tennis_peak_rss_megabytes Process peak memory")
+            lines.append("# TYPE tennis_peak_rss_megabytes gauge")
+            lines.append(f"tennis_peak_rss_megabytes {report['peak_rss_mb']}")
+
+        return "\n".join(lines) + "\n"
+
+    def get_folded_stacks(self, report=None):
+        """
+        Returns the stages as folded stacks ("outer;inner microseconds" per line) of
+        their self time, which flamegraph.pl and speedscope turn into a flame graph.
+        """
+        report = report or self.get_report()
+
+        return "".join(f"{stage['stage'].replace('/', ';')} {int(stage['self_seconds'] * 1e6)}\n"
+                       for stage in report["stages"])
+
+    def write_reports(self, output_dir):
+        """
+        Writes report.json, metrics.prom, stages.folded and, when cProfile was on,
+        profile.prof (for pstats or snakeviz) to output_dir and prints a summary.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        report = self.get_report()
+
+        with open(os.path.join(output_dir, "report.json"), "w") as f:
+            json.dump(report, f, indent=2)
+
+        with open(os.path.join(output_dir, "metrics.prom"), "w") as f:
+            f.write(self.get_prometheus_text(report))
+
+        with open(os.path.join(output_dir, "stages.folded"), "w") as f:
+            f.write(self.get_folded_stacks(report))
+
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            self.cprofile.dump_stats(os.path.join(output_dir, "profile.prof"))
+
+        print_report(report)
+
+def print_report(report):
+    """
+    Prints a table of the stages, nested stages indented under their parent.
+    """
+    print(f"{'stage':<56}{'calls':>7}{'wall s':>9}{'self s':>9}{'cpu s':>9}{'frames/s':>10}{'+rss MB':>9}")
+
+    for stage in report["stages"]:
+        depth = stage["stage"].count("/")
+        name = "  " * depth + stage["stage"].rsplit("/", 1)[-1]
+        frames_per_second = f"{stage['frames_per_second']:.1f}" if stage["frames_per_second"] is not None else "-"
+
+        print(f"{name:<56}{stage['calls']:>7}{stage['wall_seconds']:>9.2f}{stage['self_seconds']:>9.2f}"
+              f"{stage['cpu_seconds']:>9.2f}{frames_per_second:>10}{stage['rss_increase_mb']:>9.1f}")
+
+    if report["total_seconds"] is not None:
+        print(f"total {report['total_seconds']:.2f} s, peak RSS {report['peak_rss_mb'] or 0:.0f} MB")
+
+# Profiler of the process, enabled from the start when TENNIS_PROFILE is set
+profiler = StageProfiler()
+
+if os.environ.get("TENNIS_PROFILE"):
+    profiler.enable()
+
+def profile_stage(name, frames=None):
+    """
+    Returns a context manager measuring the code inside it as a stage of the
+    process's profiler, see StageProfiler.stage.
+    """
+    return profiler.stage(name, frames)
+
+def profiled(name, frames=None):
+    """
+    Decorator measuring every call of a function as a stage.
+
+    :param name: name of the stage
+    :param frames: how many frames a call processes, None for no count, "result" for
+                   the length of the return value or the index of the positional
+                   argument (self included) whose length is the count
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return function(*args, **kwargs)
+
+            with profiler.stage(name) as stage:
+                result = function(*args, **kwargs)
+
+                if frames == "result":
+                    stage.add_frames(len(result))
+                elif frames is not None and len(args) > frames:
+                    stage.add_frames(len(args[frames]))
+
+                return result
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,4 @@
+from .live import run_live
+from .live_analyzer import LiveAnalyzer
+from .frame_queue import FrameQueue, DROP_POLICIES
+from .latency_stats import LatencyStats
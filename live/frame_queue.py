@@ -0,0 +1,105 @@
+import queue
+
+# What put() does when the queue is full
+DROP_POLICIES = ["block", "drop_oldest", "drop_newest"]
+
+class FrameQueue:
+    """
+    Bounded queue between two stages of the live pipeline. When the consumer
+    falls behind, the drop policy decides what happens to new items:
+
+    block: wait for space, nothing is dropped but the producer slows down
+    drop_oldest: discard the oldest queued item, keeps latency lowest
+    drop_newest: discard the new item, keeps the queued items
+    """
+    def __init__(self, maxsize, drop_policy="block", stop_event=None):
+        """
+        :param maxsize: maximum number of queued items
+        :param drop_policy: one of DROP_POLICIES
+        :param stop_event: optional threading.Event, set when the pipeline is shutting
+                           down so a blocked put gives up instead of waiting forever
+        """
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy: {drop_policy}")
+
+        self.queue = queue.Queue(maxsize)
+        self.drop_policy = drop_policy
+        self.stop_event = stop_event
+        self.num_dropped = 0
+
+    def put(self, item):
+        """
+        Adds an item, dropping one if the queue is full and the policy allows it.
+        """
+        if self.drop_policy == "block":
+            self.put_blocking(item)
+            return
+
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except queue.Full:
+                if self.drop_policy == "drop_newest":
+                    self.num_dropped += 1
+                    return
+
+            # drop_oldest makes room by discarding the item at the front
+            try:
+                self.queue.get_nowait()
+                self.num_dropped += 1
+            except queue.Empty:
+                pass
+
+    def put_blocking(self, item):
+        """
+        Adds an item, waiting for space no matter the drop policy.
+        """
+        while True:
+            try:
+                self.queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                if self.stop_event is not None and self.stop_event.is_set():
+                    return
+
+    def put_end(self):
+        """
+        Marks the end of the stream, get() returns None once the items before it are
+        consumed. The marker always gets queued, when shutting down queued items are
+        discarded to make room for it.
+        """
+        while True:
+            try:
+                self.queue.put(None, timeout=0.1)
+                return
+            except queue.Full:
+                if self.stop_event is not None and self.stop_event.is_set():
+                    try:
+                        self.queue.get_nowait()
+                    except queue.Empty:
+                        pass
+
+    def get(self):
+        """
+        Returns the next item, waiting until one arrives.
+        """
+        return self.queue.get()
+
+    def get_nowait(self, max_items):
+        """
+        Returns up to max_items items that are already queued without waiting.
+        The end of stream marker (None) is included if reached.
+        """
+        items = []
+
+        while len(items) < max_items:
+            try:
+                items.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+
+            if items[-1] is None:
+                break
+
+        return items
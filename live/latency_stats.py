@@ -0,0 +1,50 @@
+from collections import deque
+import threading
+import numpy as np
+
+class LatencyStats:
+    """
+    Collects how long each stage of the live pipeline took per frame and
+    summarizes the most recent samples.
+    """
+    def __init__(self, max_samples=1000):
+        """
+        :param max_samples: number of most recent samples kept per stage
+        """
+        self.max_samples = max_samples
+
+        # Stage name to recent durations in seconds, in the order stages were first seen
+        self.samples = {}
+        self.num_frames = 0
+        self.lock = threading.Lock()
+
+    def add_frame(self, durations):
+        """
+        Records the stage durations of one frame.
+
+        :param durations: dictionary of stage names to durations in seconds
+        """
+        with self.lock:
+            self.num_frames += 1
+
+            for stage, duration in durations.items():
+                self.samples.setdefault(stage, deque(maxlen=self.max_samples)).append(duration)
+
+    def report(self, num_dropped=0):
+        """
+        Returns a text summary with the mean, median, 95th percentile and
+        maximum of each stage in milliseconds.
+
+        :param num_dropped: number of frames dropped so far, included in the summary
+        """
+        with self.lock:
+            lines = [f"{self.num_frames} frames rendered, {num_dropped} dropped"]
+
+            for stage, durations in self.samples.items():
+                durations = np.array(durations) * 1000
+                lines.append(f"  {stage:<12} mean {durations.mean():7.1f} ms  "
+                             f"p50 {np.percentile(durations, 50):7.1f} ms  "
+                             f"p95 {np.percentile(durations, 95):7.1f} ms  "
+                             f"max {durations.max():7.1f} ms")
+
+        return "\n".join(lines)
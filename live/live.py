@@ -0,0 +1,271 @@
+import threading
+import time
+import cv2
+from utils import save_video, FrameScaler
+from mini_court import MiniCourt
+from pipeline import load_models
+from trackers import CourtTracker
+from .frame_queue import FrameQueue
+from .latency_stats import LatencyStats
+from .live_analyzer import LiveAnalyzer
+
+def open_source(source):
+    """
+    Opens a live source with OpenCV. A number opens that webcam, anything else
+    is passed on as a file path or stream URL (e.g. rtsp://...).
+    """
+    if isinstance(source, int) or source.isdigit():
+        return cv2.VideoCapture(int(source))
+
+    return cv2.VideoCapture(source)
+
+def capture_frames(source, capture_queue, stream_info, stop_event, realtime=False, max_frames=None):
+    """
+    Capture thread. Reads frames from the source and queues (frame number, frame,
+    timestamps) until the source ends or the pipeline stops.
+
+    :param realtime: replay a file at its frame rate instead of as fast as possible,
+                     to test the live mode without a live source
+    """
+    cap = None
+
+    try:
+        cap = open_source(source)
+
+        # Live sources don't always report a frame rate
+        stream_info["fps"] = cap.get(cv2.CAP_PROP_FPS) or 24
+        stream_info["ready"].set()
+
+        start_time = time.perf_counter()
+        frame_num = 0
+
+        while not stop_event.is_set() and (max_frames is None or frame_num < max_frames):
+            if realtime:
+                delay = start_time + frame_num / stream_info["fps"] - time.perf_counter()
+
+                if delay > 0:
+                    time.sleep(delay)
+
+            ret, frame = cap.read()
+
+            if not ret:
+                break
+
+            capture_queue.put((frame_num, frame, {"captured": time.perf_counter()}))
+            frame_num += 1
+    finally:
+        # The other threads wait for the frame rate and the end of the stream even
+        # if the source failed to open
+        stream_info.setdefault("fps", 24)
+        stream_info["ready"].set()
+
+        if cap is not None:
+            cap.release()
+
+        capture_queue.put_end()
+
+def detect_frames(capture_queue, result_queue, player_tracker, ball_tracker, court_line_detector, batch_size=1,
+                  static_court=False, court_change_threshold=0.4, detection_size=None):
+    """
+    Detection thread. Runs the models on batches of whatever frames are queued,
+    up to batch_size, and queues the frames with their raw detections and court keypoints.
+
+    :param static_court: only predict the court keypoints on the first frame
+    :param court_change_threshold: frame difference above which the court keypoints
+                                   are looked up again, see CourtTracker
+    :param detection_size: longest side in pixels of the downscaled frames the models run on,
+                           see FrameScaler
+    """
+    # The models run on one downscaled copy of each frame, the queued source frames
+    # are only used for rendering
+    frame_scaler = FrameScaler(detection_size)
+
+    # A fixed court never changes view, so its keypoints are only predicted on the first frame
+    court_tracker = CourtTracker(court_line_detector,
+                                 change_threshold=float("inf") if static_court else court_change_threshold,
+                                 frame_scaler=frame_scaler)
+    end_of_stream = False
+
+    try:
+        while not end_of_stream:
+            items = [capture_queue.get()]
+            items.extend(capture_queue.get_nowait(batch_size - 1))
+
+            if items[-1] is None:
+                end_of_stream = True
+                items.pop()
+
+            if not items:
+                break
+
+            detect_start_time = time.perf_counter()
+            frames = [frame_scaler.downscale(frame) for _, frame, _ in items]
+
+            # Court keypoints are looked up again whenever the camera view changes
+            court_keypoints = [court_tracker.update(frame_num, frame) for (frame_num, _, _), frame in zip(items, frames)]
+
+            player_dicts = frame_scaler.remap_dicts(player_tracker.detect_batch(frames))
+            ball_dicts = frame_scaler.remap_dicts(
+                ball_tracker.detect_batch(frames, frame_nums=[frame_num for frame_num, _, _ in items]))
+            detect_end_time = time.perf_counter()
+
+            for item, player_dict, ball_dict, frame_court_keypoints in zip(items, player_dicts, ball_dicts,
+                                                                            court_keypoints):
+                frame_num, frame, timestamps = item
+                timestamps["detect_start"] = detect_start_time
+                timestamps["detected"] = detect_end_time
+                result_queue.put((frame_num, frame, player_dict, ball_dict, frame_court_keypoints, timestamps))
+    finally:
+        result_queue.put_end()
+
+def render_frames(result_queue, player_tracker, ball_tracker, court_line_detector, latency_stats,
+                  projection="homography", max_interpolation_gap=12, fps=24):
+    """
+    Generator run by the render thread. Analyzes and annotates the detected
+    frames in order and yields them once complete.
+    """
+    analyzer = None
+
+    while True:
+        item = result_queue.get()
+
+        if item is None:
+            completed_frames = analyzer.flush() if analyzer is not None else []
+        else:
+            frame_num, frame, player_dict, ball_dict, court_keypoints, timestamps = item
+
+            # The mini court is placed relative to the frame size
+            if analyzer is None:
+                analyzer = LiveAnalyzer(player_tracker, ball_tracker, court_line_detector,
+                                        MiniCourt(frame),
+                                        projection=projection,
+                                        max_interpolation_gap=max_interpolation_gap,
+                                        fps=fps)
+
+            completed_frames = analyzer.add(frame_num, frame, player_dict, ball_dict, court_keypoints, info=timestamps)
+
+        for _, frame, timestamps in completed_frames:
+            rendered_time = time.perf_counter()
+            latency_stats.add_frame({
+                "queue wait": timestamps["detect_start"] - timestamps["captured"],
+                "detection": timestamps["detected"] - timestamps["detect_start"],
+                "render": rendered_time - timestamps["detected"],
+                "end to end": rendered_time - timestamps["captured"]
+            })
+
+            yield frame
+
+        if item is None:
+            return
+
+def run_live(source, output_video_path, player_model_path, ball_model_path, court_model_path,
+             realtime=False, queue_size=8, drop_policy="drop_oldest", batch_size=1,
+             projection="homography", max_interpolation_gap=12, report_interval=5.0, max_frames=None,
+             static_court=False, court_change_threshold=0.4, court_backend="eager", num_threads=None,
+             ball_roi_tracking=False, player_model_format="pytorch", ball_model_format="pytorch",
+             detection_size=None, codec="MJPG", fps=None):
+    """
+    Runs the analysis on a live source with separate capture, detection and
+    render threads connected by bounded queues, so a slow stage never makes
+    the others wait for more than a queue's worth of frames. When detection
+    falls behind the capture, frames are dropped according to drop_policy.
+    Latency of every stage is printed every report_interval seconds and at the end.
+
+    :param source: webcam number, file path or stream URL (e.g. rtsp://...)
+    :param output_video_path: path of the annotated video to write, None to only analyze
+    :param realtime: replay a file at its frame rate, to test without a live source
+    :param queue_size: maximum number of frames waiting between two stages
+    :param drop_policy: what happens to new frames when detection falls behind
+                        ("block", "drop_oldest" or "drop_newest")
+    :param batch_size: maximum number of queued frames passed through the models at once
+    :param projection: how positions are mapped onto the mini court ("height" or "homography")
+    :param max_interpolation_gap: maximum number of frames held back waiting for the ball
+    :param report_interval: seconds between latency reports, None for only the final one
+    :param max_frames: stop after this many frames, None runs until the source ends
+    :param static_court: only predict the court keypoints on the first frame
+    :param court_change_threshold: frame difference above which the camera view counts
+                                   as changed and the court keypoints are looked up again
+    :param court_backend: how the court keypoints CNN is run ("eager", "torchscript" or "onnx")
+    :param num_threads: number of CPU threads used for inference, None keeps the default
+    :param ball_roi_tracking: only detect the ball in a region around its predicted position
+    :param player_model_format: how the player YOLO weights are run ("pytorch", "onnx" or "onnx_int8")
+    :param ball_model_format: how the ball YOLO weights are run ("pytorch", "onnx" or "onnx_int8")
+    :param detection_size: longest side in pixels of the downscaled frames the models run on,
+                           None runs them on the source frames, see FrameScaler
+    :param codec: codec of the annotated video, see save_video
+    :param fps: frame rate of the annotated video, None uses the source's
+    """
+    player_tracker, ball_tracker, court_line_detector = load_models(player_model_path,
+                                                                    ball_model_path,
+                                                                    court_model_path,
+                                                                    court_backend=court_backend,
+                                                                    num_threads=num_threads,
+                                                                    ball_roi_tracking=ball_roi_tracking,
+                                                                    player_model_format=player_model_format,
+                                                                    ball_model_format=ball_model_format)
+
+    stop_event = threading.Event()
+    capture_queue = FrameQueue(queue_size, drop_policy, stop_event=stop_event)
+    result_queue = FrameQueue(queue_size, "block", stop_event=stop_event)
+    latency_stats = LatencyStats()
+    stream_info = {"ready": threading.Event()}
+    errors = []
+
+    def run_stage(target, *args, **kwargs):
+        # Any failing stage stops the whole pipeline, the error is raised at the end
+        try:
+            target(*args, **kwargs)
+        except Exception as error:
+            errors.append(error)
+            stop_event.set()
+
+    def render():
+        rendered_frames = render_frames(result_queue, player_tracker, ball_tracker, court_line_detector,
+                                        latency_stats,
+                                        projection=projection,
+                                        max_interpolation_gap=max_interpolation_gap,
+                                        fps=stream_info["fps"])
+
+        if output_video_path is None:
+            for _ in rendered_frames:
+                pass
+        else:
+            save_video(rendered_frames, output_video_path, fps=fps or stream_info["fps"], codec=codec)
+
+    capture_thread = threading.Thread(target=run_stage,
+                                      args=(capture_frames, source, capture_queue, stream_info, stop_event),
+                                      kwargs={"realtime": realtime, "max_frames": max_frames})
+    detect_thread = threading.Thread(target=run_stage,
+                                     args=(detect_frames, capture_queue, result_queue,
+                                           player_tracker, ball_tracker, court_line_detector),
+                                     kwargs={"batch_size": batch_size,
+                                             "static_court": static_court,
+                                             "court_change_threshold": court_change_threshold,
+                                             "detection_size": detection_size})
+    render_thread = threading.Thread(target=run_stage, args=(render,))
+
+    capture_thread.start()
+    stream_info["ready"].wait()
+    detect_thread.start()
+    render_thread.start()
+
+    try:
+        while render_thread.is_alive():
+            render_thread.join(timeout=report_interval)
+
+            if report_interval is not None and render_thread.is_alive():
+                print(latency_stats.report(capture_queue.num_dropped))
+    except KeyboardInterrupt:
+        # Stop capturing, the frames already captured still get rendered
+        stop_event.set()
+        render_thread.join()
+
+    capture_thread.join()
+    detect_thread.join()
+
+    print(latency_stats.report(capture_queue.num_dropped))
+
+    if errors:
+        raise errors[0]
+
+    return latency_stats
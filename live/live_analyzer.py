@@ -0,0 +1,149 @@
+from collections import OrderedDict, deque
+from trackers import OnlineBallInterpolator, OnlineBallHitDetector
+from player_stats import PlayerStats
+from pipeline import draw_annotations
+from utils import Detections
+
+class LiveAnalyzer:
+    """
+    Online counterpart of analyze_detections and annotate_frames. Frames and
+    their raw detections go in one at a time and annotated frames come out in
+    order, held back only as long as the ball interpolation needs to look ahead.
+    Ball hits are confirmed a fixed number of frames late, so the stats panel
+    updates shortly after each shot instead of holding back frames.
+    """
+    def __init__(self, player_tracker, ball_tracker, court_line_detector, mini_court,
+                 projection="homography", max_interpolation_gap=12, fps=24):
+        """
+        :param player_tracker: PlayerTracker object
+        :param ball_tracker: BallTracker object
+        :param court_line_detector: CourtLineDetector object
+        :param mini_court: MiniCourt object
+        :param projection: how positions are mapped onto the mini court ("height" or "homography").
+                           "height" only sees the players' heights in past frames
+        :param max_interpolation_gap: maximum number of frames held back waiting for the ball
+        :param fps: frame rate of the stream, used for the speeds
+        """
+        self.player_tracker = player_tracker
+        self.ball_tracker = ball_tracker
+        self.court_line_detector = court_line_detector
+        self.mini_court = mini_court
+        self.projection = projection
+
+        self.ball_interpolator = OnlineBallInterpolator(max_gap=max_interpolation_gap)
+        self.ball_hit_detector = OnlineBallHitDetector()
+        self.player_stats = PlayerStats(mini_court.get_mini_court_width(), fps=fps)
+        self.ball_hit_frames = []
+
+        # Tracker IDs of the two actual players to the IDs 1 and 2 MiniCourt and
+        # PlayerStats expect, picked on the first frame both are detected
+        self.player_ids = None
+
+        # Frame number to (frame, player dictionary, court keypoints, info) of frames waiting for the ball
+        self.pending_frames = {}
+
+        # Player detections of the frames before the current one, the "height"
+        # projection takes the players' heights from them
+        self.recent_player_detections = deque(maxlen=20)
+
+        # Frame number to (player positions, ball position) on the mini court, kept
+        # until ball hits in those frames can no longer be confirmed
+        self.mini_court_positions = OrderedDict()
+
+    def add(self, frame_num, frame, player_dict, ball_dict, court_keypoints, info=None):
+        """
+        Adds a frame and its raw detections. Returns the list of (frame number,
+        annotated frame, info) of the frames that are complete, in order.
+
+        :param frame_num: frame number, increasing with every call
+        :param frame: NumPy array representing the video frame
+        :param player_dict: dictionary of player IDs to bounding box coordinates
+        :param ball_dict: dictionary of the ball's ID to bounding box coordinates
+        :param court_keypoints: flat array of the court keypoint coordinates in this frame
+        :param info: anything to pass along with the frame (e.g. timestamps)
+        """
+        self.pending_frames[frame_num] = (frame, self.filter_players(player_dict, court_keypoints), court_keypoints, info)
+
+        return [self.complete_frame(ready_frame_num, ready_ball_dict)
+                for ready_frame_num, ready_ball_dict in self.ball_interpolator.add(frame_num, ball_dict)]
+
+    def flush(self):
+        """
+        Completes the frames still held back, called at the end of a stream.
+        """
+        return [self.complete_frame(ready_frame_num, ready_ball_dict)
+                for ready_frame_num, ready_ball_dict in self.ball_interpolator.flush()]
+
+    def filter_players(self, player_dict, court_keypoints):
+        """
+        Returns the detections of the two actual players with the IDs 1 and 2, see
+        PlayerTracker.filter_players. Like there, the player with the smaller
+        tracker ID becomes player 1.
+        """
+        if self.player_ids is None:
+            if len(player_dict) < 2:
+                return {}
+
+            picked_ids = self.player_tracker.filter_players_helper(court_keypoints, player_dict)
+            self.player_ids = {track_id: player_id for player_id, track_id in enumerate(sorted(picked_ids), start=1)}
+
+        return {self.player_ids[id]: bounding_box for id, bounding_box in player_dict.items() if id in self.player_ids}
+
+    def convert_to_mini_court(self, player_dict, ball_dict, court_keypoints):
+        """
+        Returns the (player positions, ball position) dictionaries of the current frame on the mini court.
+        """
+        player_detections = [*self.recent_player_detections, player_dict] if self.projection == "height" else [player_dict]
+        ball_detections = [{}] * (len(player_detections) - 1) + [ball_dict]
+
+        player_positions, ball_positions = self.mini_court.convert_bounding_boxes_to_mini_court_coordinates(
+            Detections.from_dicts(player_detections),
+            Detections.from_dicts(ball_detections),
+            court_keypoints,
+            projection=self.projection)
+
+        self.recent_player_detections.append(player_dict)
+
+        return player_positions[-1], ball_positions[-1]
+
+    def complete_frame(self, frame_num, ball_dict):
+        """
+        Runs the analysis of a frame whose ball position is known and annotates it.
+        """
+        frame, player_dict, court_keypoints, info = self.pending_frames.pop(frame_num)
+
+        player_positions, ball_position = self.convert_to_mini_court(player_dict, ball_dict, court_keypoints)
+        self.mini_court_positions[frame_num] = (player_positions, ball_position)
+
+        hit_frame = self.ball_hit_detector.add(frame_num, ball_dict)
+
+        if hit_frame is not None:
+            self.add_ball_hit(hit_frame)
+
+        # Positions older than the hit window are never needed again
+        while len(self.mini_court_positions) > self.ball_hit_detector.hit_window + 1:
+            self.mini_court_positions.popitem(last=False)
+
+        stats = self.player_stats.get_stats(frame_num)
+
+        draw_annotations([frame], frame_num,
+                         self.player_tracker, self.ball_tracker, self.court_line_detector, self.mini_court,
+                         court_keypoints,
+                         Detections.from_dicts([player_dict]),
+                         Detections.from_dicts([ball_dict]),
+                         Detections.from_dicts([player_positions], num_coords=2),
+                         Detections.from_dicts([ball_position], num_coords=2),
+                         {name: [value] for name, value in stats.items()})
+
+        return frame_num, frame, info
+
+    def add_ball_hit(self, hit_frame):
+        """
+        Records a confirmed ball hit in the player stats.
+        """
+        self.ball_hit_frames.append(hit_frame)
+        player_positions, ball_position = self.mini_court_positions[hit_frame]
+
+        # Like calculate_player_stats, PlayerStats leaves out the shots a player
+        # or the ball is missing from
+        self.player_stats.add_hit(hit_frame, ball_position.get(1), player_positions)
@@ -1,178 +1,344 @@
-from utils import read_video, save_video, distance_between_points, convert_pixels_to_meters, draw_player_stats
-from trackers import PlayerTracker, BallTracker
-from court_line_detector import CourtLineDetector
-import cv2
+from utils import read_video, read_video_frames, read_video_chunks, save_video, get_video_fps, FrameScaler
 from mini_court import MiniCourt
-import constants
-from copy import deepcopy
-import pandas as pd
-
-def main():
-    # Declare video path and read video frames
+from detection_cache import DetectionCache, get_stub_key
+from pipeline import load_models, analyze_detections, annotate_frames, run_sharded
+from trackers import CourtTracker, GAP_FILL_MODES, MODEL_FORMATS
+from live import run_live, DROP_POLICIES
+from batch import run_batch
+from instrumentation import profiler, profile_stage
+from court_line_detector import BACKENDS
+from itertools import chain
+import argparse
+import os
+
+def main(streaming=False, chunk_size=64, batch_size=1, cache_dir=None, cache_size_mb=1024, projection="height",
+         workers=1, segment_length=None, live=None, realtime=False, queue_size=8, drop_policy="drop_oldest",
+         static_court=False, court_change_threshold=0.4, court_backend="eager", num_threads=None,
+         ball_roi_tracking=False, player_keyframe_interval=1, player_keyframe_motion=0.15,
+         player_gap_fill="interpolate", output_video_path="outputs/output_video.avi", codec="MJPG", fps=None,
+         manifest=None, work_dir="batch_runs", player_model_path="models/yolo11x.pt",
+         ball_model_path="models/yolo11x_best_tennis_ball_detector.pt",
+         court_model_path="models/keypoints_model.pth", player_model_format="pytorch",
+         ball_model_format="pytorch", detection_size=None, render_workers=1):
+    """
+    Runs the full analysis on the input video.
+
+    :param streaming: if True, frames are decoded, annotated and encoded in chunks of
+                      chunk_size frames instead of holding the whole video in memory.
+                      Detection and post-processing only need the (small) detections,
+                      so the output is identical to the in-memory run.
+    :param chunk_size: number of frames held in memory at once when streaming
+    :param batch_size: number of frames passed through the YOLO models at once
+    :param cache_dir: directory of the content-addressed detection cache, when given the
+                      detectors reuse cached results and the tracker stubs are neither
+                      read nor written. Without it, a stub is only read when it was saved
+                      for the same video, model weights and detection parameters
+    :param cache_size_mb: size limit of the detection cache in megabytes
+    :param projection: how positions are mapped onto the mini court, "height" (scaled by
+                       the players' heights) or "homography" (fitted on the court keypoints)
+    :param workers: number of worker processes, more than 1 splits the video into time
+                    segments that are detected and annotated in parallel
+    :param segment_length: number of frames per segment when using several workers
+    :param live: webcam number, file path or stream URL to analyze live instead of the input video
+    :param realtime: in live mode, replay a file at its frame rate
+    :param queue_size: in live mode, maximum number of frames waiting between two stages
+    :param drop_policy: in live mode, what happens to new frames when detection falls behind
+    :param static_court: only predict the court keypoints on the first frame, for videos
+                         from a single fixed camera
+    :param court_change_threshold: difference between the edges of downscaled frames (0 to 1)
+                                   above which the camera view counts as changed and the
+                                   court keypoints are looked up again
+    :param court_backend: how the court keypoints CNN is run, "eager" (PyTorch), "torchscript"
+                          (traced and frozen) or "onnx" (exported and run with ONNX Runtime)
+    :param num_threads: number of CPU threads used for inference (per worker when using
+                        several workers), None keeps the default
+    :param ball_roi_tracking: predict the ball's next position and only detect it in a region
+                              around it, searching whole frames again after a few misses
+    :param player_keyframe_interval: largest number of frames between two frames players are
+                                     detected in, the gap adapts to how fast they move and the
+                                     frames in between are filled in (not used in live mode)
+    :param player_keyframe_motion: how far a player may move between two keyframes, as a
+                                   fraction of its height
+    :param player_gap_fill: how players are filled in between keyframes, "interpolate" (linear
+                            between keyframes) or "flow" (carried along by optical flow)
+    :param output_video_path: path of the annotated video, its extension picks the container
+    :param codec: codec of the annotated video, a four character code for OpenCV (MJPG, mp4v,
+                  XVID, avc1) or an ffmpeg encoder (libx264, libx265, ...) when ffmpeg is installed
+    :param fps: frame rate of the annotated video, None uses the input video's
+    :param render_workers: number of threads the overlays are drawn on (single process only),
+                           1 draws them on the main thread, see Compositor
+    :param manifest: manifest of many videos to analyze as a batch instead of the input video,
+                     with workers processes that each load the models once, see run_batch
+    :param work_dir: directory of the batch's checkpoints and timing report
+    :param player_model_path: path to the player detection YOLO weights
+    :param ball_model_path: path to the ball detection YOLO weights
+    :param court_model_path: path to the court keypoints CNN weights
+    :param player_model_format: how the player YOLO weights are run, "pytorch" (as they are),
+                                "onnx" (exported and run with ONNX Runtime) or "onnx_int8"
+                                (the export with 8 bit weights), see load_yolo_model
+    :param ball_model_format: how the ball YOLO weights are run, same choices
+    :param detection_size: longest side in pixels of the downscaled copy of each frame all
+                           detectors run on, their boxes and keypoints are mapped back to
+                           the source frames. None runs them on the source frames
+    """
     input_video_path = "inputs/input_video.mp4"
-    video_frames = read_video(input_video_path)
-
-    # Create PlayerTracker object using pre-trained yolo11x and
-    # retrieve the player detections from the video (list of
-    # ids to bounding box coords dictionaries)
-    player_tracker = PlayerTracker("models/yolo11x.pt")
-
-    # Create BallTracker object using fine-tuned yolo11x model trained on
-    # Roboflow dataset and retrieve the ball detections from the video
-    # (list of singular id to bounding box coords dictionaries)
-    ball_tracker = BallTracker("models/yolo11x_best_tennis_ball_detector.pt")
 
-    # Create CourtLineDetector object using the trained CNN
-    court_line_detector = CourtLineDetector("models/keypoints_model.pth")
+    if manifest is not None:
+        run_batch(manifest, work_dir, player_model_path, ball_model_path, court_model_path,
+                  num_workers=workers, output_dir=os.path.dirname(output_video_path) or ".",
+                  cache_dir=cache_dir, cache_size_mb=cache_size_mb, num_threads=num_threads,
+                  model_options={"court_backend": court_backend,
+                                 "ball_roi_tracking": ball_roi_tracking,
+                                 "player_keyframe_interval": player_keyframe_interval,
+                                 "player_keyframe_motion": player_keyframe_motion,
+                                 "player_gap_fill": player_gap_fill,
+                                 "player_model_format": player_model_format,
+                                 "ball_model_format": ball_model_format},
+                  job_defaults={"projection": projection,
+                                "detection_size": detection_size,
+                                "static_court": static_court,
+                                "court_change_threshold": court_change_threshold,
+                                "batch_size": batch_size,
+                                "chunk_size": chunk_size,
+                                "codec": codec,
+                                "fps": fps})
+        return
+
+    if live is not None:
+        run_live(live, output_video_path,
+                 player_model_path, ball_model_path, court_model_path,
+                 realtime=realtime, queue_size=queue_size, drop_policy=drop_policy,
+                 batch_size=batch_size, projection=projection,
+                 static_court=static_court, court_change_threshold=court_change_threshold,
+                 court_backend=court_backend, num_threads=num_threads,
+                 ball_roi_tracking=ball_roi_tracking, player_model_format=player_model_format,
+                 ball_model_format=ball_model_format, detection_size=detection_size, codec=codec, fps=fps)
+        return
+
+    # Speeds are timed by the input's frame rate, whatever rate the output is written at
+    video_fps = get_video_fps(input_video_path)
+
+    if fps is None:
+        fps = video_fps
+
+    if workers > 1:
+        run_sharded(input_video_path, output_video_path,
+                    player_model_path, ball_model_path, court_model_path,
+                    num_workers=workers, segment_length=segment_length,
+                    batch_size=batch_size, chunk_size=chunk_size,
+                    projection=projection, cache_dir=cache_dir, cache_size_mb=cache_size_mb,
+                    static_court=static_court, court_change_threshold=court_change_threshold,
+                    court_backend=court_backend, num_threads=num_threads,
+                    ball_roi_tracking=ball_roi_tracking,
+                    player_keyframe_interval=player_keyframe_interval,
+                    player_keyframe_motion=player_keyframe_motion,
+                    player_gap_fill=player_gap_fill,
+                    player_model_format=player_model_format,
+                    ball_model_format=ball_model_format,
+                    detection_size=detection_size,
+                    codec=codec, fps=fps)
+        return
+
+    # Read video frames
+    # When streaming, frames are only decoded lazily from the file
+    with profile_stage("read_video"):
+        video_frames = None if streaming else read_video(input_video_path)
+        first_frame = next(read_video_frames(input_video_path)) if streaming else video_frames[0]
+
+    # Results keyed on the frames, model weights and inference parameters
+    cache = DetectionCache(cache_dir, max_size_bytes=cache_size_mb * 1024 ** 2) if cache_dir is not None else None
+
+    # Create the player and ball trackers and the court line detector
+    with profile_stage("load_models"):
+        player_tracker, ball_tracker, court_line_detector = load_models(player_model_path,
+                                                                        ball_model_path,
+                                                                        court_model_path,
+                                                                        cache=cache,
+                                                                        court_backend=court_backend,
+                                                                        num_threads=num_threads,
+                                                                        ball_roi_tracking=ball_roi_tracking,
+                                                                        player_keyframe_interval=player_keyframe_interval,
+                                                                        player_keyframe_motion=player_keyframe_motion,
+                                                                        player_gap_fill=player_gap_fill,
+                                                                        player_model_format=player_model_format,
+                                                                        ball_model_format=ball_model_format)
 
     # Create MiniCourt object to draw the real-time mini court in the top right of the video
-    mini_court = MiniCourt(video_frames[0])
-
-    # Retrieve list of dictionaries of player IDs to bounding box coordinates
-    player_detections = player_tracker.detect_frames(video_frames,
-                                                    read_from_stub=True,
-                                                     stub_path="tracker_stubs/player_detections.pkl")
-    
-    # Retrieve list of dictionaries of the ball's ID to bounding box coordinates
-    ball_detections = ball_tracker.detect_frames(video_frames,
-                                                 read_from_stub=True,
-                                                 stub_path="tracker_stubs/ball_detections.pkl")
-    
-    # Interpolate ball positions where detections don't occur
-    ball_detections = ball_tracker.interpolate_ball_positions(ball_detections)
-
-    # Predict court keypoints and draw them onto the video frames
-    court_keypoints = court_line_detector.predict(video_frames[0])
-    output_video_frames = court_line_detector.draw_keypoints_on_video(video_frames, court_keypoints)
-
-    # Filter for only the two actual players
-    player_detections = player_tracker.filter_players(court_keypoints, player_detections)
-
-    # Convert positions to mini court positions
-    player_mini_court_detections, ball_mini_court_detections = mini_court.convert_bounding_boxes_to_mini_court_coordinates(player_detections,
-                                                                                                                           ball_detections,
-                                                                                                                           court_keypoints)
-    
-    # Get frames where ball was hit (as a list of frame numbers)
-    ball_hit_frames = ball_tracker.get_ball_hit_frames(ball_detections)
-
-    # Establish stats we want to display
-    player_stats_data = [{
-        'frame_num': 0,
-
-        'player_1_number_of_shots': 0,
-        'player_1_total_shot_speed': 0,
-        'player_1_last_shot_speed': 0,
-        'player_1_total_player_speed': 0,
-        'player_1_last_player_speed': 0,
-
-        'player_2_number_of_shots': 0,
-        'player_2_total_shot_speed': 0,
-        'player_2_last_shot_speed': 0,
-        'player_2_total_player_speed': 0,
-        'player_2_last_player_speed': 0,
-    }]
-
-    # Calculate the speed of the opponent during a shot and
-    # the speed of the ball itself
-    # We don't account for the last shot because we need a shot
-    # following it to determine speed
-    for index in range(len(ball_hit_frames) - 1):
-        start_frame = ball_hit_frames[index]
-        end_frame = ball_hit_frames[index + 1]
-        ball_shot_time_seconds = (end_frame - start_frame) / 24 # The video is 24 fps
-
-        # Get distance covered by ball
-        ball_distance_covered_pixels = distance_between_points(ball_mini_court_detections[start_frame][1],
-                                                               ball_mini_court_detections[end_frame][1])
-        ball_distance_covered_meters = convert_pixels_to_meters(ball_distance_covered_pixels,
-                                                                constants.DOUBLES_LINE_WIDTH,
-                                                                mini_court.get_mini_court_width())
-        
-        # Speed of the ball shot in km/h
-        speed_of_ball_shot = ball_distance_covered_meters / ball_shot_time_seconds * 3.6
-
-        # Player who shot the ball
-        player_dict = player_mini_court_detections[start_frame]
-        player_shot_ball = min(player_dict.keys(), key=lambda id: distance_between_points(player_dict[id],
-                                                                                          ball_mini_court_detections[start_frame][1]))
-        
-        # Opponent player
-        opponent_player_id = 1 if player_shot_ball == 2 else 2
-
-        # Opponent player speed
-        distance_covered_by_opponent_pixels = distance_between_points(player_mini_court_detections[start_frame][opponent_player_id],
-                                                                      player_mini_court_detections[end_frame][opponent_player_id])
-        distance_covered_by_opponent_meters = convert_pixels_to_meters(distance_covered_by_opponent_pixels,
-                                                                       constants.DOUBLES_LINE_WIDTH,
-                                                                       mini_court.get_mini_court_width())
-        opponent_player_speed = distance_covered_by_opponent_meters / ball_shot_time_seconds * 3.6
-
-        # Make a deepcopy to only copy over values from dict
-        # Index -1 because we are accumulating stats, so we
-        # want to build off the previous state
-        current_player_stats = deepcopy(player_stats_data[-1])
-
-        # Update current player's (the player who just shot the ball) stats
-        current_player_stats["frame_num"] = start_frame
-        current_player_stats[f"player_{player_shot_ball}_number_of_shots"] += 1
-        current_player_stats[f"player_{player_shot_ball}_total_shot_speed"] += speed_of_ball_shot
-        current_player_stats[f"player_{player_shot_ball}_last_shot_speed"] = speed_of_ball_shot
-
-        # Update opponent's stats
-        current_player_stats[f"player_{opponent_player_id}_total_player_speed"] += opponent_player_speed
-        current_player_stats[f"player_{opponent_player_id}_last_player_speed"] = opponent_player_speed
-
-        # Add to player_stats_data to update the list
-        player_stats_data.append(current_player_stats)
-
-    # Convert player_stats_data into a dataframe
-    # Rows only exist where there was a hit
-    df_player_stats_data = pd.DataFrame(player_stats_data)
-
-    # Create a frames dataframe with a row per frame
-    df_frames = pd.DataFrame({"frame_num": list(range(len(video_frames)))})
-
-    # df_frames is the left table
-    # df_player_stats_data is the right table
-    # how="left" tells pandas to preserve key order of left table
-    # on="frame_num" tells pandas that stats should appear where frame_num matches
-    df_player_stats_data = pd.merge(df_frames, df_player_stats_data, how="left", on="frame_num")
-
-    # Replaces NaN (frames where a hit was not detected)
-    # with the last known valid value
-    df_player_stats_data = df_player_stats_data.ffill()
-
-    # Calculate average shot speed and average player speed
-    # for both players
-    df_player_stats_data["player_1_average_shot_speed"] = df_player_stats_data["player_1_total_shot_speed"] / df_player_stats_data["player_1_number_of_shots"]
-    df_player_stats_data["player_2_average_shot_speed"] = df_player_stats_data["player_2_total_shot_speed"] / df_player_stats_data["player_2_number_of_shots"]
-    df_player_stats_data["player_1_average_player_speed"] = df_player_stats_data["player_1_total_player_speed"] / df_player_stats_data["player_2_number_of_shots"]
-    df_player_stats_data["player_2_average_player_speed"] = df_player_stats_data["player_2_total_player_speed"] / df_player_stats_data["player_1_number_of_shots"]
-
-    # Draw bounding boxes on the video frames
-    output_video_frames = player_tracker.draw_bounding_boxes(video_frames, player_detections)
-    output_video_frames = ball_tracker.draw_bounding_boxes(video_frames, ball_detections)
-
-    # Draw mini court
-    output_video_frames = mini_court.draw_mini_court(output_video_frames)
-
-    # Draw real-time player movement on mini court
-    output_video_frames = mini_court.draw_points_on_mini_court(output_video_frames, player_mini_court_detections, color=(255, 0, 0))
-
-    # Draw real-time ball movement on mini court
-    output_video_frames = mini_court.draw_points_on_mini_court(output_video_frames, ball_mini_court_detections)
-
-    # Draw player stats on video frames
-    output_video_frames = draw_player_stats(output_video_frames, df_player_stats_data)
-
-    # Write frame number in top left corner for each frame
-    # Helps with debugging and figuring out where in the video we are
-    for i, frame in enumerate(output_video_frames):
-        cv2.putText(frame, f"Frame: {i}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-
-    output_video_path = "outputs/output_video.avi"
-    save_video(output_video_frames, output_video_path)
+    mini_court = MiniCourt(first_frame)
+
+    # All detectors run on the same downscaled copy of each frame and their results are
+    # mapped back to the source frames, which are only used again for rendering.
+    # When streaming, the copies are made while decoding so memory stays bounded
+    frame_scaler = FrameScaler(detection_size)
+
+    with profile_stage("downscale_frames"):
+        scaled_frames = None if streaming else list(frame_scaler.downscale_frames(video_frames))
+
+    def detection_frames():
+        if streaming:
+            return frame_scaler.downscale_frames(read_video_frames(input_video_path))
+
+        return scaled_frames
+
+    # Stubs are only read back for the same video, weights and detection parameters,
+    # anything else detects again and replaces them. The detection cache replaces
+    # the stubs, with a cache they are neither read nor written and no file is hashed
+    player_stub_path = None
+    ball_stub_path = None
+    player_stub_key = None
+    ball_stub_key = None
+
+    if cache is None:
+        player_stub_path = "tracker_stubs/player_detections"
+        ball_stub_path = "tracker_stubs/ball_detections"
+
+        with profile_stage("stub_keys"):
+            player_stub_key = get_stub_key(input_video_path, player_model_path,
+                                           {"model_format": player_model_format,
+                                            "detection_size": detection_size,
+                                            "keyframe_interval": player_keyframe_interval,
+                                            "keyframe_motion": player_keyframe_motion,
+                                            "gap_fill": player_gap_fill})
+            ball_stub_key = get_stub_key(input_video_path, ball_model_path,
+                                         {"model_format": ball_model_format,
+                                          "detection_size": detection_size,
+                                          "roi_tracking": ball_roi_tracking})
+
+    # Retrieve Detections of player IDs to bounding box coordinates
+    with profile_stage("detect_players") as stage:
+        player_detections = player_tracker.detect_frames(detection_frames(),
+                                                         read_from_stub=True,
+                                                         stub_path=player_stub_path,
+                                                         batch_size=batch_size,
+                                                         frame_scaler=frame_scaler,
+                                                         stub_key=player_stub_key)
+        stage.add_frames(len(player_detections))
+
+    # Retrieve Detections of the ball's ID to bounding box coordinates
+    with profile_stage("detect_ball") as stage:
+        ball_detections = ball_tracker.detect_frames(detection_frames(),
+                                                     read_from_stub=True,
+                                                     stub_path=ball_stub_path,
+                                                     batch_size=batch_size,
+                                                     frame_scaler=frame_scaler,
+                                                     stub_key=ball_stub_key)
+        stage.add_frames(len(ball_detections))
+
+    # Predict court keypoints, again whenever the camera view changes
+    with profile_stage("court_keypoints"):
+        if static_court:
+            court_keypoints = frame_scaler.remap_keypoints(court_line_detector.predict(frame_scaler.downscale(first_frame)))
+        else:
+            court_tracker = CourtTracker(court_line_detector, change_threshold=court_change_threshold,
+                                         frame_scaler=frame_scaler)
+            court_keypoints = court_tracker.track(detection_frames())
+
+    # Interpolate, filter, convert to mini court positions, find ball hits and calculate stats
+    with profile_stage("analyze"):
+        analysis = analyze_detections(player_tracker, ball_tracker, mini_court,
+                                      player_detections, ball_detections, court_keypoints,
+                                      projection=projection, fps=video_fps)
+
+    # Every chunk is only annotated once the previous one has been encoded,
+    # so at most chunk_size frames are alive at a time when streaming
+    chunks = read_video_chunks(input_video_path, chunk_size) if streaming else [(0, video_frames)]
+    output_video_chunks = (annotate_frames(frames, start_frame,
+                                           player_tracker, ball_tracker, court_line_detector,
+                                           mini_court, analysis, num_workers=render_workers)
+                           for start_frame, frames in chunks)
+
+    with profile_stage("annotate_and_save"):
+        save_video(chain.from_iterable(output_video_chunks), output_video_path, fps=fps, codec=codec)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="AI tennis analysis system")
+    parser.add_argument("--streaming", action="store_true",
+                        help="decode, annotate and encode the video in chunks instead of loading it all into memory")
+    parser.add_argument("--chunk-size", type=int, default=64,
+                        help="number of frames held in memory at once when streaming")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="number of frames passed through the YOLO models at once")
+    parser.add_argument("--cache-dir", default=None,
+                        help="directory of the detection cache, replaces the tracker stubs")
+    parser.add_argument("--cache-size-mb", type=int, default=1024,
+                        help="size limit of the detection cache in megabytes")
+    parser.add_argument("--projection", choices=["height", "homography"], default="height",
+                        help="how player and ball positions are mapped onto the mini court")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of worker processes, more than 1 analyzes time segments in parallel")
+    parser.add_argument("--segment-length", type=int, default=None,
+                        help="number of frames per segment when using several workers")
+    parser.add_argument("--live", default=None, metavar="SOURCE",
+                        help="analyze a live source instead: webcam number, file path or stream URL")
+    parser.add_argument("--realtime", action="store_true",
+                        help="in live mode, replay a file at its frame rate")
+    parser.add_argument("--queue-size", type=int, default=8,
+                        help="in live mode, maximum number of frames waiting between two stages")
+    parser.add_argument("--drop-policy", choices=DROP_POLICIES, default="drop_oldest",
+                        help="in live mode, what happens to new frames when detection falls behind")
+    parser.add_argument("--static-court", action="store_true",
+                        help="only predict the court keypoints on the first frame, for a single fixed camera")
+    parser.add_argument("--court-change-threshold", type=float, default=0.4,
+                        help="difference between the edges of downscaled frames (0 to 1) that counts as a new camera view")
+    parser.add_argument("--court-backend", choices=BACKENDS, default="eager",
+                        help="how the court keypoints CNN is run")
+    parser.add_argument("--num-threads", type=int, default=None,
+                        help="number of CPU threads used for inference (per worker when using several workers)")
+    parser.add_argument("--ball-roi", action="store_true",
+                        help="only detect the ball in a region around its predicted position")
+    parser.add_argument("--player-keyframe-interval", type=int, default=1,
+                        help="largest number of frames between two player detections, 1 detects every frame")
+    parser.add_argument("--player-keyframe-motion", type=float, default=0.15,
+                        help="how far a player may move between two player detections, in player heights")
+    parser.add_argument("--player-gap-fill", choices=GAP_FILL_MODES, default="interpolate",
+                        help="how players are filled in between player detections")
+    parser.add_argument("--output", default="outputs/output_video.avi",
+                        help="path of the annotated video, its extension picks the container")
+    parser.add_argument("--codec", default="MJPG",
+                        help="four character code for OpenCV (MJPG, mp4v, XVID, avc1) or an ffmpeg encoder (libx264, ...)")
+    parser.add_argument("--fps", type=float, default=None,
+                        help="frame rate of the annotated video, defaults to the input video's")
+    parser.add_argument("--detection-size", type=int, default=None,
+                        help="longest side in pixels of the downscaled frames the detectors run on, "
+                             "defaults to the source resolution")
+    parser.add_argument("--render-workers", type=int, default=1,
+                        help="number of threads the overlays are drawn on, the output is the same for any number. "
+                             "More than 1 only helps with heavy overlays, see benchmarks.benchmark_compositor")
+    parser.add_argument("--manifest", default=None,
+                        help="analyze every video of a manifest (.json, .jsonl or a list of paths) as a batch")
+    parser.add_argument("--work-dir", default="batch_runs",
+                        help="directory of the batch's checkpoints and timing report")
+    parser.add_argument("--player-model", default="models/yolo11x.pt")
+    parser.add_argument("--ball-model", default="models/yolo11x_best_tennis_ball_detector.pt")
+    parser.add_argument("--court-model", default="models/keypoints_model.pth")
+    parser.add_argument("--player-model-format", choices=MODEL_FORMATS, default="pytorch",
+                        help="how the player YOLO weights are run, exports are written next to the weights")
+    parser.add_argument("--ball-model-format", choices=MODEL_FORMATS, default="pytorch",
+                        help="how the ball YOLO weights are run, exports are written next to the weights")
+    parser.add_argument("--profile", default=os.environ.get("TENNIS_PROFILE"), metavar="DIR",
+                        help="time every stage and write report.json, metrics.prom and stages.folded to DIR "
+                             "(default $TENNIS_PROFILE, off when unset)")
+    parser.add_argument("--cprofile", action="store_true",
+                        help="with --profile, also write a cProfile of the main thread to DIR/profile.prof")
+    args = parser.parse_args()
+
+    if args.profile:
+        profiler.enable(cprofile=args.cprofile)
+
+    with profile_stage("main"):
+        main(streaming=args.streaming, chunk_size=args.chunk_size, batch_size=args.batch_size,
+             cache_dir=args.cache_dir, cache_size_mb=args.cache_size_mb, projection=args.projection,
+             workers=args.workers, segment_length=args.segment_length, live=args.live, realtime=args.realtime,
+             queue_size=args.queue_size, drop_policy=args.drop_policy, static_court=args.static_court,
+             court_change_threshold=args.court_change_threshold, court_backend=args.court_backend,
+             num_threads=args.num_threads, ball_roi_tracking=args.ball_roi,
+             player_keyframe_interval=args.player_keyframe_interval,
+             player_keyframe_motion=args.player_keyframe_motion, player_gap_fill=args.player_gap_fill,
+             output_video_path=args.output, codec=args.codec, fps=args.fps,
+             manifest=args.manifest, work_dir=args.work_dir, player_model_path=args.player_model,
+             ball_model_path=args.ball_model, court_model_path=args.court_model,
+             player_model_format=args.player_model_format, ball_model_format=args.ball_model_format,
+             detection_size=args.detection_size, render_workers=args.render_workers)
+
+    if args.profile:
+        profiler.write_reports(args.profile)
@@ -2,13 +2,20 @@ import cv2
 import constants
 from utils import (convert_pixels_to_meters,
                    convert_meters_to_pixels,
-                   get_foot_position,
-                   get_closest_keypoint_index,
-                   get_bounding_box_height,
                    measure_xy_distance,
-                   get_center_of_box,
-                   distance_between_points)
+                   measure_xy_distances,
+                   get_foot_positions,
+                   get_centers_of_boxes,
+                   distances_between_points,
+                   get_closest_keypoint_indices,
+                   get_bounding_box_heights,
+                   Detections,
+                   as_detections,
+                   sliding_window_max,
+                   OverlaySprite,
+                   as_court_keypoints)
 import numpy as np
+from instrumentation import profiled
 
 class MiniCourt:
     def __init__(self, frame):
@@ -22,6 +29,16 @@ class MiniCourt:
         self.set_mini_court_keypoints()
         self.set_mini_court_lines()
 
+        # Homography from the video's court keypoints to the mini court keypoints,
+        # fitted once and reused for as long as the court keypoints don't change
+        self.homography = None
+        self.homography_keypoints = None
+
+        # The background rectangle and court lines are the same in every frame,
+        # so they are only rasterized once (see draw_mini_court). Kept as one
+        # (frame shape, sprite, background) tuple so threads see them change together
+        self.court_sprite = (None, None, None)
+
     def convert_meters_to_pixels(self, meters):
         """
         Returns pixels from meters.
@@ -160,15 +177,43 @@ class MiniCourt:
 
         return frame
     
+    @profiled("MiniCourt.draw_mini_court", frames=1)
     def draw_mini_court(self, frames):
+        """
+        Draws the mini court onto each frame in place. Gives the same result as
+        draw_background_rectangle followed by draw_mini_court_features, but the
+        transparent rectangle is only blended over its own region of the frame
+        and the court lines are stamped from a sprite drawn once.
+
+        :param frames: list of NumPy arrays representing video frames
+        """
         output_video_frames = []
 
         for frame in frames:
-            frame = self.draw_background_rectangle(frame)
-            frame = self.draw_mini_court_features(frame)
-            output_video_frames.append(frame)
+            output_video_frames.append(self.draw_mini_court_on_frame(frame))
 
         return output_video_frames
+
+    def draw_mini_court_on_frame(self, frame):
+        """
+        Draws the mini court onto a single frame in place and returns it, see
+        draw_mini_court. Safe to call from several threads at once.
+
+        :param frame: NumPy array representing a video frame
+        """
+        # Region of the background rectangle (both corners are included in the rectangle)
+        roi = (slice(max(self.start_y, 0), self.end_y + 1), slice(max(self.start_x, 0), self.end_x + 1))
+        sprite_shape, court_sprite, background = self.court_sprite
+
+        if sprite_shape != frame.shape:
+            court_sprite = OverlaySprite(frame.shape, self.draw_mini_court_features)
+            background = np.full_like(frame[roi], 255)
+            self.court_sprite = (frame.shape, court_sprite, background)
+
+        alpha = 0.5 # Equivalent to transparency
+        frame[roi] = cv2.addWeighted(frame[roi], alpha, background, 1 - alpha, 0)
+
+        return court_sprite.draw(frame)
     
     def get_mini_court_start_point(self):
         return (self.court_start_x, self.court_start_y)
@@ -179,89 +224,227 @@ class MiniCourt:
     def get_mini_court_keypoints(self):
         return self.keypoints
     
-    def convert_bounding_boxes_to_mini_court_coordinates(self, player_boxes, ball_boxes, court_keypoints):
+    @profiled("MiniCourt.convert_bounding_boxes_to_mini_court_coordinates")
+    def convert_bounding_boxes_to_mini_court_coordinates(self, player_boxes, ball_boxes, court_keypoints,
+                                                         projection="height"):
+        """
+        Returns the mini court positions of the players and the ball as
+        Detections of IDs to (x, y) points. Every step runs as array operations
+        over all frames at once, so the cost grows linearly with the video length.
+
+        :param player_boxes: Detections (or list of dictionaries) of player IDs to bounding boxes
+        :param ball_boxes: Detections (or list of dictionaries) of the ball's ID to bounding boxes
+        :param court_keypoints: list of court keypoint coordinates, or CourtKeypoints
+                                when the camera view changes during the video
+        :param projection: "height" scales the offset from the closest keypoint by the
+                           player's height in pixels, "homography" maps positions through
+                           a homography fitted on the court keypoints
+        """
+        if projection == "homography":
+            return self.convert_bounding_boxes_to_mini_court_coordinates_homography(player_boxes,
+                                                                                   ball_boxes,
+                                                                                   court_keypoints)
+
+        if projection != "height":
+            raise ValueError(f"Unknown projection: {projection}")
+
         player_heights = {
             1: constants.PLAYER_1_HEIGHT,
             2: constants.PLAYER_2_HEIGHT
         }
 
-        # List of player IDs to mini court position dictionaries
-        output_player_boxes = []
-
-        # List of ball ID to mini court position dictionaries
-        output_ball_boxes = []
-
-        for frame_num, player_dict in enumerate(player_boxes):
-            ball_box = ball_boxes[frame_num][1]
-            ball_position = get_center_of_box(ball_box)
-            
-            # Gets player ID of closest player to the ball
-            # Iterates over the keys (player IDs) and gets the ID with
-            # the minimum distance by comparing ball_position to the
-            # center of the player's bounding box
-            closest_player_id_to_ball = min(player_dict.keys(),
-                                            key=lambda x:
-                                            distance_between_points(
-                                                ball_position,
-                                                get_center_of_box(player_dict[x])
-                                                ))
-
-            # Dict of player IDs to mini court position
-            output_player_bounding_box_dict = {}
-            output_ball_bounding_box_dict = {}
-
-            for player_id, bounding_box in player_dict.items():
-                foot_position = get_foot_position(bounding_box)
-
-                # Determines closest keypoint to the player's feet
-                closest_keypoint_index = get_closest_keypoint_index(foot_position, court_keypoints, [0, 2, 12, 13])
-                closest_keypoint = (court_keypoints[closest_keypoint_index * 2],
-                                    court_keypoints[closest_keypoint_index * 2 + 1])
-
-                # Get the player's height in pixels
-                # Min goes 20 frames before if possible
-                # Max goes 50 frames after if possible
-                frame_num_min = max(0, frame_num - 20)
-                frame_num_max = min(len(player_boxes), frame_num + 50)
-
-                # Retrieves the heights of the player with player_id for the frame range
-                # There are various heights of the player because of the camera angle and how they
-                # move during the match, lunges etc.
-                bounding_box_heights_in_pixels = [get_bounding_box_height(player_boxes[i][player_id])
-                                                  for i in range(frame_num_min, frame_num_max)]
-                
-                # Max height from frame range should be the player's actual height
-                # (standing straight up height)
-                player_height_in_pixels = max(bounding_box_heights_in_pixels)
-
-                # Get player's mini court position
-                mini_court_player_pos = self.get_mini_court_coordinates(foot_position,
-                                                                        closest_keypoint,
-                                                                        closest_keypoint_index,
-                                                                        player_height_in_pixels,
-                                                                        player_heights[player_id])
-                
-                output_player_bounding_box_dict[player_id] = mini_court_player_pos
-
-                if closest_player_id_to_ball == player_id:
-                    # Get closest keypoint in pixels
-                    closest_keypoint_index = get_closest_keypoint_index(ball_position, court_keypoints, [0, 2, 12, 13])
-                    closest_keypoint = (court_keypoints[closest_keypoint_index * 2],
-                                        court_keypoints[closest_keypoint_index * 2 + 1])
-                    
-                    # Get ball's mini court position
-                    mini_court_ball_pos = self.get_mini_court_coordinates(ball_position,
-                                                                        closest_keypoint,
-                                                                        closest_keypoint_index,
-                                                                        player_height_in_pixels,
-                                                                        player_heights[player_id])
-                    
-                    output_ball_boxes.append({1: mini_court_ball_pos})
-                
-            output_player_boxes.append(output_player_bounding_box_dict)
+        player_boxes = as_detections(player_boxes)
+        ball_boxes = as_detections(ball_boxes)
+        court_keypoints = as_court_keypoints(court_keypoints)
+
+        player_frames = player_boxes.frame_indices
+        player_ids = player_boxes.track_ids
+
+        # Foot position of every player detection (truncated like int() does)
+        foot_positions = get_foot_positions(player_boxes.coords)
+
+        # Get the player's height in pixels
+        # The window goes 20 frames before and 49 frames after if possible
+        # There are various heights of the player because of the camera angle and how they
+        # move during the match, lunges etc. The max height from the window should be the
+        # player's actual height (standing straight up height)
+        player_heights_in_pixels = np.empty(len(player_ids))
+        player_heights_in_meters = np.empty(len(player_ids))
+
+        for player_id in np.unique(player_ids):
+            rows = player_ids == player_id
+            heights = get_bounding_box_heights(player_boxes.to_dense(player_id))
+
+            player_heights_in_pixels[rows] = sliding_window_max(heights, 20, 49)[player_frames[rows]]
+            player_heights_in_meters[rows] = player_heights[int(player_id)]
+
+        # Court keypoints of the frame of every player detection
+        player_court_keypoints = court_keypoints.get_per_frame(player_frames)
+
+        # Get players' mini court positions
+        mini_court_player_positions = self.get_mini_court_coordinates_batch(foot_positions,
+                                                                            player_court_keypoints,
+                                                                            player_heights_in_pixels,
+                                                                            player_heights_in_meters)
+
+        output_player_boxes = Detections(player_boxes.frame_offsets, player_ids, mini_court_player_positions)
+
+        # Ball center in every frame that has a ball (truncated like int() does)
+        ball_boxes = ball_boxes.filter_track_ids([1])
+        ball_frames = ball_boxes.frame_indices
+        ball_positions = get_centers_of_boxes(ball_boxes.coords)
+
+        # Only frames that have both a ball and a player can be converted
+        ball_dense_positions = np.full((player_boxes.num_frames, 2), np.nan)
+        ball_dense_positions[ball_frames[ball_frames < player_boxes.num_frames]] = ball_positions[ball_frames < player_boxes.num_frames]
+        ball_position_per_player = ball_dense_positions[player_frames]
+        has_ball = ~np.isnan(ball_position_per_player[:, 0])
+
+        # Distance from the ball to the center of every player detection
+        player_centers = get_centers_of_boxes(player_boxes.coords)
+        distances_to_ball = distances_between_points(player_centers, ball_position_per_player)
+
+        # Gets the closest player to the ball in each frame. Sorting by frame, then distance,
+        # then row keeps the first player on ties like min() over the dictionary did
+        rows = np.flatnonzero(has_ball)
+        rows = rows[np.lexsort((rows, distances_to_ball[rows], player_frames[rows]))]
+        closest_rows = rows[np.unique(player_frames[rows], return_index=True)[1]]
+
+        # Get ball's mini court position, scaled by the height of the closest player
+        mini_court_ball_positions = self.get_mini_court_coordinates_batch(ball_position_per_player[closest_rows],
+                                                                          player_court_keypoints[closest_rows],
+                                                                          player_heights_in_pixels[closest_rows],
+                                                                          player_heights_in_meters[closest_rows])
+
+        output_ball_boxes = Detections.from_arrays(player_frames[closest_rows],
+                                                   np.ones(len(closest_rows), dtype=np.int64),
+                                                   mini_court_ball_positions,
+                                                   player_boxes.num_frames)
 
         return output_player_boxes, output_ball_boxes
 
+    def convert_bounding_boxes_to_mini_court_coordinates_homography(self, player_boxes, ball_boxes, court_keypoints):
+        """
+        Returns the mini court positions of the players and the ball as Detections
+        of IDs to (x, y) points, mapping every player's feet and the ball's center
+        through the court homography in a single perspectiveTransform call. Unlike
+        the height projection this doesn't need the player heights, but the ball
+        is treated as if it were on the ground. With CourtKeypoints there is one
+        call per camera segment, each with the homography of that segment.
+
+        :param player_boxes: Detections (or list of dictionaries) of player IDs to bounding boxes
+        :param ball_boxes: Detections (or list of dictionaries) of the ball's ID to bounding boxes
+        :param court_keypoints: list of court keypoint coordinates, or CourtKeypoints
+        """
+        player_boxes = as_detections(player_boxes)
+        ball_boxes = as_detections(ball_boxes).filter_track_ids([1])
+
+        # Feet of the players and center of the ball
+        player_x1, _, player_x2, player_y2 = player_boxes.coords.T
+        foot_positions = np.stack([(player_x1 + player_x2) / 2, player_y2], axis=1)
+        ball_x1, ball_y1, ball_x2, ball_y2 = ball_boxes.coords.T
+        ball_positions = np.stack([(ball_x1 + ball_x2) / 2, (ball_y1 + ball_y2) / 2], axis=1)
+
+        positions = np.concatenate([foot_positions, ball_positions])
+        court_keypoints = as_court_keypoints(court_keypoints)
+
+        # Camera segment of the frame of every position
+        segment_indices = court_keypoints.get_segment_indices(np.concatenate([player_boxes.frame_indices,
+                                                                              ball_boxes.frame_indices]))
+        mini_court_positions = np.empty((len(positions), 2))
+
+        for segment_index in np.unique(segment_indices):
+            rows = segment_indices == segment_index
+            mini_court_positions[rows] = self.project_to_mini_court(positions[rows],
+                                                                    court_keypoints.keypoints[segment_index])
+
+        output_player_boxes = Detections(player_boxes.frame_offsets,
+                                         player_boxes.track_ids,
+                                         mini_court_positions[:len(foot_positions)])
+        output_ball_boxes = Detections(ball_boxes.frame_offsets,
+                                       ball_boxes.track_ids,
+                                       mini_court_positions[len(foot_positions):])
+
+        return output_player_boxes, output_ball_boxes
+
+    def get_court_homography(self, court_keypoints):
+        """
+        Returns the 3x3 homography mapping video pixel coordinates to mini court
+        coordinates. It is fitted on all 14 keypoints (least squares) and cached
+        until different court keypoints are passed in.
+
+        :param court_keypoints: list of court keypoint coordinates
+        """
+        court_keypoints = np.asarray(court_keypoints, dtype=np.float32).reshape(-1, 2)
+
+        if self.homography is None or not np.array_equal(court_keypoints, self.homography_keypoints):
+            mini_court_keypoints = np.array(self.keypoints, dtype=np.float32).reshape(-1, 2)
+            self.homography, _ = cv2.findHomography(court_keypoints, mini_court_keypoints, 0)
+            self.homography_keypoints = court_keypoints
+
+        return self.homography
+
+    def project_to_mini_court(self, positions, court_keypoints):
+        """
+        Returns a (N, 2) array of the mini court coordinates of a (N, 2) array of
+        video pixel coordinates.
+
+        :param positions: (N, 2) array of video pixel coordinates
+        :param court_keypoints: list of court keypoint coordinates
+        """
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 1, 2)
+
+        if len(positions) == 0:
+            return np.empty((0, 2))
+
+        return cv2.perspectiveTransform(positions, self.get_court_homography(court_keypoints)).reshape(-1, 2)
+
+    def get_mini_court_coordinates_batch(self, positions, court_keypoints,
+                                         player_heights_in_pixels, player_heights_in_meters):
+        """
+        Array version of get_mini_court_coordinates. Returns a (N, 2) array of
+        mini court positions.
+
+        :param positions: (N, 2) array of actual positions
+        :param court_keypoints: flat NumPy array of court keypoint coordinates, or a
+                                (N, 28) array with the keypoints of each position's frame
+        :param player_heights_in_pixels: (N,) array of player heights in pixels
+        :param player_heights_in_meters: (N,) array of player heights in meters
+        """
+        # Work in the keypoints' precision (float32 from the CNN), the same precision the
+        # scalar version ends up in when mixing Python numbers with the keypoints
+        court_keypoints = np.asarray(court_keypoints)
+        dtype = np.dtype(court_keypoints.dtype if np.issubdtype(court_keypoints.dtype, np.floating) else np.float64)
+        positions = np.asarray(positions).astype(dtype)
+
+        # One set of (x, y) keypoints per position, flat keypoints are shared by all positions
+        court_keypoints = court_keypoints.astype(dtype).reshape(-1, len(self.keypoints) // 2, 2)
+        court_keypoints = np.broadcast_to(court_keypoints, (len(positions),) + court_keypoints.shape[1:])
+
+        # Determines closest keypoint to each position, only the y distance counts
+        closest_keypoint_indices = get_closest_keypoint_indices(positions,
+                                                                court_keypoints.reshape(len(positions), -1),
+                                                                [0, 2, 12, 13])
+        closest_keypoints = court_keypoints[np.arange(len(positions)), closest_keypoint_indices]
+
+        # Distance between individual x and y coordinates
+        distances_from_keypoints_pixels = measure_xy_distances(positions, closest_keypoints)
+
+        # Convert pixels to meters
+        distances_from_keypoints_meters = convert_pixels_to_meters(distances_from_keypoints_pixels,
+                                                                   player_heights_in_meters.astype(dtype)[:, None],
+                                                                   player_heights_in_pixels.astype(dtype)[:, None])
+
+        # Normalize to mini court coordinates
+        mini_court_distances_pixels = convert_meters_to_pixels(distances_from_keypoints_meters,
+                                                               dtype.type(self.court_width),
+                                                               dtype.type(constants.DOUBLES_LINE_WIDTH))
+
+        # Convert closest keypoints to mini court coords
+        closest_mini_court_keypoints = np.array(self.keypoints, dtype=dtype).reshape(-1, 2)[closest_keypoint_indices]
+
+        return (closest_mini_court_keypoints + mini_court_distances_pixels).reshape(-1, 2)
+
     def get_mini_court_coordinates(self, player_position,
                                    closest_keypoint, closest_keypoint_index,
                                    player_height_in_pixels, player_height_in_meters):
@@ -299,12 +482,36 @@ class MiniCourt:
         
         return mini_court_player_pos
     
-    def draw_points_on_mini_court(self, frames, positions, color=(0, 255, 0)):
-        for frame_num, frame in enumerate(frames):
-            for _, position in positions[frame_num].items():
-                x, y = position
-                x = int(x)
-                y = int(y)
-                cv2.circle(frame, (x, y), 5, color, -1)
+    @profiled("MiniCourt.draw_points_on_mini_court", frames=1)
+    def draw_points_on_mini_court(self, frames, positions, color=(0, 255, 0), start_frame=0):
+        """
+        Draws the mini court positions as filled dots. frames can be a chunk of
+        the video starting at frame start_frame, positions always covers the
+        whole video.
+
+        :param frames: list of NumPy arrays representing video frames
+        :param positions: Detections (or list of dictionaries) of IDs to mini court positions
+        :param color: BGR color of the dots
+        :param start_frame: frame number of the first frame in frames
+        """
+        for frame_num, frame in enumerate(frames, start=start_frame):
+            self.draw_points_on_frame(frame, positions[frame_num], color)
         
-        return frames
\ No newline at end of file
+        return frames
+
+    def draw_points_on_frame(self, frame, positions, color=(0, 255, 0)):
+        """
+        Draws the mini court positions of a single frame in place and returns it,
+        see draw_points_on_mini_court.
+
+        :param frame: NumPy array representing a video frame
+        :param positions: dictionary of IDs to the frame's mini court positions
+        :param color: BGR color of the dots
+        """
+        for _, position in positions.items():
+            x, y = position
+            x = int(x)
+            y = int(y)
+            cv2.circle(frame, (x, y), 5, color, -1)
+
+        return frame
\ No newline at end of file
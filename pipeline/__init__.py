@@ -0,0 +1,2 @@
+from .pipeline import load_models, export_models, analyze_detections, calculate_player_stats, annotate_frames, draw_annotations
+from .sharding import run_sharded
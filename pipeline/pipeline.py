@@ -0,0 +1,223 @@
+from utils import as_court_keypoints
+from trackers import PlayerTracker, BallTracker, export_yolo_model
+from court_line_detector import CourtLineDetector, get_onnx_export
+from player_stats import PlayerStats
+from compositor import (Compositor,
+                        CourtKeypointsLayer,
+                        DetectionsLayer,
+                        MiniCourtLayer,
+                        PlayerStatsLayer,
+                        FrameNumberLayer)
+from functools import partial
+from instrumentation import profiled
+
+def load_models(player_model_path, ball_model_path, court_model_path, cache=None,
+                court_backend="eager", num_threads=None, ball_roi_tracking=False,
+                player_keyframe_interval=1, player_keyframe_motion=0.15, player_gap_fill="interpolate",
+                player_model_format="pytorch", ball_model_format="pytorch"):
+    """
+    Returns the (PlayerTracker, BallTracker, CourtLineDetector) used by the pipeline.
+
+    :param player_model_path: path to the player detection YOLO weights
+    :param ball_model_path: path to the ball detection YOLO weights
+    :param court_model_path: path to the court keypoints CNN weights
+    :param cache: optional DetectionCache shared by all three models
+    :param court_backend: how the court keypoints CNN is run ("eager", "torchscript" or "onnx")
+    :param num_threads: number of CPU threads used for inference, None keeps the default
+    :param ball_roi_tracking: only detect the ball in a region around its predicted position
+    :param player_keyframe_interval: largest number of frames between two frames the player
+                                     model runs on, 1 detects players in every frame
+    :param player_keyframe_motion: how far a player may move between two keyframes, as a
+                                   fraction of its height
+    :param player_gap_fill: how players are filled in between keyframes ("interpolate" or "flow")
+    :param player_model_format: how the player YOLO weights are run ("pytorch", "onnx" or "onnx_int8")
+    :param ball_model_format: how the ball YOLO weights are run ("pytorch", "onnx" or "onnx_int8")
+    """
+    # Create PlayerTracker object using pre-trained yolo11x
+    player_tracker = PlayerTracker(player_model_path, cache=cache,
+                                   keyframe_interval=player_keyframe_interval,
+                                   keyframe_motion=player_keyframe_motion,
+                                   gap_fill=player_gap_fill,
+                                   model_format=player_model_format)
+
+    # Create BallTracker object using fine-tuned yolo11x model trained on
+    # Roboflow dataset
+    ball_tracker = BallTracker(ball_model_path, cache=cache, roi_tracking=ball_roi_tracking,
+                               model_format=ball_model_format)
+
+    # Create CourtLineDetector object using the trained CNN
+    court_line_detector = CourtLineDetector(court_model_path, cache=cache,
+                                            backend=court_backend, num_threads=num_threads)
+
+    return player_tracker, ball_tracker, court_line_detector
+
+def export_models(player_model_path, ball_model_path, court_model_path, court_backend="eager",
+                  player_model_format="pytorch", ball_model_format="pytorch"):
+    """
+    Writes the exported models load_models runs, when they're missing or older than
+    the weights. Pools of worker processes call this before starting the workers,
+    which otherwise would all export the same files at once on a first run.
+
+    :param player_model_path: path to the player detection YOLO weights
+    :param ball_model_path: path to the ball detection YOLO weights
+    :param court_model_path: path to the court keypoints CNN weights
+    :param court_backend: how the court keypoints CNN is run ("eager", "torchscript" or "onnx")
+    :param player_model_format: how the player YOLO weights are run ("pytorch", "onnx" or "onnx_int8")
+    :param ball_model_format: how the ball YOLO weights are run ("pytorch", "onnx" or "onnx_int8")
+    """
+    export_yolo_model(player_model_path, player_model_format)
+    export_yolo_model(ball_model_path, ball_model_format)
+
+    if court_backend == "onnx":
+        get_onnx_export(court_model_path)
+
+@profiled("analyze_detections")
+def analyze_detections(player_tracker, ball_tracker, mini_court,
+                       player_detections, ball_detections, court_keypoints,
+                       projection="height", fps=24):
+    """
+    Runs every post-processing step on the raw detections of a whole video and
+    returns a dictionary with everything annotate_frames needs. Only the
+    detections are used, never the frames.
+
+    :param player_tracker: PlayerTracker object
+    :param ball_tracker: BallTracker object
+    :param mini_court: MiniCourt object
+    :param player_detections: Detections of player IDs to bounding box coordinates
+    :param ball_detections: Detections of the ball's ID to bounding box coordinates
+    :param court_keypoints: list of court keypoint coordinates, or CourtKeypoints
+                            when the camera view changes during the video
+    :param projection: how positions are mapped onto the mini court ("height" or "homography")
+    :param fps: frame rate of the input video, which the shot and player speeds are timed by
+    """
+    # Interpolate ball positions where detections don't occur
+    ball_detections = ball_tracker.interpolate_ball_positions(ball_detections)
+
+    # Filter for only the two actual players
+    player_detections = player_tracker.filter_players(court_keypoints, player_detections)
+
+    # Convert positions to mini court positions
+    player_mini_court_detections, ball_mini_court_detections = mini_court.convert_bounding_boxes_to_mini_court_coordinates(player_detections,
+                                                                                                                           ball_detections,
+                                                                                                                           court_keypoints,
+                                                                                                                           projection=projection)
+
+    # Get frames where ball was hit (as a list of frame numbers)
+    ball_hit_frames = ball_tracker.get_ball_hit_frames(ball_detections)
+
+    # Player and shot stats, updated at every hit
+    player_stats = calculate_player_stats(ball_hit_frames,
+                                          player_mini_court_detections,
+                                          ball_mini_court_detections,
+                                          mini_court,
+                                          fps=fps)
+
+    return {
+        "court_keypoints": court_keypoints,
+        "player_detections": player_detections,
+        "ball_detections": ball_detections,
+        "player_mini_court_detections": player_mini_court_detections,
+        "ball_mini_court_detections": ball_mini_court_detections,
+        "ball_hit_frames": ball_hit_frames,
+        "player_stats": player_stats
+    }
+
+@profiled("calculate_player_stats")
+def calculate_player_stats(ball_hit_frames, player_mini_court_detections, ball_mini_court_detections, mini_court,
+                           fps=24):
+    """
+    Returns the PlayerStats of the video, fed with every ball hit in order.
+
+    :param ball_hit_frames: list of frame numbers where the ball was hit
+    :param player_mini_court_detections: Detections of player IDs to mini court positions
+    :param ball_mini_court_detections: Detections of the ball's ID to mini court position
+    :param mini_court: MiniCourt object used for the pixel to meter conversion
+    :param fps: frame rate of the input video
+    """
+    player_stats = PlayerStats(mini_court.get_mini_court_width(), fps=fps)
+
+    # The "height" projection only places the ball in frames with a player, so a
+    # hit can be without a ball position
+    for frame_num in ball_hit_frames:
+        player_stats.add_hit(frame_num,
+                             ball_mini_court_detections[frame_num].get(1),
+                             player_mini_court_detections[frame_num])
+
+    return player_stats
+
+@profiled("annotate_frames", frames=0)
+def annotate_frames(frames, start_frame, player_tracker, ball_tracker, court_line_detector, mini_court, analysis,
+                    num_workers=1):
+    """
+    Draws every overlay onto a chunk of frames and returns the annotated frames.
+    The analysis always covers the whole video, start_frame tells which frames
+    of the video the chunk holds.
+
+    :param frames: list of NumPy arrays representing consecutive video frames
+    :param start_frame: frame number of the first frame in frames
+    :param player_tracker: PlayerTracker object
+    :param ball_tracker: BallTracker object
+    :param court_line_detector: CourtLineDetector object
+    :param mini_court: MiniCourt object
+    :param analysis: dictionary returned by analyze_detections
+    :param num_workers: number of threads the frames are drawn on, see Compositor
+    """
+    end_frame = start_frame + len(frames)
+
+    # Court keypoints of every frame in the chunk
+    court_keypoints = as_court_keypoints(analysis["court_keypoints"]).get_per_frame(range(start_frame, end_frame))
+
+    return draw_annotations(frames, start_frame, player_tracker, ball_tracker, court_line_detector, mini_court,
+                            court_keypoints,
+                            analysis["player_detections"][start_frame:end_frame],
+                            analysis["ball_detections"][start_frame:end_frame],
+                            analysis["player_mini_court_detections"][start_frame:end_frame],
+                            analysis["ball_mini_court_detections"][start_frame:end_frame],
+                            analysis["player_stats"].get_columns(start_frame, end_frame),
+                            num_workers=num_workers)
+
+def draw_annotations(frames, start_frame, player_tracker, ball_tracker, court_line_detector, mini_court,
+                     court_keypoints, player_detections, ball_detections,
+                     player_mini_court_detections, ball_mini_court_detections, player_stats, num_workers=1):
+    """
+    Draws every overlay onto frames in place and returns them. All detections
+    and stats hold one entry per frame in frames.
+
+    The overlays are layers of a Compositor, which draws all of them onto a
+    frame before moving on to the next one.
+
+    :param frames: list of NumPy arrays representing consecutive video frames
+    :param start_frame: frame number of the first frame in frames
+    :param court_keypoints: list of court keypoint coordinates, or a (len(frames), 28)
+                            array with the keypoints of each frame
+    :param player_detections: Detections of player IDs to bounding box coordinates
+    :param ball_detections: Detections of the ball's ID to bounding box coordinates
+    :param player_mini_court_detections: Detections of player IDs to mini court positions
+    :param ball_mini_court_detections: Detections of the ball's ID to mini court position
+    :param player_stats: dictionary of stats column names to arrays
+    :param num_workers: number of threads the frames are drawn on, see Compositor
+    """
+    compositor = Compositor(num_workers=num_workers)
+
+    # Court keypoints
+    compositor.add_layer(CourtKeypointsLayer(court_line_detector, court_keypoints, first_frame=start_frame))
+
+    # Bounding boxes of the players and the ball
+    compositor.add_layer(DetectionsLayer(player_tracker.draw_bounding_boxes_on_frame, player_detections,
+                                         first_frame=start_frame, name="player_boxes"))
+    compositor.add_layer(DetectionsLayer(ball_tracker.draw_bounding_boxes_on_frame, ball_detections,
+                                         first_frame=start_frame, name="ball_boxes"))
+
+    # Mini court with the real-time player and ball movement on it
+    compositor.add_layer(MiniCourtLayer(mini_court))
+    compositor.add_layer(DetectionsLayer(partial(mini_court.draw_points_on_frame, color=(255, 0, 0)),
+                                         player_mini_court_detections,
+                                         first_frame=start_frame, name="mini_court_players"))
+    compositor.add_layer(DetectionsLayer(mini_court.draw_points_on_frame, ball_mini_court_detections,
+                                         first_frame=start_frame, name="mini_court_ball"))
+
+    # Player stats and the frame number in the top left corner
+    compositor.add_layer(PlayerStatsLayer(player_stats, first_frame=start_frame))
+    compositor.add_layer(FrameNumberLayer())
+
+    return compositor.render(frames, start_frame)
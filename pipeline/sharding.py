@@ -0,0 +1,367 @@
+import os
+import tempfile
+from multiprocessing import Pool
+import numpy as np
+from utils import (Detections,
+                   CourtKeypoints,
+                   read_video_frames,
+                   read_video_chunks,
+                   get_video_frame_count,
+                   get_video_fps,
+                   batch_frames,
+                   save_video,
+                   concatenate_videos,
+                   FrameScaler)
+from mini_court import MiniCourt
+from trackers import CourtTracker
+from detection_cache import DetectionCache
+from .pipeline import load_models, export_models, analyze_detections, annotate_frames
+
+# Models of the current worker process, loaded once by init_worker
+worker_models = None
+
+def init_worker(player_model_path, ball_model_path, court_model_path, cache_dir, cache_size_mb, court_backend,
+                num_threads, ball_roi_tracking, player_keyframe_interval, player_keyframe_motion, player_gap_fill,
+                player_model_format, ball_model_format):
+    """
+    Loads the models once per worker process so every task reuses them.
+    """
+    global worker_models
+
+    # Every worker evicts the shared cache, so all of them need the same size limit
+    cache = DetectionCache(cache_dir, max_size_bytes=cache_size_mb * 1024 ** 2) if cache_dir is not None else None
+    worker_models = load_models(player_model_path, ball_model_path, court_model_path, cache=cache,
+                                court_backend=court_backend, num_threads=num_threads,
+                                ball_roi_tracking=ball_roi_tracking,
+                                player_keyframe_interval=player_keyframe_interval,
+                                player_keyframe_motion=player_keyframe_motion,
+                                player_gap_fill=player_gap_fill,
+                                player_model_format=player_model_format,
+                                ball_model_format=ball_model_format)
+
+def detect_segment(video_path, start_frame, end_frame, overlap, batch_size,
+                   static_court=False, court_change_threshold=0.4, detection_size=None):
+    """
+    Runs player and ball detection on frames [start_frame, end_frame) of a video.
+    The player tracker additionally warms up on the overlap frames before
+    start_frame, which are used to match track IDs with the previous segment.
+
+    :return: (player Detections covering [start_frame - overlap, end_frame),
+              ball Detections covering [start_frame, end_frame),
+              CourtKeypoints of [start_frame, end_frame), or None with static_court
+              unless start_frame is 0)
+    """
+    player_tracker, ball_tracker, court_line_detector = worker_models
+
+    # Every segment starts new tracks, like a single-process run does at frame 0
+    player_tracker.reset_tracks()
+    ball_tracker.reset_tracks()
+    frame_num = max(0, start_frame - overlap)
+
+    # All detectors run on the same downscaled copy of each frame, see FrameScaler
+    frame_scaler = FrameScaler(detection_size)
+
+    # A static court is only predicted on the first frame of the video
+    court_tracker = CourtTracker(court_line_detector,
+                                 change_threshold=float("inf") if static_court else court_change_threshold,
+                                 frame_scaler=frame_scaler)
+    track_court = not static_court or start_frame == 0
+
+    player_detections = []
+    ball_detections = []
+
+    for frames in batch_frames(frame_scaler.downscale_frames(read_video_frames(video_path, frame_num, end_frame)),
+                               batch_size):
+        player_detections.extend(player_tracker.detect_next_frames(frames))
+
+        # Ball detection and court tracking skip the overlap frames before start_frame,
+        # with ROI tracking the ball is searched in the full first frame of the segment
+        first_segment_frame = max(0, start_frame - frame_num)
+        ball_detections.extend(ball_tracker.detect_frames(frames[first_segment_frame:], batch_size=batch_size))
+
+        if track_court:
+            court_tracker.track(frames[first_segment_frame:], start_frame=frame_num + first_segment_frame)
+
+        frame_num += len(frames)
+
+    # Frames after the last player keyframe
+    player_detections.extend(player_tracker.flush_frames())
+
+    court_keypoints = court_tracker.court_keypoints if track_court else None
+
+    return (frame_scaler.remap_detections(Detections.from_dicts(player_detections)),
+            frame_scaler.remap_detections(Detections.from_dicts(ball_detections)),
+            court_keypoints)
+
+def analyze_segment_detections(player_detections, ball_detections, court_keypoints, frame_shape, projection,
+                               video_fps=24):
+    """
+    Runs analyze_detections on the stitched detections of the whole video.
+    """
+    player_tracker, ball_tracker, _ = worker_models
+    mini_court = MiniCourt(np.empty(frame_shape, dtype=np.uint8))
+
+    return analyze_detections(player_tracker, ball_tracker, mini_court,
+                              player_detections, ball_detections, court_keypoints,
+                              projection=projection, fps=video_fps)
+
+def annotate_segment(video_path, start_frame, end_frame, output_video_path, analysis, chunk_size,
+                     fps=24, codec="MJPG"):
+    """
+    Annotates frames [start_frame, end_frame) of a video and writes them to
+    output_video_path, chunk_size frames at a time.
+    """
+    player_tracker, ball_tracker, court_line_detector = worker_models
+    mini_court = None
+
+    def annotated_frames():
+        nonlocal mini_court
+
+        for chunk_start_frame, frames in read_video_chunks(video_path, chunk_size, start_frame, end_frame):
+            if mini_court is None:
+                mini_court = MiniCourt(frames[0])
+
+            yield from annotate_frames(frames, chunk_start_frame,
+                                       player_tracker, ball_tracker, court_line_detector,
+                                       mini_court, analysis)
+
+    save_video(annotated_frames(), output_video_path, fps=fps, codec=codec)
+
+    return output_video_path
+
+def get_box_ious(boxes_1, boxes_2):
+    """
+    Returns the intersection over union of two (N, 4) arrays of bounding boxes, row by row.
+    """
+    intersection_width = np.clip(np.minimum(boxes_1[:, 2], boxes_2[:, 2]) - np.maximum(boxes_1[:, 0], boxes_2[:, 0]), 0, None)
+    intersection_height = np.clip(np.minimum(boxes_1[:, 3], boxes_2[:, 3]) - np.maximum(boxes_1[:, 1], boxes_2[:, 1]), 0, None)
+    intersection = intersection_width * intersection_height
+
+    area_1 = (boxes_1[:, 2] - boxes_1[:, 0]) * (boxes_1[:, 3] - boxes_1[:, 1])
+    area_2 = (boxes_2[:, 2] - boxes_2[:, 0]) * (boxes_2[:, 3] - boxes_2[:, 1])
+
+    return intersection / np.maximum(area_1 + area_2 - intersection, 1e-9)
+
+def stitch_player_detections(segment_detections, num_frames, overlap, min_iou=0.5):
+    """
+    Joins the player detections of consecutive segments into Detections of the
+    whole video. Each segment tracked its own IDs, so IDs of a segment are matched
+    to the stitched IDs of the previous segment by their mean IoU over the overlap
+    frames both saw. IDs without a match get new IDs that weren't used before.
+
+    :param segment_detections: list of (start_frame, end_frame, Detections) where the
+                               Detections start overlap frames before start_frame
+    :param num_frames: number of frames in the video
+    :param overlap: number of frames each segment was warmed up on
+    :param min_iou: minimum mean IoU for two IDs to be considered the same player
+    """
+    frame_indices = []
+    track_ids = []
+    coords = []
+    next_track_id = 1
+
+    for start_frame, end_frame, detections in segment_detections:
+        warmup_start_frame = max(0, start_frame - overlap)
+        segment_frames = detections.frame_indices + warmup_start_frame
+        segment_ids = detections.track_ids
+        id_map = {}
+
+        if start_frame == 0:
+            # The first segment keeps its IDs, so a single segment gives the same IDs
+            # as a single-process run
+            id_map = {int(track_id): int(track_id) for track_id in np.unique(segment_ids)}
+        elif len(frame_indices) > 0:
+            # Stitched detections of the previous segment, which cover the overlap frames
+            stitched_frames = frame_indices[-1]
+            stitched_ids = track_ids[-1]
+            stitched_coords = coords[-1]
+            in_overlap = stitched_frames >= warmup_start_frame
+
+            # Pair every detection in the segment's overlap frames with every
+            # stitched detection of the same frame
+            scores = {}
+
+            for row in np.flatnonzero(segment_frames < start_frame):
+                same_frame = np.flatnonzero(in_overlap & (stitched_frames == segment_frames[row]))
+
+                if len(same_frame) == 0:
+                    continue
+
+                ious = get_box_ious(np.repeat(detections.coords[row:row + 1], len(same_frame), axis=0),
+                                    stitched_coords[same_frame])
+
+                for stitched_row, iou in zip(same_frame, ious):
+                    key = (int(segment_ids[row]), int(stitched_ids[stitched_row]))
+                    scores[key] = scores.get(key, 0.0) + iou
+
+            # Mean IoU over the overlap frames the segment ID appears in
+            overlap_counts = dict(zip(*np.unique(segment_ids[segment_frames < start_frame], return_counts=True)))
+            mean_ious = {key: score / overlap_counts[key[0]] for key, score in scores.items()}
+
+            # Greedily match the most overlapping pairs first
+            used_stitched_ids = set()
+
+            for (segment_id, stitched_id), mean_iou in sorted(mean_ious.items(), key=lambda x: -x[1]):
+                if mean_iou < min_iou or segment_id in id_map or stitched_id in used_stitched_ids:
+                    continue
+
+                id_map[segment_id] = stitched_id
+                used_stitched_ids.add(stitched_id)
+
+        # Keep only the frames the segment is responsible for
+        keep = (segment_frames >= start_frame) & (segment_frames < end_frame)
+
+        for track_id in np.unique(segment_ids[keep]):
+            if int(track_id) not in id_map:
+                id_map[int(track_id)] = next_track_id
+                next_track_id += 1
+
+        next_track_id = max([next_track_id, *[track_id + 1 for track_id in id_map.values()]])
+
+        frame_indices.append(segment_frames[keep])
+        track_ids.append(np.array([id_map[int(track_id)] for track_id in segment_ids[keep]], dtype=np.int64))
+        coords.append(detections.coords[keep])
+
+    return Detections.from_arrays(np.concatenate(frame_indices),
+                                  np.concatenate(track_ids),
+                                  np.concatenate(coords).reshape(-1, 4),
+                                  num_frames)
+
+def run_sharded(input_video_path, output_video_path,
+                player_model_path, ball_model_path, court_model_path,
+                num_workers=os.cpu_count(), segment_length=None, overlap=48,
+                batch_size=1, chunk_size=64, projection="height", cache_dir=None, cache_size_mb=1024,
+                static_court=False, court_change_threshold=0.4, court_backend="eager", num_threads=None,
+                ball_roi_tracking=False, player_keyframe_interval=1, player_keyframe_motion=0.15,
+                player_gap_fill="interpolate", player_model_format="pytorch", ball_model_format="pytorch",
+                detection_size=None, codec="MJPG", fps=None):
+    """
+    Runs the full analysis with the video split into time segments that are
+    detected and annotated in parallel by a pool of worker processes.
+
+    All post-processing (interpolation, filtering, ball hits, stats) runs once on
+    the stitched detections of the whole video. Detection itself isn't exactly the
+    same as in a single-process run near segment boundaries, because everything
+    that carries state from frame to frame starts over in every segment:
+
+    - player tracking is warmed up on overlap frames before each segment and track
+      IDs are matched to the previous segment's by IoU, so a player can get a new ID
+    - the tracker starts over at the warm-up frames, so a track near a boundary can
+      be confirmed at a different frame
+    - player keyframes start over in every segment, so frames near a boundary can
+      be detected instead of filled in
+    - ROI ball tracking searches the full first frame of every segment
+    - the court keypoints are predicted again on the first frame of every segment
+
+    Full frame ball detection has no state, so its detections are the same. Every
+    segment is decoded from exactly its first frame (see
+    VideoDecoder.open_at_start_frame), so the detectors see the same frames as in a
+    single-process run and the warm-up frames line up with the previous segment's.
+
+    :param input_video_path: path to the video to analyze
+    :param output_video_path: path of the annotated video to write
+    :param num_workers: number of worker processes
+    :param segment_length: number of frames per segment, defaults to an equal split across workers
+    :param overlap: number of frames before each segment the player tracker warms up on
+    :param batch_size: number of frames passed through the YOLO models at once
+    :param chunk_size: number of frames annotated at once by each worker
+    :param projection: how positions are mapped onto the mini court ("height" or "homography")
+    :param cache_dir: optional directory of a DetectionCache shared by the workers
+    :param cache_size_mb: size limit of the shared DetectionCache in megabytes
+    :param static_court: only predict the court keypoints on the first frame of the video
+    :param court_change_threshold: frame difference above which a worker looks up the
+                                   court keypoints again, see CourtTracker
+    :param court_backend: how the court keypoints CNN is run ("eager", "torchscript" or "onnx")
+    :param num_threads: number of CPU threads used for inference by each worker, defaults to
+                        the CPUs split evenly across the workers so they don't compete
+    :param ball_roi_tracking: only detect the ball in a region around its predicted position
+    :param player_keyframe_interval: largest number of frames between two frames the player
+                                     model runs on, 1 detects players in every frame
+    :param player_keyframe_motion: how far a player may move between two keyframes, as a
+                                   fraction of its height
+    :param player_gap_fill: how players are filled in between keyframes ("interpolate" or "flow")
+    :param player_model_format: how the player YOLO weights are run ("pytorch", "onnx" or "onnx_int8")
+    :param ball_model_format: how the ball YOLO weights are run ("pytorch", "onnx" or "onnx_int8")
+    :param detection_size: longest side in pixels of the downscaled frames the detectors run on,
+                           None runs them on the source frames, see FrameScaler
+    :param codec: codec of the annotated video, see save_video
+    :param fps: frame rate of the annotated video, None uses the input video's
+    """
+    num_frames = get_video_frame_count(input_video_path)
+
+    # Speeds are timed by the input's frame rate, whatever rate the output is written at
+    video_fps = get_video_fps(input_video_path)
+
+    if fps is None:
+        fps = video_fps
+
+    if num_frames <= 0:
+        # Some containers don't report a frame count, the video is then read as one segment
+        segments = [(0, None)]
+    else:
+        if segment_length is None:
+            segment_length = -(-num_frames // num_workers)
+
+        segment_length = max(1, segment_length)
+
+        # The last segment reads until the end of the video in case the container
+        # reported the frame count slightly off
+        segments = [(start_frame, start_frame + segment_length)
+                    for start_frame in range(0, num_frames, segment_length)]
+        segments[-1] = (segments[-1][0], None)
+
+    frame_shape = next(read_video_frames(input_video_path)).shape
+
+    if num_threads is None:
+        num_threads = max(1, os.cpu_count() // num_workers)
+
+    # Exports are written once here, the workers only load them
+    export_models(player_model_path, ball_model_path, court_model_path, court_backend=court_backend,
+                  player_model_format=player_model_format, ball_model_format=ball_model_format)
+
+    with Pool(num_workers, initializer=init_worker,
+              initargs=(player_model_path, ball_model_path, court_model_path, cache_dir, cache_size_mb,
+                        court_backend, num_threads, ball_roi_tracking,
+                        player_keyframe_interval, player_keyframe_motion, player_gap_fill,
+                        player_model_format, ball_model_format)) as pool:
+        segment_results = pool.starmap(detect_segment,
+                                       [(input_video_path, start_frame, end_frame, overlap, batch_size,
+                                         static_court, court_change_threshold, detection_size)
+                                        for start_frame, end_frame in segments])
+
+        # The real number of frames is what the segments actually read
+        num_frames = segments[-1][0] + segment_results[-1][1].num_frames
+        segments[-1] = (segments[-1][0], num_frames)
+
+        player_detections = stitch_player_detections([(start_frame, end_frame, player_detections)
+                                                      for (start_frame, end_frame), (player_detections, _, _)
+                                                      in zip(segments, segment_results)],
+                                                     num_frames,
+                                                     overlap)
+        ball_detections = Detections.from_dicts([ball_dict
+                                                 for _, segment_ball_detections, _ in segment_results
+                                                 for ball_dict in segment_ball_detections])
+
+        # Each worker tracked the court through its own segment, starting with a
+        # prediction on its first frame
+        court_keypoints = CourtKeypoints.concatenate([segment_court_keypoints
+                                                      for _, _, segment_court_keypoints in segment_results
+                                                      if segment_court_keypoints is not None])
+
+        analysis = pool.apply(analyze_segment_detections,
+                              (player_detections, ball_detections, court_keypoints, frame_shape, projection,
+                               video_fps))
+
+        # Segments are written in the output's container so they can be joined without re-encoding
+        segment_extension = os.path.splitext(output_video_path)[1] or ".avi"
+
+        with tempfile.TemporaryDirectory() as segment_dir:
+            segment_video_paths = pool.starmap(annotate_segment,
+                                               [(input_video_path, start_frame, end_frame,
+                                                 os.path.join(segment_dir, f"segment_{i}{segment_extension}"),
+                                                 analysis, chunk_size, fps, codec)
+                                                for i, (start_frame, end_frame) in enumerate(segments)])
+
+            concatenate_videos(segment_video_paths, output_video_path, fps=fps, codec=codec)
+
+    return analysis
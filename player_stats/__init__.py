@@ -0,0 +1 @@
+from .player_stats import PlayerStats
@@ -0,0 +1,185 @@
+from utils import distance_between_points, convert_pixels_to_meters
+from bisect import bisect_right
+import constants
+import numpy as np
+import pandas as pd
+
+# Running totals kept for each player, in the order of the stats columns
+PLAYER_TOTALS = ["number_of_shots",
+                 "total_shot_speed",
+                 "last_shot_speed",
+                 "total_player_speed",
+                 "last_player_speed"]
+
+class PlayerStats:
+    """
+    Shot statistics of both players, updated incrementally as ball hits arrive.
+
+    A shot goes from one hit to the next, so its speed is known once the next
+    hit arrives. The updated totals are stored as a snapshot starting at the
+    shot's first hit, and the stats of any frame are those of the last snapshot
+    at or before it. Only one snapshot per hit is kept, never a row per frame.
+    """
+    def __init__(self, mini_court_width, fps=24):
+        """
+        :param mini_court_width: width of the mini court in pixels, used to convert
+                                 mini court distances to meters
+        :param fps: frame rate of the video
+        """
+        self.mini_court_width = mini_court_width
+        self.fps = fps
+
+        # Frame numbers where the snapshots start (sorted) and the totals of each
+        # snapshot, indexed [player - 1][PLAYER_TOTALS index]
+        self.snapshot_frames = [0]
+        self.snapshots = [np.zeros((2, len(PLAYER_TOTALS)))]
+
+        # Last hit seen, whose shot ends at the next hit
+        self.previous_hit = None
+
+        # Snapshot returned by the last get_stats call, so reading frames in
+        # order doesn't need to search the snapshots
+        self.cursor = 0
+
+    def add_hit(self, frame_num, ball_position, player_positions):
+        """
+        Records a ball hit. Hits have to be added in order.
+
+        :param frame_num: frame number of the hit
+        :param ball_position: mini court (x, y) position of the ball at the hit, or None
+                              when the ball isn't on the mini court in that frame
+        :param player_positions: dictionary of player IDs to mini court (x, y) positions at the hit
+        """
+        if self.previous_hit is not None:
+            self.add_shot(*self.previous_hit, frame_num, ball_position, player_positions)
+
+        self.previous_hit = (frame_num, ball_position, player_positions)
+
+    def add_shot(self, start_frame, start_ball_position, start_player_positions,
+                 end_frame, end_ball_position, end_player_positions):
+        """
+        Updates the totals with the shot between two consecutive hits.
+        """
+        # The hit still ends the previous shot and starts the next one without a
+        # ball position, only the shots the ball is missing from are left out
+        if start_ball_position is None or end_ball_position is None:
+            return
+
+        ball_shot_time_seconds = (end_frame - start_frame) / self.fps
+
+        # Speed of the ball shot in km/h
+        ball_distance_covered_pixels = distance_between_points(start_ball_position, end_ball_position)
+        ball_distance_covered_meters = convert_pixels_to_meters(ball_distance_covered_pixels,
+                                                                constants.DOUBLES_LINE_WIDTH,
+                                                                self.mini_court_width)
+        speed_of_ball_shot = ball_distance_covered_meters / ball_shot_time_seconds * 3.6
+
+        # Who shot the ball and how far the opponent ran can only be told with both
+        # players detected at both hits. A player missing at either (occluded, or
+        # out of the frame) leaves the shot out, average player speeds are taken
+        # over the opponent's shots so they stay consistent
+        if not all(player_id in positions for player_id in (1, 2)
+                   for positions in (start_player_positions, end_player_positions)):
+            return
+
+        # Player who shot the ball is the closest one to it
+        player_shot_ball = min((1, 2),
+                               key=lambda id: distance_between_points(start_player_positions[id], start_ball_position))
+        opponent_player_id = 1 if player_shot_ball == 2 else 2
+
+        # Speed of the opponent while the ball travelled
+        distance_covered_by_opponent_pixels = distance_between_points(start_player_positions[opponent_player_id],
+                                                                      end_player_positions[opponent_player_id])
+        distance_covered_by_opponent_meters = convert_pixels_to_meters(distance_covered_by_opponent_pixels,
+                                                                       constants.DOUBLES_LINE_WIDTH,
+                                                                       self.mini_court_width)
+        opponent_player_speed = distance_covered_by_opponent_meters / ball_shot_time_seconds * 3.6
+
+        # Build off the previous snapshot since stats accumulate
+        totals = self.snapshots[-1].copy()
+
+        shooter = totals[player_shot_ball - 1]
+        shooter[0] += 1
+        shooter[1] += speed_of_ball_shot
+        shooter[2] = speed_of_ball_shot
+
+        opponent = totals[opponent_player_id - 1]
+        opponent[3] += opponent_player_speed
+        opponent[4] = opponent_player_speed
+
+        # A shot starting at frame 0 replaces the empty stats
+        if start_frame == self.snapshot_frames[-1]:
+            self.snapshots[-1] = totals
+        else:
+            self.snapshot_frames.append(start_frame)
+            self.snapshots.append(totals)
+
+    def get_snapshot_index(self, frame_num):
+        """
+        Returns the index of the snapshot frame_num falls in.
+        """
+        cursor = self.cursor
+
+        # Frames read in order are almost always in the same or the next snapshot
+        for index in (cursor, cursor + 1):
+            if index < len(self.snapshot_frames) and self.snapshot_frames[index] <= frame_num and \
+               (index + 1 == len(self.snapshot_frames) or frame_num < self.snapshot_frames[index + 1]):
+                self.cursor = index
+                return index
+
+        self.cursor = max(bisect_right(self.snapshot_frames, frame_num) - 1, 0)
+
+        return self.cursor
+
+    def get_stats(self, frame_num):
+        """
+        Returns a dictionary of the stats at frame_num, with the same keys as
+        the columns of get_columns.
+
+        :param frame_num: frame number to get the stats of
+        """
+        columns = self.get_columns_from_totals(self.snapshots[self.get_snapshot_index(frame_num)][np.newaxis])
+
+        return {"frame_num": frame_num, **{name: values[0] for name, values in columns.items()}}
+
+    def get_columns(self, start_frame, end_frame):
+        """
+        Returns a dictionary of column names to arrays with the stats of frames
+        [start_frame, end_frame), e.g. the frames of a chunk being annotated.
+
+        :param start_frame: first frame number
+        :param end_frame: frame number to stop before
+        """
+        frame_nums = np.arange(start_frame, end_frame)
+        snapshot_indices = np.searchsorted(self.snapshot_frames, frame_nums, side="right") - 1
+        totals = np.stack(self.snapshots)[np.maximum(snapshot_indices, 0)]
+
+        return {"frame_num": frame_nums, **self.get_columns_from_totals(totals)}
+
+    def get_columns_from_totals(self, totals):
+        """
+        Returns the stats columns for an (N, 2, len(PLAYER_TOTALS)) array of totals.
+        """
+        columns = {}
+
+        for player in (1, 2):
+            for index, name in enumerate(PLAYER_TOTALS):
+                columns[f"player_{player}_{name}"] = totals[:, player - 1, index]
+
+        # Averages are NaN until there was a shot to average over. Player speeds are
+        # recorded on the opponent's shots
+        with np.errstate(divide="ignore", invalid="ignore"):
+            columns["player_1_average_shot_speed"] = columns["player_1_total_shot_speed"] / columns["player_1_number_of_shots"]
+            columns["player_2_average_shot_speed"] = columns["player_2_total_shot_speed"] / columns["player_2_number_of_shots"]
+            columns["player_1_average_player_speed"] = columns["player_1_total_player_speed"] / columns["player_2_number_of_shots"]
+            columns["player_2_average_player_speed"] = columns["player_2_total_player_speed"] / columns["player_1_number_of_shots"]
+
+        return columns
+
+    def to_dataframe(self, num_frames):
+        """
+        Returns a dataframe with one row of stats per frame.
+
+        :param num_frames: number of frames in the video
+        """
+        return pd.DataFrame(self.get_columns(0, num_frames))
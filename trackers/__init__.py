@@ -1,2 +1,8 @@
 from .player_tracker import PlayerTracker
-from .ball_tracker import BallTracker
\ No newline at end of file
+from .ball_tracker import BallTracker
+from .online_ball_tracker import OnlineBallInterpolator, OnlineBallHitDetector
+from .ball_motion_model import BallMotionModel
+from .court_tracker import CourtTracker
+from .player_keyframes import PlayerKeyframeFiller, GAP_FILL_MODES
+from .player_filter import PlayerTrackFilter
+from .yolo_models import load_yolo_model, export_yolo_model, MODEL_FORMATS
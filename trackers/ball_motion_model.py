@@ -0,0 +1,101 @@
+import numpy as np
+
+class BallMotionModel:
+    """
+    Constant velocity Kalman filter of the ball's center in pixel coordinates.
+    The state is (x, y, x velocity, y velocity) in pixels and pixels per
+    frame. Changes in velocity (gravity, bounces, hits) are treated as noise,
+    which makes the predicted position less certain the longer the ball goes
+    without being detected.
+    """
+    def __init__(self, acceleration_std=4.0, measurement_std=2.0, initial_velocity_std=30.0):
+        """
+        :param acceleration_std: expected change in velocity per frame, in pixels per frame
+        :param measurement_std: expected error of a detected ball center, in pixels
+        :param initial_velocity_std: expected speed of a newly detected ball, in pixels per frame
+        """
+        self.acceleration_std = acceleration_std
+        self.measurement_std = measurement_std
+        self.initial_velocity_std = initial_velocity_std
+
+        # Only positions are measured
+        self.measurement_matrix = np.array([[1.0, 0.0, 0.0, 0.0],
+                                            [0.0, 1.0, 0.0, 0.0]])
+        self.measurement_covariance = np.eye(2) * measurement_std ** 2
+
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets the ball, the next update starts a new track.
+        """
+        self.state = None
+        self.covariance = None
+        self.frame_num = None
+
+    def is_tracking(self):
+        return self.state is not None
+
+    def get_transition(self, num_frames):
+        """
+        Returns the (transition matrix, process noise covariance) that move the
+        state num_frames frames ahead.
+        """
+        transition = np.eye(4)
+        transition[0, 2] = transition[1, 3] = num_frames
+
+        # A random constant acceleration over the num_frames frames (the usual discrete
+        # white noise acceleration model with a time step of num_frames)
+        noise_gain = np.array([0.5 * num_frames ** 2, 0.5 * num_frames ** 2, num_frames, num_frames])
+        process_covariance = np.diag(noise_gain ** 2) * self.acceleration_std ** 2
+
+        # x and y positions are correlated with their own velocities
+        process_covariance[0, 2] = process_covariance[2, 0] = noise_gain[0] * noise_gain[2] * self.acceleration_std ** 2
+        process_covariance[1, 3] = process_covariance[3, 1] = noise_gain[1] * noise_gain[3] * self.acceleration_std ** 2
+
+        return transition, process_covariance
+
+    def propagate(self, frame_num):
+        """
+        Returns the (state, covariance) predicted for frame_num, without changing the model.
+        """
+        transition, process_covariance = self.get_transition(frame_num - self.frame_num)
+
+        return transition @ self.state, transition @ self.covariance @ transition.T + process_covariance
+
+    def predict(self, frame_num):
+        """
+        Returns the predicted (x, y) center of the ball in frame_num and the
+        standard deviation of that prediction in pixels.
+        """
+        state, covariance = self.propagate(frame_num)
+
+        return state[:2], float(np.sqrt(max(covariance[0, 0], covariance[1, 1])))
+
+    def update(self, frame_num, position):
+        """
+        Corrects the model with the ball's detected center in frame_num, starting
+        a new track if there is none.
+
+        :param frame_num: frame number, increasing with every call
+        :param position: (x, y) center of the detected ball
+        """
+        position = np.asarray(position, dtype=np.float64)
+
+        if self.state is None:
+            self.state = np.array([position[0], position[1], 0.0, 0.0])
+            self.covariance = np.diag([self.measurement_std ** 2, self.measurement_std ** 2,
+                                       self.initial_velocity_std ** 2, self.initial_velocity_std ** 2])
+            self.frame_num = frame_num
+            return
+
+        state, covariance = self.propagate(frame_num)
+
+        # Standard Kalman correction
+        residual = position - self.measurement_matrix @ state
+        residual_covariance = self.measurement_matrix @ covariance @ self.measurement_matrix.T + self.measurement_covariance
+        gain = covariance @ self.measurement_matrix.T @ np.linalg.inv(residual_covariance)
+
+        self.state = state + gain @ residual
+        self.covariance = (np.eye(4) - gain @ self.measurement_matrix) @ covariance
+        self.frame_num = frame_num
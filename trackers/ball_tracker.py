@@ -1,18 +1,91 @@
-from ultralytics import YOLO
 import cv2
-import pickle
 import pandas as pd
+import numpy as np
+from utils import batch_frames, Detections, as_detections
+from .ball_motion_model import BallMotionModel
+from .yolo_models import load_yolo_model
+from instrumentation import profiled
 
 class BallTracker:
-    def __init__(self, model_path):
-        self.model = YOLO(model_path)
+    def __init__(self, model_path, cache=None, roi_tracking=False, roi_size=192, roi_imgsz=320, max_roi_misses=2,
+                 model_format="pytorch"):
+        """
+        :param model_path: path to the ball detection YOLO weights
+        :param cache: optional DetectionCache
+        :param roi_tracking: predict where the ball goes next and only detect it in a
+                             region around that, see detect_batch_roi
+        :param roi_size: smallest side in pixels of the region cropped around the
+                         predicted ball, it grows with the uncertainty of the prediction
+        :param roi_imgsz: size the region is scaled to for the model, larger than
+                          roi_size so the ball is seen at a higher resolution than in
+                          the full frame
+        :param max_roi_misses: number of frames in a row the ball can be missed in its
+                               region before falling back to full frame detection
+        :param model_format: how the weights are run, see load_yolo_model
+        """
+        self.model_format = model_format
+        self.model = self.load_model(model_path)
+
+        # Minimum confidence threshold for a ball detection
+        self.conf = 0.15
+
+        self.roi_tracking = roi_tracking
+        self.roi_size = roi_size
+        self.roi_imgsz = roi_imgsz
+        self.max_roi_misses = max_roi_misses
+
+        # Where the ball is expected next, used by roi_tracking
+        self.ball_motion_model = BallMotionModel()
+        self.roi_misses = 0
+        self.frame_num = 0
+
+        # Optional DetectionCache, results are keyed on the model weights and
+        # conf so changing either never reuses stale detections. Regions are
+        # keyed on their own pixels, so a region is only reused when the
+        # same part of the same frame is cropped again
+        self.cache = cache
+
+        if cache is not None:
+            parameters = {"conf": self.conf}
+
+            # Exported and quantized models give slightly different boxes than the weights
+            if model_format != "pytorch":
+                parameters.update(model_format=model_format)
+
+            self.cache_namespace = cache.get_namespace("ball", model_path, parameters)
+            self.roi_cache_namespace = cache.get_namespace("ball_roi", model_path,
+                                                           {**parameters, "imgsz": roi_imgsz})
+
+    def load_model(self, model_path):
+        """
+        Returns the YOLO model the ball is detected with, benchmarks override this with a stub.
+        """
+        return load_yolo_model(model_path, self.model_format)
 
+    def reset_tracks(self):
+        """
+        Forgets the ball's motion so the next frame is searched in full, e.g.
+        before detecting another video or a new part of one.
+        """
+        self.ball_motion_model.reset()
+        self.roi_misses = 0
+        self.frame_num = 0
+
+    @profiled("BallTracker.interpolate_ball_positions")
     def interpolate_ball_positions(self, ball_positions):
-        # Get bounding box coordinates otherwise empty list
-        ball_positions = [x.get(1, []) for x in ball_positions]
+        """
+        Returns the ball detections with the frames where the ball wasn't
+        detected filled in by linear interpolation.
+
+        :param ball_positions: Detections (or list of dictionaries) of the ball's ID
+                               to bounding box coordinates
+        :return: Detections with one ball bounding box per frame
+        """
+        # Get one row of bounding box coordinates per frame, NaN where the
+        # ball wasn't detected
+        ball_positions = as_detections(ball_positions).to_dense(1)
 
-        # Convert list into a pandas dataframe
-        # Empty lists become NaN
+        # Convert array into a pandas dataframe
         df_ball_positions = pd.DataFrame(ball_positions, columns=["x1", "y1", "x2", "y2"])
 
         # Interpolate missing values and backfill where start
@@ -20,78 +93,109 @@ class BallTracker:
         df_ball_positions = df_ball_positions.interpolate()
         df_ball_positions = df_ball_positions.bfill()
 
-        ball_positions = [{1: x} for x in df_ball_positions.to_numpy().tolist()]
+        return Detections.from_dense(df_ball_positions.to_numpy(), track_id=1)
     
-        return ball_positions
-    
-    def get_ball_hit_frames(self, ball_positions):
-        # Get bounding box coordinates otherwise empty list
-        ball_positions = [x.get(1, []) for x in ball_positions]
+    @profiled("BallTracker.get_ball_hit_frames")
+    def get_ball_hit_frames(self, ball_positions, rolling_window=5, minimum_frames_for_hit=25, hit_window=None):
+        """
+        Returns the frame numbers where the ball was hit. A hit is a change in the
+        ball's vertical direction that holds for at least minimum_frames_for_hit of
+        the hit_window frames that follow it.
 
-        # Convert list into a pandas dataframe
-        # Empty lists become NaN
+        :param ball_positions: Detections (or list of dictionaries) of the ball's ID to
+                               bounding box coordinates
+        :param rolling_window: number of frames the ball's vertical position is smoothed over
+        :param minimum_frames_for_hit: number of frames that need to confirm a direction change
+        :param hit_window: number of frames after a direction change that are checked,
+                           defaults to 1.2 * minimum_frames_for_hit
+        """
+        # Get one row of bounding box coordinates per frame, NaN where the
+        # ball wasn't detected
+        ball_positions = as_detections(ball_positions).to_dense(1)
+
+        # Convert array into a pandas dataframe
         df_ball_positions = pd.DataFrame(ball_positions, columns=["x1", "y1", "x2", "y2"])
 
         # Creates a new mid_y column and mid_y_rolling_mean column
         df_ball_positions["mid_y"] = (df_ball_positions["y1"] + df_ball_positions["y2"]) / 2
-        df_ball_positions["mid_y_rolling_mean"] = df_ball_positions["mid_y"].rolling(window=5, min_periods=1, center=False).mean()
+        df_ball_positions["mid_y_rolling_mean"] = df_ball_positions["mid_y"].rolling(window=rolling_window, min_periods=1, center=False).mean()
 
         # Calculates by taking difference of mid_y_rolling_mean between 2 consecutive rows
-        df_ball_positions["delta_y"] = df_ball_positions["mid_y_rolling_mean"].diff()
-
-        # All frames are initially set to 0 ball hits
-        df_ball_positions["ball_hit"] = 0
-
-        # Sets minimum threshold to determine a hit
-        minimum_frames_for_hit = 25
+        delta_y = df_ball_positions["mid_y_rolling_mean"].diff().to_numpy()
 
         # 1.2 * minimum_frames_for_hit sets a buffer so 25 frames of the
         # 30 frame sequence need to confirm a hit, gives room for inconsistencies
-        for i in range(1, len(df_ball_positions) - int(1.2 * minimum_frames_for_hit)):
-            negative_pos_change = df_ball_positions["delta_y"].iloc[i] > 0 and df_ball_positions["delta_y"].iloc[i + 1] < 0
-            positive_pos_change = df_ball_positions["delta_y"].iloc[i] < 0 and df_ball_positions["delta_y"].iloc[i + 1] > 0
+        if hit_window is None:
+            hit_window = int(1.2 * minimum_frames_for_hit)
+
+        # Candidate frames, the last hit_window frames can't be confirmed
+        candidate_frames = np.arange(1, len(delta_y) - hit_window)
+
+        if len(candidate_frames) == 0:
+            return []
 
-            if negative_pos_change or positive_pos_change:
-                frame_count = 0
+        # Comparisons with NaN are False, so frames without a position never count
+        moving_down = delta_y > 0
+        moving_up = delta_y < 0
 
-                # Compares the next 30 frames to the original ith frame
-                for j in range(i + 1, i + 1 + int(1.2 * minimum_frames_for_hit)):
-                    negative_pos_change_after = df_ball_positions["delta_y"].iloc[i] > 0 and df_ball_positions["delta_y"].iloc[j] < 0
-                    positive_pos_change_after = df_ball_positions["delta_y"].iloc[i] < 0 and df_ball_positions["delta_y"].iloc[j] > 0
+        # Cumulative counts with a leading 0 so the number of frames moving up
+        # in frames [a, b) is moving_up_count[b] - moving_up_count[a]
+        moving_up_count = np.concatenate(([0], np.cumsum(moving_up)))
+        moving_down_count = np.concatenate(([0], np.cumsum(moving_down)))
 
-                    if negative_pos_change and negative_pos_change_after or positive_pos_change and positive_pos_change_after:
-                        frame_count += 1
+        # Direction changes between frame i and frame i + 1
+        negative_pos_change = moving_down[candidate_frames] & moving_up[candidate_frames + 1]
+        positive_pos_change = moving_up[candidate_frames] & moving_down[candidate_frames + 1]
 
-                if frame_count >= minimum_frames_for_hit:
-                    df_ball_positions.loc[i, "ball_hit"] = 1
+        # Number of frames in the hit_window frames after frame i that move
+        # in the new direction
+        window_start = candidate_frames + 1
+        window_end = candidate_frames + 1 + hit_window
+        frames_moving_up = moving_up_count[window_end] - moving_up_count[window_start]
+        frames_moving_down = moving_down_count[window_end] - moving_down_count[window_start]
+
+        ball_hit = ((negative_pos_change & (frames_moving_up >= minimum_frames_for_hit)) |
+                    (positive_pos_change & (frames_moving_down >= minimum_frames_for_hit)))
 
         # Returns the indices (frame numbers) of when a ball hit occurs
-        return df_ball_positions[df_ball_positions["ball_hit"] == 1].index.tolist()
+        return candidate_frames[ball_hit].tolist()
 
-    def detect_frames(self, frames, read_from_stub=False, stub_path=None):
+    def detect_frames(self, frames, read_from_stub=False, stub_path=None, batch_size=1, frame_scaler=None,
+                      stub_key=None):
         """
         Detects tennis balls in a list of video frames.
         
-        :param frames: list of NumPy arrays representing video frames
-        :param read_from_stub: bool indicating whether to read detections from a stub file
-        :param stub_path: path to the stub file for reading/writing detections
-        :return: list of dictionaries mapping the ball ID to bounding box coordinates
+        :param frames: iterable of NumPy arrays representing video frames, frames are
+                       consumed one at a time so a generator (e.g. read_video_frames)
+                       keeps memory usage independent of video length
+        :param read_from_stub: bool indicating whether to read detections from a stub file,
+                               when one was saved at stub_path with stub_key
+        :param stub_path: path to the stub directory for reading/writing detections
+                          (a .pkl path reads/writes the old pickle format)
+        :param batch_size: number of frames passed through the model at once, larger
+                           batches amortize the per-call overhead of the model
+        :param frame_scaler: FrameScaler the frames were downscaled with, the detections
+                             are mapped back to the source frames before being returned
+                             and saved
+        :param stub_key: key the stub is saved with and has to match to be read, e.g.
+                         from get_stub_key, None reads any stub at stub_path
+        :return: Detections of the ball's ID to bounding box coordinates
         """
+        if read_from_stub and stub_path is not None and Detections.is_saved(stub_path, stub_key):
+            return Detections.load(stub_path)
+
         ball_detections = []
 
-        if read_from_stub and stub_path is not None:
-            with open(stub_path, "rb") as f:
-                ball_detections = pickle.load(f)
-            
-            return ball_detections
+        for batch in batch_frames(frames, batch_size):
+            ball_detections.extend(self.detect_batch(batch))
 
-        for frame in frames:
-            ball_dict = self.detect_frame(frame)
-            ball_detections.append(ball_dict)
+        ball_detections = Detections.from_dicts(ball_detections)
+
+        if frame_scaler is not None:
+            ball_detections = frame_scaler.remap_detections(ball_detections)
 
         if stub_path is not None:
-            with open(stub_path, "wb") as f:
-                pickle.dump(ball_detections, f)
+            ball_detections.save(stub_path, key=stub_key)
 
         return ball_detections
 
@@ -101,10 +205,180 @@ class BallTracker:
         
         :param frame: a NumPy array representing a single video frame
         """
+        return self.detect_batch([frame])[0]
+
+    def detect_batch(self, frames, frame_nums=None):
+        """
+        Detects tennis balls in a batch of video frames.
+
+        :param frames: list of NumPy arrays representing video frames
+        :param frame_nums: frame numbers of the frames, only needed with roi_tracking when
+                           frames are skipped (e.g. dropped in live mode), otherwise the
+                           frames are taken to follow the previously detected ones
+        :return: list of dictionaries mapping the ball ID to bounding box coordinates,
+                 one per frame
+        """
+        if frame_nums is None:
+            frame_nums = list(range(self.frame_num, self.frame_num + len(frames)))
 
-        # Need to index 0 because track() returns a list of Result objects, one per input image
+        if frame_nums:
+            self.frame_num = frame_nums[-1] + 1
+
+        if self.roi_tracking:
+            return self.detect_batch_roi(frames, frame_nums)
+
+        return self.detect_full_frames(frames)
+
+    def detect_full_frames(self, frames):
+        """
+        Detects tennis balls in whole frames, taking cached results where possible.
+        """
+        if self.cache is None:
+            return self.predict_full_frames(frames)
+
+        # Only frames that aren't cached go through the model
+        return self.cache.lookup_or_compute(self.cache_namespace,
+                                            frames,
+                                            self.predict_full_frames,
+                                            self.cache.encode_detections,
+                                            self.cache.decode_detections)
+
+    @profiled("BallTracker.predict_full_frames", frames=1)
+    def predict_full_frames(self, frames):
+        """
+        Runs the model on whole frames.
+        """
+        # predict() returns a list of Result objects, one per input image
         # conf sets the minimum confidence threshold for detection
-        results = self.model.predict(frame, conf=0.15)[0]
+        results = self.model.predict(frames, conf=self.conf)
+
+        return [self.get_ball_dict(result) for result in results]
+
+    def detect_batch_roi(self, frames, frame_nums):
+        """
+        Detects tennis balls by only looking around where the ball is expected.
+        The ball's motion is predicted by a constant velocity Kalman filter and
+        the model runs on a region around the predicted position, scaled up to
+        roi_imgsz. That costs a fraction of a full frame and shows the ball at a
+        higher resolution, which helps with small, fast balls. Until the ball
+        is found, and after it was missed in more than max_roi_misses regions
+        in a row, whole frames are searched instead.
+
+        All regions of a batch are predicted from the motion before the batch,
+        so they go through the model at once.
+        """
+        ball_dicts = []
+
+        while len(ball_dicts) < len(frames):
+            start = len(ball_dicts)
+
+            if not self.ball_motion_model.is_tracking():
+                # Search whole frames, once found the following batches use regions again
+                for frame_num, ball_dict in zip(frame_nums[start:], self.detect_full_frames(frames[start:])):
+                    if ball_dict:
+                        self.update_ball_motion(frame_num, ball_dict[1])
+
+                    ball_dicts.append(ball_dict)
+
+                break
+
+            predictions = [self.ball_motion_model.predict(frame_num) for frame_num in frame_nums[start:]]
+            rois = [self.get_roi(frame.shape, position, position_std)
+                    for frame, (position, position_std) in zip(frames[start:], predictions)]
+            roi_dicts = self.detect_rois([frame[y1:y2, x1:x2] for frame, (x1, y1, x2, y2) in zip(frames[start:], rois)])
+
+            for frame_num, (position, _), roi, roi_dict in zip(frame_nums[start:], predictions, rois, roi_dicts):
+                ball_dict = self.get_closest_ball_dict(roi_dict, roi, position)
+
+                if not ball_dict:
+                    self.roi_misses += 1
+
+                    # The ball was lost, this frame and the rest of the batch are searched in full
+                    if self.roi_misses > self.max_roi_misses:
+                        self.ball_motion_model.reset()
+                        break
+                else:
+                    self.update_ball_motion(frame_num, ball_dict[1])
+
+                ball_dicts.append(ball_dict)
+
+        return ball_dicts
+
+    def update_ball_motion(self, frame_num, bounding_box):
+        """
+        Corrects the ball's motion with a detection.
+        """
+        x1, y1, x2, y2 = bounding_box
+        self.ball_motion_model.update(frame_num, ((x1 + x2) / 2, (y1 + y2) / 2))
+        self.roi_misses = 0
+
+    def get_roi(self, frame_shape, position, position_std):
+        """
+        Returns the (x1, y1, x2, y2) region of the frame the ball is searched in,
+        a square centered on the predicted position as far as the frame allows.
+        It is large enough to cover three standard deviations of the prediction
+        on each side, up to twice roi_size.
+        """
+        frame_height, frame_width = frame_shape[:2]
+        size = int(min(max(self.roi_size, 6 * position_std), 2 * self.roi_size))
+        width = min(size, frame_width)
+        height = min(size, frame_height)
+
+        x1 = int(np.clip(position[0] - width / 2, 0, frame_width - width))
+        y1 = int(np.clip(position[1] - height / 2, 0, frame_height - height))
+
+        return x1, y1, x1 + width, y1 + height
+
+    def detect_rois(self, rois):
+        """
+        Detects tennis balls in cropped regions, taking cached results where possible.
+        Returns a dictionary of every detection's index to its bounding box in region
+        coordinates per region.
+
+        :param rois: list of NumPy arrays of the regions cropped from the frames
+        """
+        if self.cache is None:
+            return self.predict_rois(rois)
+
+        return self.cache.lookup_or_compute(self.roi_cache_namespace,
+                                            rois,
+                                            self.predict_rois,
+                                            self.cache.encode_detections,
+                                            self.cache.decode_detections)
+
+    @profiled("BallTracker.predict_rois", frames=1)
+    def predict_rois(self, rois):
+        """
+        Runs the model on cropped regions scaled to roi_imgsz.
+        """
+        results = self.model.predict(rois, conf=self.conf, imgsz=self.roi_imgsz)
+
+        return [{i: box.xyxy.tolist()[0] for i, box in enumerate(result.boxes)} for result in results]
+
+    def get_closest_ball_dict(self, roi_dict, roi, position):
+        """
+        Returns the ball dictionary of the detection in a region closest to the
+        predicted position, in frame coordinates. Empty if there is no detection.
+        """
+        x_offset, y_offset = roi[:2]
+        bounding_boxes = [[x1 + x_offset, y1 + y_offset, x2 + x_offset, y2 + y_offset]
+                          for x1, y1, x2, y2 in roi_dict.values()]
+
+        if not bounding_boxes:
+            return {}
+
+        distances = [np.hypot((x1 + x2) / 2 - position[0], (y1 + y2) / 2 - position[1])
+                     for x1, y1, x2, y2 in bounding_boxes]
+
+        return {1: bounding_boxes[int(np.argmin(distances))]}
+
+    def get_ball_dict(self, results):
+        """
+        Returns a dictionary of the ball's ID to bounding box coordinates from the
+        Result object of a single frame.
+
+        :param results: ultralytics Result object for a single video frame
+        """
         ball_dict = {}
 
         for box in results.boxes:
@@ -113,6 +387,7 @@ class BallTracker:
 
         return ball_dict
     
+    @profiled("BallTracker.draw_bounding_boxes", frames=1)
     def draw_bounding_boxes(self, video_frames, ball_detections):
         """
         Draws red bounding boxes around the tennis ball and annotates them
@@ -125,12 +400,21 @@ class BallTracker:
         output_video_frames = []
 
         for frame, ball_dict in zip(video_frames, ball_detections):
-            for id, bounding_box in ball_dict.items():
-                # Coordinates represent x min, y min, x max, y max
-                x1, y1, x2, y2 = bounding_box
-                cv2.putText(frame, f"Ball ID: {id}", (int(x1), int(y1) - 10), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-                cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 0, 255), 2)
-            
-            output_video_frames.append(frame)
+            output_video_frames.append(self.draw_bounding_boxes_on_frame(frame, ball_dict))
         
-        return output_video_frames
\ No newline at end of file
+        return output_video_frames
+
+    def draw_bounding_boxes_on_frame(self, frame, ball_dict):
+        """
+        Draws the ball's box of a single frame in place and returns it, see draw_bounding_boxes.
+
+        :param frame: NumPy array representing a video frame
+        :param ball_dict: dictionary mapping the ball ID to bounding box coordinates
+        """
+        for id, bounding_box in ball_dict.items():
+            # Coordinates represent x min, y min, x max, y max
+            x1, y1, x2, y2 = bounding_box
+            cv2.putText(frame, f"Ball ID: {id}", (int(x1), int(y1) - 10), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+            cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 0, 255), 2)
+
+        return frame
\ No newline at end of file
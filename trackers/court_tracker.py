@@ -0,0 +1,152 @@
+import cv2
+import numpy as np
+from utils import CourtKeypoints
+from instrumentation import profiled
+
+class CourtTracker:
+    """
+    Follows the court keypoints through changes of the camera view (cuts to
+    another camera, replays, zooms). Every frame is shrunk to a small thumbnail
+    and compared with the thumbnail of the first frame of
+    the current camera segment. Only when they differ does a new segment start,
+    and the keypoint CNN only runs if the new view wasn't seen before, so a
+    broadcast cutting back and forth between a few cameras needs a handful of
+    predictions instead of one per frame.
+
+    Thumbnails hold the edges of a downscaled grayscale frame, so they follow the
+    court lines rather than colors. Changes in brightness or exposure don't count
+    as a new view, while the lines moving (other camera, zoom) does.
+
+    While the view keeps changing (a pan, a handheld shot of the crowd) new views
+    are predicted at most every min_prediction_interval frames, the frames in
+    between keep the keypoints of the last prediction.
+    """
+    def __init__(self, court_line_detector, change_threshold=0.4, thumbnail_size=(128, 72), max_views=16,
+                 min_prediction_interval=6, frame_scaler=None):
+        """
+        :param court_line_detector: CourtLineDetector object
+        :param change_threshold: difference between two thumbnails (0 for the same edges,
+                                 1 for unrelated ones) above which the view is considered changed
+        :param thumbnail_size: (width, height) of the thumbnails the frames are compared on
+        :param max_views: number of previously seen views whose keypoints are kept for reuse
+        :param min_prediction_interval: minimum number of frames between two keypoint predictions
+        :param frame_scaler: FrameScaler the frames were downscaled with, keypoints are
+                             mapped back to the source frames
+        """
+        self.court_line_detector = court_line_detector
+        self.change_threshold = change_threshold
+        self.thumbnail_size = thumbnail_size
+        self.max_views = max_views
+        self.min_prediction_interval = min_prediction_interval
+        self.frame_scaler = frame_scaler
+
+        # Keypoints of every camera segment found so far
+        self.court_keypoints = CourtKeypoints()
+
+        # Thumbnail the frames of the current segment are compared with
+        self.reference_thumbnail = None
+
+        # (thumbnail, keypoints) of previously seen views, most recently used last
+        self.views = []
+        self.num_predictions = 0
+        self.last_prediction_frame = None
+
+    def get_thumbnail(self, frame):
+        """
+        Returns the thumbnail frames are compared on: the blurred gradient magnitude
+        of the downscaled grayscale frame, shifted to zero mean and scaled to unit
+        length. Area averaging and the blur keep noise and small moving things like
+        the ball from counting as a view change.
+        """
+        gray = cv2.cvtColor(cv2.resize(frame, self.thumbnail_size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        gray = gray.astype(np.float32)
+
+        edges = np.abs(cv2.Sobel(gray, cv2.CV_32F, 1, 0)) + np.abs(cv2.Sobel(gray, cv2.CV_32F, 0, 1))
+        edges = cv2.GaussianBlur(edges, (5, 5), 0).ravel()
+        edges -= edges.mean()
+
+        # A frame without edges (e.g. a fade to black) stays all zeros
+        norm = np.linalg.norm(edges)
+
+        return edges / norm if norm > 1e-6 else np.zeros_like(edges)
+
+    def get_difference(self, thumbnail_1, thumbnail_2):
+        """
+        Returns one minus the correlation of two thumbnails, 0 when their edges
+        are the same and around 1 when they are unrelated. Two frames without
+        edges count as the same view.
+        """
+        if not thumbnail_1.any() and not thumbnail_2.any():
+            return 0.0
+
+        return 1.0 - float(np.dot(thumbnail_1, thumbnail_2))
+
+    def find_view(self, thumbnail):
+        """
+        Returns the (thumbnail, keypoints) of the previously seen view closest to
+        thumbnail, or None if none of them is within the change threshold.
+        """
+        differences = [self.get_difference(thumbnail, view_thumbnail) for view_thumbnail, _ in self.views]
+
+        if not differences or min(differences) > self.change_threshold:
+            return None
+
+        # Moves the view to the end so the least recently used views are dropped first
+        view = self.views.pop(int(np.argmin(differences)))
+        self.views.append(view)
+
+        return view
+
+    @profiled("CourtTracker.update")
+    def update(self, frame_num, frame):
+        """
+        Tracks the court in the next frame and returns its flat keypoints.
+
+        :param frame_num: frame number, increasing with every call
+        :param frame: NumPy array representing the video frame
+        """
+        thumbnail = self.get_thumbnail(frame)
+
+        if (self.reference_thumbnail is not None
+                and self.get_difference(thumbnail, self.reference_thumbnail) <= self.change_threshold):
+            return self.court_keypoints.keypoints[-1]
+
+        # The view changed, reuse the keypoints of a matching earlier view or predict new ones
+        view = self.find_view(thumbnail)
+
+        if view is None:
+            # The view hasn't settled since the last prediction
+            if (self.last_prediction_frame is not None
+                    and frame_num - self.last_prediction_frame < self.min_prediction_interval):
+                return self.court_keypoints.keypoints[-1]
+
+            keypoints = self.court_line_detector.predict(frame)
+
+            if self.frame_scaler is not None:
+                keypoints = self.frame_scaler.remap_keypoints(keypoints)
+
+            view = (thumbnail, keypoints)
+            self.num_predictions += 1
+            self.last_prediction_frame = frame_num
+            self.views.append(view)
+
+            if len(self.views) > self.max_views:
+                self.views.pop(0)
+
+        self.reference_thumbnail, keypoints = view
+        self.court_keypoints.add_segment(frame_num, keypoints)
+
+        return keypoints
+
+    def track(self, frames, start_frame=0):
+        """
+        Tracks the court through frames and returns the CourtKeypoints of all
+        frames tracked so far.
+
+        :param frames: iterable of NumPy arrays representing consecutive video frames
+        :param start_frame: frame number of the first frame in frames
+        """
+        for frame_num, frame in enumerate(frames, start=start_frame):
+            self.update(frame_num, frame)
+
+        return self.court_keypoints
@@ -0,0 +1,221 @@
+from collections import deque
+import math
+import numpy as np
+
+class RollingMean:
+    """
+    Rolling mean over the last window values, updated one value at a time.
+    Follows pandas' rolling(window, min_periods=1).mean() step by step (running
+    sums with Kahan compensation), so it gives the exact same floats as the
+    offline BallTracker.get_ball_hit_frames. NaN values are skipped.
+    """
+    def __init__(self, window):
+        self.window = window
+        self.values = deque()
+
+        self.num_values = 0
+        self.num_negative = 0
+        self.sum = 0.0
+        self.add_compensation = 0.0
+        self.remove_compensation = 0.0
+
+        # Mean of identical values is the value itself, not a rounded sum
+        self.num_consecutive_same_value = 0
+        self.previous_value = None
+
+    def add(self, value):
+        """
+        Adds the next value and returns the mean of the last window values.
+        """
+        if self.previous_value is None:
+            self.previous_value = value
+
+        self.values.append(value)
+
+        if not math.isnan(value):
+            self.num_values += 1
+            y = value - self.add_compensation
+            t = self.sum + y
+            self.add_compensation = t - self.sum - y
+            self.sum = t
+
+            if math.copysign(1.0, value) < 0:
+                self.num_negative += 1
+
+            if value == self.previous_value:
+                self.num_consecutive_same_value += 1
+            else:
+                self.num_consecutive_same_value = 1
+
+            self.previous_value = value
+
+        # The value leaving the window is removed from the sum
+        if len(self.values) > self.window:
+            removed_value = self.values.popleft()
+
+            if not math.isnan(removed_value):
+                self.num_values -= 1
+                y = -removed_value - self.remove_compensation
+                t = self.sum + y
+                self.remove_compensation = t - self.sum - y
+                self.sum = t
+
+                if math.copysign(1.0, removed_value) < 0:
+                    self.num_negative -= 1
+
+        if self.num_values == 0:
+            return math.nan
+
+        mean = self.sum / self.num_values
+
+        if self.num_consecutive_same_value >= self.num_values:
+            mean = self.previous_value
+        elif self.num_negative == 0 and mean < 0:
+            mean = 0.0
+        elif self.num_negative == self.num_values and mean > 0:
+            mean = 0.0
+
+        return mean
+
+class OnlineBallInterpolator:
+    """
+    Online counterpart of BallTracker.interpolate_ball_positions. Frames without
+    a ball are held back until the next detection arrives and then filled in by
+    linear interpolation, so frames come out at most max_gap frames late.
+
+    Gaps longer than max_gap can't wait for the next detection, so their frames
+    keep the last known position, like the offline version does at the end of a
+    video. Frames before the first detection get the first detection, like the
+    offline backfill.
+    """
+    def __init__(self, max_gap=12):
+        """
+        :param max_gap: maximum number of consecutive frames held back
+        """
+        self.max_gap = max_gap
+
+        # Frame numbers waiting for the next detection
+        self.missing_frames = []
+
+        # Last detected (frame number, bounding box)
+        self.last_detection = None
+
+    def add(self, frame_num, ball_dict):
+        """
+        Adds the ball detection of the next frame and returns the list of
+        (frame number, ball dictionary) of the frames that are now complete,
+        in order.
+
+        :param frame_num: frame number, increasing with every call
+        :param ball_dict: dictionary of the ball's ID to bounding box coordinates
+        """
+        if 1 not in ball_dict:
+            self.missing_frames.append(frame_num)
+
+            if len(self.missing_frames) <= self.max_gap:
+                return []
+
+            # The gap is too long to wait for, give up on interpolating it
+            return self.flush()
+
+        bounding_box = ball_dict[1]
+        ready_frames = []
+
+        if self.missing_frames:
+            missing_frames = np.array(self.missing_frames, dtype=np.float64)
+
+            if self.last_detection is None:
+                # Nothing to interpolate from yet, use the first detection
+                boxes = np.tile(bounding_box, (len(missing_frames), 1))
+            else:
+                last_frame_num, last_bounding_box = self.last_detection
+                boxes = np.stack([np.interp(missing_frames, [last_frame_num, frame_num], [start, end])
+                                  for start, end in zip(last_bounding_box, bounding_box)], axis=1)
+
+            ready_frames = [(missing_frame, {1: box}) for missing_frame, box in zip(self.missing_frames, boxes.tolist())]
+            self.missing_frames = []
+
+        self.last_detection = (frame_num, bounding_box)
+        ready_frames.append((frame_num, {1: bounding_box}))
+
+        return ready_frames
+
+    def flush(self):
+        """
+        Returns the frames still held back, with the last known position (or no
+        ball if there never was one). Called at the end of a stream.
+        """
+        if self.last_detection is None:
+            ready_frames = [(missing_frame, {}) for missing_frame in self.missing_frames]
+        else:
+            ready_frames = [(missing_frame, {1: list(self.last_detection[1])}) for missing_frame in self.missing_frames]
+
+        self.missing_frames = []
+
+        return ready_frames
+
+class OnlineBallHitDetector:
+    """
+    Online counterpart of BallTracker.get_ball_hit_frames. A direction change
+    at a frame is confirmed once hit_window more frames have arrived, so hits
+    are reported hit_window frames late. For the same positions it finds the
+    same hits as the offline version.
+    """
+    def __init__(self, rolling_window=5, minimum_frames_for_hit=25, hit_window=None):
+        """
+        :param rolling_window: number of frames the ball's vertical position is smoothed over
+        :param minimum_frames_for_hit: number of frames that need to confirm a direction change
+        :param hit_window: number of frames after a direction change that are checked,
+                           defaults to 1.2 * minimum_frames_for_hit
+        """
+        if hit_window is None:
+            hit_window = int(1.2 * minimum_frames_for_hit)
+
+        self.minimum_frames_for_hit = minimum_frames_for_hit
+        self.hit_window = hit_window
+        self.rolling_mean = RollingMean(rolling_window)
+        self.previous_mean = math.nan
+        self.num_frames = 0
+
+        # (frame number, moving up, moving down) of the last hit_window + 1 frames
+        self.recent_frames = deque(maxlen=hit_window + 1)
+
+    def add(self, frame_num, ball_dict):
+        """
+        Adds the ball position of the next frame and returns the frame number of
+        the hit confirmed by it, or None.
+
+        :param frame_num: frame number, increasing with every call
+        :param ball_dict: dictionary of the ball's ID to bounding box coordinates
+        """
+        if 1 in ball_dict:
+            mid_y = (ball_dict[1][1] + ball_dict[1][3]) / 2
+        else:
+            mid_y = math.nan
+
+        mean = self.rolling_mean.add(mid_y)
+        delta_y = mean - self.previous_mean
+        self.previous_mean = mean
+
+        # Comparisons with NaN are False, so frames without a position never count
+        self.recent_frames.append((frame_num, delta_y < 0, delta_y > 0))
+        self.num_frames += 1
+
+        # The frame hit_window frames back can now be checked, frame 0 never is a hit
+        if self.num_frames <= self.hit_window + 1:
+            return None
+
+        candidate_frame_num, moving_up, moving_down = self.recent_frames[0]
+        _, next_moving_up, next_moving_down = self.recent_frames[1]
+
+        negative_pos_change = moving_down and next_moving_up
+        positive_pos_change = moving_up and next_moving_down
+
+        frames_moving_up = sum(frame[1] for frame in list(self.recent_frames)[1:])
+        frames_moving_down = sum(frame[2] for frame in list(self.recent_frames)[1:])
+
+        if (negative_pos_change and frames_moving_up >= self.minimum_frames_for_hit or
+                positive_pos_change and frames_moving_down >= self.minimum_frames_for_hit):
+            return candidate_frame_num
+
+        return None
@@ -0,0 +1,289 @@
+from bisect import bisect_right
+import numpy as np
+from utils import (get_centers_of_boxes,
+                   distances_between_points,
+                   get_bounding_box_heights,
+                   Detections,
+                   as_detections,
+                   as_court_keypoints)
+
+class PlayerTrackFilter:
+    """
+    Picks the two actual players out of all person tracks of a video and gives
+    them the track IDs 1 and 2, the IDs MiniCourt and PlayerStats expect.
+
+    The tracker loses a player now and then (occlusion, leaving the frame, a
+    camera cut) and carries on with a new track ID, so a player is usually made
+    of several tracks. Filtering happens in three steps:
+
+    1. Every track is scored with a court-proximity histogram: the distance from
+       each of its boxes to the closest court keypoint of that frame, in heights
+       of the box so the far side of the court counts as much as the near one,
+       is binned, and bins closer to the court weigh more. Players spend the
+       video on the court, umpire, line judges, ball children and the crowd
+       don't.
+    2. Fragments are linked into chains: a track starting shortly after another
+       one ended, close to where that one was last seen, continues it.
+    3. Chains are taken in order of their score. The first one is a player, a
+       chain overlapping every player so far in time is a new player (until
+       there are two), any other chain is merged into the player it doesn't
+       overlap with that was last seen closest to it. A player can only take
+       a chain it could have walked to in the frames between them, the same
+       limit as in step 2, so a ball kid tracked while a player was lost
+       doesn't become that player.
+
+    Everything but the linking in step 2 works on the columnar arrays of all
+    detections at once, and the linking walks the tracks once, so the cost
+    grows linearly with the length of the match.
+    """
+    def __init__(self, num_bins=10, max_distance=6.0, min_proximity=0.25, max_gap=48, max_overlap=2,
+                 max_motion=0.15, link_radius=1.0):
+        """
+        :param num_bins: number of court-proximity bins between the court and max_distance
+        :param max_distance: distance from the closest court keypoint, in bounding box
+                             heights, from which on a box adds nothing to its track's score
+        :param min_proximity: smallest mean proximity weight (1 on a keypoint, 0 at
+                              max_distance) of a chain that can be a player
+        :param max_gap: largest number of frames between the end of a track and the
+                        start of the one continuing it
+        :param max_overlap: number of frames two linked tracks may overlap, trackers
+                            sometimes report the old and new ID of a player together
+        :param max_motion: how far a player may move per frame of the gap, as a
+                           fraction of its bounding box height
+        :param link_radius: how far a player may be from where the previous track
+                            ended on top of max_motion, in bounding box heights
+        """
+        self.num_bins = num_bins
+        self.max_distance = max_distance
+        self.min_proximity = min_proximity
+        self.max_gap = max_gap
+        self.max_overlap = max_overlap
+        self.max_motion = max_motion
+        self.link_radius = link_radius
+
+        # Weight of each bin, the last bin holds everything past max_distance
+        self.bin_weights = np.linspace(1.0, 0.0, num_bins + 1)
+
+    def filter(self, court_keypoints, player_detections):
+        """
+        Returns the detections of the two players, with track IDs 1 and 2.
+
+        :param court_keypoints: list of court keypoint coordinates, or CourtKeypoints
+                                when the camera view changes during the video
+        :param player_detections: Detections (or list of dictionaries) of person IDs to
+                                  bounding box coordinates (x min, y min) -> (x max, y max)
+        """
+        player_detections = as_detections(player_detections)
+        frame_indices = player_detections.frame_indices
+
+        if len(player_detections.track_ids) == 0:
+            return player_detections
+
+        # Index of each row's track among the unique track IDs, the rows are in
+        # frame order so the first row of a track is its first detection
+        track_ids, first_rows, track_indices = np.unique(player_detections.track_ids, return_index=True,
+                                                         return_inverse=True)
+        num_tracks = len(track_ids)
+
+        centers = get_centers_of_boxes(player_detections.coords)
+        heights = get_bounding_box_heights(player_detections.coords)
+
+        scores, counts = self.get_proximity_scores(court_keypoints, frame_indices, centers, heights, track_indices,
+                                                   num_tracks)
+
+        # Last row of every track, the first one of the reversed rows
+        _, reversed_first_rows = np.unique(player_detections.track_ids[::-1], return_index=True)
+        last_rows = len(track_indices) - 1 - reversed_first_rows
+
+        tracks = {
+            "first_frame": frame_indices[first_rows],
+            "last_frame": frame_indices[last_rows],
+            "first_center": centers[first_rows],
+            "last_center": centers[last_rows],
+            "first_height": heights[first_rows],
+            "last_height": heights[last_rows]
+        }
+
+        chains = self.link_tracks(tracks)
+        player_of_track = self.pick_players(chains, tracks, scores, counts, track_ids, num_tracks)
+
+        # Keeps the rows of the players with their new IDs. Where linked tracks
+        # overlap, a player has two rows in a frame and the first one stays
+        new_ids = player_of_track[track_indices]
+        keep = new_ids > 0
+        keys = frame_indices * 3 + new_ids
+        _, first_of_key = np.unique(keys, return_index=True)
+        first_row = np.zeros(len(keys), dtype=bool)
+        first_row[first_of_key] = True
+        keep &= first_row
+
+        return Detections.from_arrays(frame_indices[keep],
+                                      new_ids[keep],
+                                      player_detections.coords[keep],
+                                      player_detections.num_frames)
+
+    def get_proximity_scores(self, court_keypoints, frame_indices, centers, heights, track_indices, num_tracks):
+        """
+        Returns (score, number of detections) of every track. A track's score is its
+        court-proximity histogram weighed by the bin weights, so a track scores
+        one per detection on the court and less the farther away it is.
+        """
+        court_keypoints = as_court_keypoints(court_keypoints)
+
+        # (segments, 14, 2) keypoints and the segment of every detection, so the
+        # keypoints aren't copied once per detection
+        segment_keypoints = np.stack(court_keypoints.keypoints).astype(np.float64).reshape(len(court_keypoints.keypoints), -1, 2)
+        segment_indices = court_keypoints.get_segment_indices(frame_indices)
+
+        # Closest keypoint, one keypoint at a time so memory stays at one value per detection
+        min_distances = np.full(len(frame_indices), np.inf)
+
+        for keypoint_index in range(segment_keypoints.shape[1]):
+            distances = distances_between_points(segment_keypoints[segment_indices, keypoint_index], centers)
+            np.minimum(min_distances, distances, out=min_distances)
+
+        min_distances /= np.maximum(heights, 1.0)
+
+        bins = np.minimum((min_distances / self.max_distance * self.num_bins).astype(np.int64), self.num_bins)
+        histograms = np.bincount(track_indices * (self.num_bins + 1) + bins,
+                                 minlength=num_tracks * (self.num_bins + 1)).reshape(num_tracks, self.num_bins + 1)
+
+        return histograms @ self.bin_weights, histograms.sum(axis=1)
+
+    def link_tracks(self, tracks):
+        """
+        Returns a list of chains, each a list of track indices of the same person
+        in time order. Tracks are walked in order of their first frame, and a track
+        continues the open chain whose end is closest to its start, if close enough.
+        """
+        chains = []
+        open_chains = []
+
+        for track in np.argsort(tracks["first_frame"], kind="stable"):
+            start_frame = tracks["first_frame"][track]
+
+            # Chains that ended too long ago can't be continued anymore
+            open_chains = [chain for chain in open_chains
+                           if start_frame - tracks["last_frame"][chain[-1]] <= self.max_gap]
+
+            best_chain = None
+            best_distance = np.inf
+
+            for chain in open_chains:
+                previous = chain[-1]
+                gap = start_frame - tracks["last_frame"][previous]
+
+                if gap < -self.max_overlap or tracks["last_frame"][track] <= tracks["last_frame"][previous]:
+                    continue
+
+                # Distance in bounding box heights from where the previous track ended
+                height = max(tracks["last_height"][previous], tracks["first_height"][track], 1.0)
+                distance = distances_between_points(tracks["last_center"][previous], tracks["first_center"][track]) / height
+
+                if distance <= self.max_motion * max(gap, 1) + self.link_radius and distance < best_distance:
+                    best_chain = chain
+                    best_distance = distance
+
+            if best_chain is not None:
+                best_chain.append(track)
+            else:
+                chain = [track]
+                chains.append(chain)
+                open_chains.append(chain)
+
+        return chains
+
+    def get_boundary_distance(self, tracks, chain, player, position):
+        """
+        Returns how far, in bounding box heights, the chain starts from where the
+        player was last seen before it, or ends from where the player is first seen
+        after it, whichever is closer. None when the player couldn't have moved
+        that far in the frames between the two on either side, see link_tracks.
+
+        :param position: index the chain would take in the player's list of chains
+        """
+        pairs = []
+
+        if position > 0:
+            pairs.append((player["chains"][position - 1][-1], chain[0]))
+
+        if position < len(player["chains"]):
+            pairs.append((chain[-1], player["chains"][position][0]))
+
+        distances = []
+
+        for before, after in pairs:
+            gap = tracks["first_frame"][after] - tracks["last_frame"][before]
+            height = max(tracks["last_height"][before], tracks["first_height"][after], 1.0)
+            distance = distances_between_points(tracks["last_center"][before], tracks["first_center"][after]) / height
+
+            if distance > self.max_motion * max(gap, 1) + self.link_radius:
+                return None
+
+            distances.append(distance)
+
+        return min(distances)
+
+    def pick_players(self, chains, tracks, scores, counts, track_ids, num_tracks):
+        """
+        Returns the player ID (1 or 2, 0 for not a player) of every track. The player
+        holding the smaller original track ID becomes player 1, so videos whose two
+        players kept the IDs 1 and 2 come out unchanged.
+        """
+        chain_scores = np.array([scores[chain].sum() for chain in chains])
+        chain_counts = np.array([counts[chain].sum() for chain in chains])
+
+        # Each player is a list of chains sorted by first frame, which never overlap
+        # each other, so their first and last frames are both sorted
+        players = []
+
+        for chain_index in np.argsort(-chain_scores, kind="stable"):
+            if chain_scores[chain_index] < self.min_proximity * chain_counts[chain_index]:
+                continue
+
+            chain = chains[chain_index]
+            start_frame = tracks["first_frame"][chain[0]]
+            end_frame = tracks["last_frame"][chain[-1]]
+
+            # Players that aren't seen at the same time as this chain, with the
+            # position the chain would take in their list of chains
+            free_players = []
+
+            for player in players:
+                position = bisect_right(player["starts"], end_frame)
+
+                if position == 0 or player["ends"][position - 1] < start_frame:
+                    free_players.append((player, position))
+
+            # Free players that could have got to where the chain is, with their distance
+            reachable_players = []
+
+            for player, position in free_players:
+                distance = self.get_boundary_distance(tracks, chain, player, position)
+
+                if distance is not None:
+                    reachable_players.append((distance, player, position))
+
+            # A chain no player can take is a new player until there are two, anyone
+            # else after that
+            if not reachable_players:
+                if len(players) < 2:
+                    players.append({"chains": [chain], "starts": [start_frame], "ends": [end_frame]})
+
+                continue
+
+            _, player, position = min(reachable_players, key=lambda reachable_player: reachable_player[0])
+            player["chains"].insert(position, chain)
+            player["starts"].insert(position, start_frame)
+            player["ends"].insert(position, end_frame)
+
+        # Player IDs in order of the smallest original track ID of each player
+        player_tracks = [[track for chain in player["chains"] for track in chain] for player in players]
+        player_tracks.sort(key=lambda player_track_indices: track_ids[player_track_indices].min())
+
+        player_of_track = np.zeros(num_tracks, dtype=np.int64)
+
+        for player_id, player_track_indices in enumerate(player_tracks, start=1):
+            player_of_track[player_track_indices] = player_id
+
+        return player_of_track
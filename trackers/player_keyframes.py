@@ -0,0 +1,243 @@
+import cv2
+import numpy as np
+from utils import get_center_of_box, get_bounding_box_height
+
+# How the frames between two keyframes get their player boxes
+GAP_FILL_MODES = ["interpolate", "flow"]
+
+class PlayerKeyframeFiller:
+    """
+    Runs player detection on keyframes only and fills in the frames between them.
+    Players move little from one frame to the next at 24 fps, so most frames can
+    be skipped while they walk and only a few while they sprint. The gap to the
+    next keyframe adapts to how far the players moved between the last two
+    keyframes, measured in player heights so the far player counts as much as
+    the near one.
+
+    Gaps are filled in one of two ways:
+
+    interpolate: boxes move linearly from one keyframe to the next. The frames of
+                 a gap are only returned once the keyframe after it was detected.
+    flow: boxes are carried from frame to frame by the median optical flow of
+          corners inside them. Every frame is returned right away.
+
+    The detector's tracker only sees the keyframes, and since the players barely
+    move between two of them it keeps their track IDs.
+    """
+    def __init__(self, detect, max_interval=6, max_motion=0.15, gap_fill="interpolate"):
+        """
+        :param detect: function taking a list of frames and returning a player
+                       dictionary per frame, e.g. PlayerTracker.detect_batch
+        :param max_interval: largest number of frames from one keyframe to the next
+        :param max_motion: how far a player may move between two keyframes, as a
+                           fraction of its bounding box height
+        :param gap_fill: "interpolate" or "flow", see above
+        """
+        if gap_fill not in GAP_FILL_MODES:
+            raise ValueError(f"gap_fill must be one of {GAP_FILL_MODES}, got {gap_fill!r}")
+
+        self.detect = detect
+        self.max_interval = max_interval
+        self.max_motion = max_motion
+        self.gap_fill = gap_fill
+
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets all frames seen so far, the next frame is a keyframe.
+        """
+        self.frame_num = 0
+        self.num_keyframes = 0
+        self.interval = 1
+        self.keyframe_num = None
+        self.keyframe_dict = None
+
+        # Frames waiting for the next keyframe ("interpolate") and the last of them,
+        # which becomes a keyframe if the video ends before the next one
+        self.num_pending = 0
+        self.last_frame = None
+
+        # Boxes and grayscale of the previous frame ("flow")
+        self.previous_dict = None
+        self.previous_gray = None
+
+    def add(self, frames):
+        """
+        Feeds the next consecutive frames and returns the player dictionaries of
+        the frames that are done, in order. With "interpolate" these can be fewer
+        than the frames given (the rest come with a later call or flush()).
+
+        :param frames: list of NumPy arrays representing consecutive video frames
+        """
+        player_dicts = []
+
+        for frame in frames:
+            if self.keyframe_num is None or self.frame_num - self.keyframe_num >= self.interval:
+                player_dicts.extend(self.add_keyframe(frame))
+            elif self.gap_fill == "interpolate":
+                self.num_pending += 1
+                self.last_frame = frame
+            else:
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                self.previous_dict = propagate_player_dict(self.previous_gray, gray, self.previous_dict)
+                self.previous_gray = gray
+                player_dicts.append(self.previous_dict)
+
+            self.frame_num += 1
+
+        return player_dicts
+
+    def flush(self):
+        """
+        Returns the player dictionaries of the frames still waiting for a keyframe,
+        detecting the last of them, e.g. at the end of the video.
+        """
+        if self.num_pending == 0:
+            return []
+
+        # The last frame becomes a keyframe, the ones before it are interpolated
+        self.frame_num -= 1
+        self.num_pending -= 1
+        player_dicts = self.add_keyframe(self.last_frame)
+        self.frame_num += 1
+
+        return player_dicts
+
+    def add_keyframe(self, frame):
+        """
+        Detects the players in a keyframe and returns the player dictionaries of
+        the gap before it (when interpolating) and of the keyframe itself.
+        """
+        player_dict = self.detect([frame])[0]
+        self.num_keyframes += 1
+
+        player_dicts = []
+
+        if self.gap_fill == "interpolate" and self.num_pending > 0:
+            player_dicts.extend(interpolate_player_dicts(self.keyframe_dict, player_dict, self.num_pending))
+        elif self.gap_fill == "flow":
+            self.previous_dict = player_dict
+            self.previous_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+        if self.keyframe_dict is not None:
+            self.interval = self.get_interval(self.keyframe_dict, player_dict, self.frame_num - self.keyframe_num)
+
+        self.keyframe_num = self.frame_num
+        self.keyframe_dict = player_dict
+        self.num_pending = 0
+        self.last_frame = None
+
+        player_dicts.append(player_dict)
+
+        return player_dicts
+
+    def get_interval(self, previous_dict, player_dict, num_frames):
+        """
+        Returns the number of frames until the next keyframe, so that at the speed
+        the players moved over the last num_frames frames they move at most
+        max_motion of their height.
+        """
+        common_ids = previous_dict.keys() & player_dict.keys()
+
+        # Tracks that just appeared (or an empty court) are looked at again right away
+        if not common_ids:
+            return 1 if player_dict else self.max_interval
+
+        # Fastest player, in heights per frame
+        motion = max(distance_of_centers(previous_dict[track_id], player_dict[track_id])
+                     / max(get_bounding_box_height(player_dict[track_id]), 1.0)
+                     for track_id in common_ids) / num_frames
+
+        if motion <= 0:
+            return self.max_interval
+
+        return int(np.clip(self.max_motion / motion, 1, self.max_interval))
+
+def distance_of_centers(bounding_box_1, bounding_box_2):
+    (x1, y1), (x2, y2) = get_center_of_box(bounding_box_1), get_center_of_box(bounding_box_2)
+
+    return float(np.hypot(x2 - x1, y2 - y1))
+
+def interpolate_player_dicts(start_dict, end_dict, num_frames):
+    """
+    Returns num_frames player dictionaries moving linearly from start_dict to
+    end_dict, not including either. A player in only one of them is kept still
+    for the half of the gap closer to it.
+
+    :param start_dict: dictionary of player IDs to bounding boxes of the keyframe before the gap
+    :param end_dict: dictionary of player IDs to bounding boxes of the keyframe after the gap
+    :param num_frames: number of frames in the gap
+    """
+    player_dicts = []
+
+    for i in range(1, num_frames + 1):
+        t = i / (num_frames + 1)
+        player_dict = {}
+
+        for track_id, start_box in start_dict.items():
+            if track_id in end_dict:
+                end_box = end_dict[track_id]
+                player_dict[track_id] = [s + t * (e - s) for s, e in zip(start_box, end_box)]
+            elif t < 0.5:
+                player_dict[track_id] = list(start_box)
+
+        for track_id, end_box in end_dict.items():
+            if track_id not in start_dict and t >= 0.5:
+                player_dict[track_id] = list(end_box)
+
+        player_dicts.append(player_dict)
+
+    return player_dicts
+
+def propagate_player_dict(previous_gray, gray, player_dict, max_corners=20):
+    """
+    Returns player_dict with every box moved by the median optical flow of the
+    corners found inside it between two grayscale frames. Boxes without any
+    corner that could be followed stay where they are.
+
+    :param previous_gray: grayscale frame the boxes belong to
+    :param gray: grayscale frame the boxes are moved to
+    :param player_dict: dictionary of player IDs to bounding boxes in previous_gray
+    :param max_corners: number of corners followed per box
+    """
+    frame_height, frame_width = gray.shape[:2]
+    points = []
+    point_owners = []
+
+    for track_id, (x1, y1, x2, y2) in player_dict.items():
+        x1, y1 = max(int(x1), 0), max(int(y1), 0)
+        x2, y2 = min(int(x2), frame_width), min(int(y2), frame_height)
+
+        if x2 - x1 < 2 or y2 - y1 < 2:
+            continue
+
+        corners = cv2.goodFeaturesToTrack(previous_gray[y1:y2, x1:x2], max_corners, 0.01, 3)
+
+        if corners is not None:
+            points.append(corners.reshape(-1, 2) + (x1, y1))
+            point_owners.extend([track_id] * len(corners))
+
+    if not points:
+        return dict(player_dict)
+
+    # All boxes' corners are followed in a single call
+    points = np.concatenate(points).astype(np.float32)
+    new_points, status, _ = cv2.calcOpticalFlowPyrLK(previous_gray, gray, points, None,
+                                                     winSize=(15, 15), maxLevel=2)
+    shifts = (new_points - points)[status.ravel() == 1]
+    point_owners = np.array(point_owners)[status.ravel() == 1]
+
+    propagated_dict = {}
+
+    for track_id, (x1, y1, x2, y2) in player_dict.items():
+        box_shifts = shifts[point_owners == track_id]
+
+        if len(box_shifts) == 0:
+            propagated_dict[track_id] = [x1, y1, x2, y2]
+            continue
+
+        dx, dy = np.median(box_shifts, axis=0)
+        propagated_dict[track_id] = [x1 + float(dx), y1 + float(dy), x2 + float(dx), y2 + float(dy)]
+
+    return propagated_dict
@@ -1,97 +1,151 @@
-from ultralytics import YOLO
 import cv2
-import pickle
-from utils import get_center_of_box, distance_between_points
+import numpy as np
+from utils import (get_centers_of_boxes,
+                   distances_between_points,
+                   batch_frames,
+                   Detections)
+from .player_keyframes import PlayerKeyframeFiller
+from .player_filter import PlayerTrackFilter
+from .yolo_models import load_yolo_model, create_tracker, update_tracker
+from instrumentation import profiled
 
 class PlayerTracker:
-    def __init__(self, model_path):
-        self.model = YOLO(model_path)
+    def __init__(self, model_path, cache=None, keyframe_interval=1, keyframe_motion=0.15,
+                 gap_fill="interpolate", model_format="pytorch"):
+        """
+        :param model_path: path to the player detection YOLO weights
+        :param cache: optional DetectionCache
+        :param keyframe_interval: largest number of frames between two frames the model
+                                  runs on, 1 detects every frame, see PlayerKeyframeFiller
+        :param keyframe_motion: how far a player may move between two keyframes, as a
+                                fraction of its height
+        :param gap_fill: how frames between keyframes are filled, "interpolate" or "flow"
+        :param model_format: how the weights are run, see load_yolo_model
+        """
+        self.model_format = model_format
+        self.model = self.load_model(model_path)
+
+        # Only frames picked as keyframes go through the model, the rest are filled in
+        self.keyframe_filler = None
+
+        if keyframe_interval > 1:
+            self.keyframe_filler = PlayerKeyframeFiller(self.detect_batch_uncached_or_cached,
+                                                        max_interval=keyframe_interval,
+                                                        max_motion=keyframe_motion,
+                                                        gap_fill=gap_fill)
+
+        # Minimum confidence of a box, the default of model.track
+        self.conf = 0.1
+
+        # Optional DetectionCache, results are keyed on the model weights and
+        # conf so changing either never reuses stale detections. Exported and
+        # quantized models give slightly different boxes than the weights.
+        # The cache holds the model's boxes before tracking, see detect_batch_cached
+        self.cache = cache
+
+        if cache is not None:
+            parameters = {"conf": self.conf}
+
+            if model_format != "pytorch":
+                parameters.update(model_format=model_format)
+
+            self.cache_namespace = cache.get_namespace("player_boxes", model_path, parameters)
 
+        # Tracker the cached boxes go through, made on first use, see detect_batch_cached
+        self.tracker = None
+
+        # Picks the two players out of all person tracks, see filter_players
+        self.track_filter = PlayerTrackFilter()
+
+    def load_model(self, model_path):
+        """
+        Returns the YOLO model detect_batch runs, benchmarks override this with a stub.
+        """
+        return load_yolo_model(model_path, self.model_format)
+
+    @profiled("PlayerTracker.filter_players")
     def filter_players(self, court_keypoints, player_detections):
         """
-        Returns a list of dictionaries of player IDs to bounding box coordinates
-        of the two actual players. Umpire, line judges, and ball children were
-        incorrectly identified as players, making this filtering necessary.
+        Returns the detections of the two actual players, with track IDs 1 and 2.
+        Umpire, line judges, and ball children were incorrectly identified as
+        players, making this filtering necessary. The players are picked from
+        their tracks over the whole video, and tracks the tracker split a player
+        into get merged back, see PlayerTrackFilter.
         
-        :param court_keypoints: list of court keypoint coordinates
-        :param player_detections: list of dictionaries of player IDs to bounding
-                                  box coordinates (x min, y min) -> (x max, y max)
-        """
-        # Takes the first dictionary, equating to the detections from the first
-        # video frame and makes a call to the helper method
-        player_detections_first_frame = player_detections[0]
-        filtered_players = self.filter_players_helper(court_keypoints, player_detections_first_frame)
-        filtered_player_detections = []
-
-        # Uses list comprehension to filter for only the dictionaries of
-        # the actual players
-        for player_dict in player_detections:
-            filtered_player_dict = {id: bounding_box for id, bounding_box in player_dict.items() if id in filtered_players}
-            filtered_player_detections.append(filtered_player_dict)
-
-        return filtered_player_detections
+        :param court_keypoints: list of court keypoint coordinates, or CourtKeypoints
+                                when the camera view changes during the video
+        :param player_detections: Detections (or list of dictionaries) of player IDs to
+                                  bounding box coordinates (x min, y min) -> (x max, y max)
+        :return: Detections of the two players' IDs to bounding box coordinates
+        """
+        return self.track_filter.filter(court_keypoints, player_detections)
     
     def filter_players_helper(self, court_keypoints, player_detection):
         """
         Generates a list of player IDs to their closest distance to a court keypoint.
         Returns a list of IDs of the two closest players to the court, based on the
-        given keypoints.
+        given keypoints. Used where only one frame is known, e.g. by LiveAnalyzer.
         
         :param court_keypoints: list of court keypoint coordinates
         :param player_detection: dictionary of player IDs to bounding box coordinates
                                  (x min, y min) -> (x max, y max)
         """
-        distances = []
-
         # player_detection is a dictionary representing one video frame's worth of detections
         # Maps player IDs to their bounding box coordinates
-        for id, bounding_box in player_detection.items():
-            player_center = get_center_of_box(bounding_box)
+        ids = list(player_detection.keys())
+        player_centers = get_centers_of_boxes(np.array(list(player_detection.values()), dtype=np.float64).reshape(-1, 4))
 
-            min_distance = float("inf")
+        # (players, keypoints) distances between every player center and court keypoint,
+        # the smallest one is the player's closest distance to the court
+        court_keypoints = np.asarray(court_keypoints).reshape(-1, 2)
+        min_distances = distances_between_points(court_keypoints[None], player_centers[:, None]).min(axis=1)
 
-            for i in range(0, len(court_keypoints), 2):
-                court_keypoint = (court_keypoints[i], court_keypoints[i + 1])
-                distance = distance_between_points(court_keypoint, player_center)
-
-                # Determines the closest distance between the player and the court
-                if distance < min_distance:
-                    min_distance = distance
-            
-            # Appends the closest distance
-            distances.append((id, min_distance))
-
-        # Sorts the (ID, min_distance) tuples by ascending min_distance
+        # Sorts the players by ascending closest distance, players at the same distance keep their order
         # Filters the IDs of the two players with the closest distance to the court
-        distances.sort(key=lambda x: x[1])
-        filtered_players = [distances[0][0], distances[1][0]]
+        order = np.argsort(min_distances, kind="stable")
+        filtered_players = [ids[order[0]], ids[order[1]]]
         
         return filtered_players
 
-    def detect_frames(self, frames, read_from_stub=False, stub_path=None):
+    def detect_frames(self, frames, read_from_stub=False, stub_path=None, batch_size=1, frame_scaler=None,
+                      stub_key=None):
         """
         Detects players in a list of video frames.
         
-        :param frames: list of NumPy arrays representing video frames
-        :param read_from_stub: bool indicating whether to read detections from a stub file
-        :param stub_path: path to the stub file for reading/writing detections
-        :return: list of dictionaries mapping player IDs to bounding box coordinates
+        :param frames: iterable of NumPy arrays representing video frames, frames are
+                       consumed one at a time so a generator (e.g. read_video_frames)
+                       keeps memory usage independent of video length
+        :param read_from_stub: bool indicating whether to read detections from a stub file,
+                               when one was saved at stub_path with stub_key
+        :param stub_path: path to the stub directory for reading/writing detections
+                          (a .pkl path reads/writes the old pickle format)
+        :param batch_size: number of frames passed through the model at once, larger
+                           batches amortize the per-call overhead of the model
+                           (keyframes go through the model one at a time)
+        :param frame_scaler: FrameScaler the frames were downscaled with, the detections
+                             are mapped back to the source frames before being returned
+                             and saved
+        :param stub_key: key the stub is saved with and has to match to be read, e.g.
+                         from get_stub_key, None reads any stub at stub_path
+        :return: Detections of player IDs to bounding box coordinates
         """
+        if read_from_stub and stub_path is not None and Detections.is_saved(stub_path, stub_key):
+            return Detections.load(stub_path)
+
         player_detections = []
 
-        if read_from_stub and stub_path is not None:
-            with open(stub_path, "rb") as f:
-                player_detections = pickle.load(f)
-            
-            return player_detections
+        for batch in batch_frames(frames, batch_size):
+            player_detections.extend(self.detect_next_frames(batch))
+
+        player_detections.extend(self.flush_frames())
 
-        for frame in frames:
-            player_dict = self.detect_frame(frame)
-            player_detections.append(player_dict)
+        player_detections = Detections.from_dicts(player_detections)
+
+        if frame_scaler is not None:
+            player_detections = frame_scaler.remap_detections(player_detections)
 
         if stub_path is not None:
-            with open(stub_path, "wb") as f:
-                pickle.dump(player_detections, f)
+            player_detections.save(stub_path, key=stub_key)
 
         return player_detections
 
@@ -102,9 +156,119 @@ class PlayerTracker:
 
         :param frame: a NumPy array representing a single video frame
         """
-        # Need to index 0 because track() returns a list of Result objects, one per input image
-        results = self.model.track(frame, persist=True)[0]
+        return self.detect_batch([frame])[0]
+
+    @profiled("PlayerTracker.detect_batch", frames=1)
+    def detect_batch(self, frames):
+        """
+        Detects various players in a batch of consecutive video frames and
+        assigns them unique IDs. The tracker persists between calls and walks
+        through the frames of a batch in order, so track IDs stay the same
+        no matter how the video is split into batches.
+
+        :param frames: list of NumPy arrays representing consecutive video frames
+        :return: list of dictionaries mapping player IDs to bounding box coordinates,
+                 one per frame
+        """
+        # track() returns a list of Result objects, one per input image
+        results = self.model.track(frames, persist=True, conf=self.conf)
+
+        return [self.get_player_dict(result) for result in results]
+
+    def detect_next_frames(self, frames):
+        """
+        Detects players in the next consecutive frames of a video, for callers that
+        feed a video in parts. With keyframes, only the player dictionaries of the
+        frames that are done are returned, the rest come with a later call or
+        flush_frames().
+
+        :param frames: list of NumPy arrays representing consecutive video frames
+        :return: list of dictionaries mapping player IDs to bounding box coordinates
+        """
+        if self.keyframe_filler is not None:
+            return self.keyframe_filler.add(frames)
+
+        return self.detect_batch_uncached_or_cached(frames)
+
+    def flush_frames(self):
+        """
+        Returns the player dictionaries of the frames detect_next_frames still holds
+        back, at the end of the video or part of it.
+        """
+        if self.keyframe_filler is not None:
+            return self.keyframe_filler.flush()
+
+        return []
+
+    def detect_batch_uncached_or_cached(self, frames):
+        """
+        Calls detect_batch, or detect_batch_cached when there is a cache.
+        """
+        if self.cache is None:
+            return self.detect_batch(frames)
+
+        return self.detect_batch_cached(frames)
+
+    def detect_batch_cached(self, frames):
+        """
+        Same as detect_batch, but the model only runs on frames that aren't cached.
+
+        Track IDs depend on every frame the tracker saw before, so they can't be
+        cached per frame: a clip extended at the front, or fresh frames following
+        cached ones, would get other IDs than the cached ones. The cache holds the
+        model's boxes before tracking instead, and all boxes, cached or not, go
+        through the same kind of tracker model.track runs, which persists between
+        calls like the model's own.
+
+        :param frames: list of NumPy arrays representing consecutive video frames
+        """
+        def compute(missing_frames):
+            # predict() returns a list of Result objects, one per input image
+            results = self.model.predict(missing_frames, conf=self.conf)
+
+            # Rows of x min, y min, x max, y max, confidence and class of every box
+            return [result.boxes.data.cpu().numpy() for result in results]
+
+        boxes_of_frames = self.cache.lookup_or_compute(self.cache_namespace, frames, compute,
+                                                       self.cache.encode_rows,
+                                                       lambda value: self.cache.decode_rows(value, 6))
+
+        if self.tracker is None:
+            self.tracker = create_tracker()
+
+        player_dicts = []
+
+        for frame, boxes in zip(frames, boxes_of_frames):
+            tracks = update_tracker(self.tracker, boxes, frame)
+
+            # Rows of x min, y min, x max, y max, track ID, confidence and class
+            player_dicts.append({int(track[4]): track[:4].tolist() for track in tracks
+                                 if self.model.names[int(track[6])] == "person"})
+
+        return player_dicts
+
+    def reset_tracks(self):
+        """
+        Drops the tracker state kept between calls, so the next frame starts new
+        tracks with IDs counting from 1 again, e.g. at the start of a new video.
+        """
+        self.tracker = None
+
+        predictor = getattr(self.model, "predictor", None)
+
+        for tracker in getattr(predictor, "trackers", []):
+            tracker.reset()
+
+        if self.keyframe_filler is not None:
+            self.keyframe_filler.reset()
 
+    def get_player_dict(self, results):
+        """
+        Returns a dictionary of player IDs to bounding box coordinates from the
+        Result object of a single frame.
+
+        :param results: ultralytics Result object for a single video frame
+        """
         # Results.names is a dictionary mapping class IDs to class names
         id_name_dict = results.names
 
@@ -122,6 +286,7 @@ class PlayerTracker:
 
         return player_dict
     
+    @profiled("PlayerTracker.draw_bounding_boxes", frames=1)
     def draw_bounding_boxes(self, video_frames, player_detections):
         """
         Draws blue bounding boxes around players and annotates them
@@ -133,12 +298,21 @@ class PlayerTracker:
         output_video_frames = []
 
         for frame, player_dict in zip(video_frames, player_detections):
-            for id, bounding_box in player_dict.items():
-                # Coordinates represent x min, y min, x max, y max
-                x1, y1, x2, y2 = bounding_box
-                cv2.putText(frame, f"Player ID: {id}", (int(x1), int(y1) - 10), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-                cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (255, 0, 0), 2)
-            
-            output_video_frames.append(frame)
+            output_video_frames.append(self.draw_bounding_boxes_on_frame(frame, player_dict))
         
-        return output_video_frames
\ No newline at end of file
+        return output_video_frames
+
+    def draw_bounding_boxes_on_frame(self, frame, player_dict):
+        """
+        Draws the boxes of a single frame in place and returns it, see draw_bounding_boxes.
+
+        :param frame: NumPy array representing a video frame
+        :param player_dict: dictionary mapping player IDs to bounding box coordinates
+        """
+        for id, bounding_box in player_dict.items():
+            # Coordinates represent x min, y min, x max, y max
+            x1, y1, x2, y2 = bounding_box
+            cv2.putText(frame, f"Player ID: {id}", (int(x1), int(y1) - 10), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+            cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (255, 0, 0), 2)
+
+        return frame
\ No newline at end of file
@@ -0,0 +1,131 @@
+import os
+import shutil
+import tempfile
+from ultralytics import YOLO
+
+# Ways the YOLO detectors can be run, see load_yolo_model
+MODEL_FORMATS = ["pytorch", "onnx", "onnx_int8"]
+
+def load_yolo_model(model_path, model_format="pytorch"):
+    """
+    Returns a YOLO model of the given weights in one of MODEL_FORMATS. Smaller
+    variants (yolo11n/s/m.pt) are picked through model_path, model_format picks
+    how the weights are run:
+
+    pytorch: the weights as they are
+    onnx: an ONNX export run with ONNX Runtime, which has less overhead per call on the CPU
+    onnx_int8: the ONNX export with its weights dynamically quantized to 8 bit integers,
+               about four times smaller and faster on CPUs with integer dot products,
+               at the cost of slightly different boxes
+
+    Exports are written next to the weights and only made again when the weights
+    are newer, see export_yolo_model. They take batches and images of any size,
+    so batch_size and the ball's regions work the same as with the weights.
+
+    :param model_path: path to the YOLO weights (.pt)
+    :param model_format: one of MODEL_FORMATS
+    """
+    if model_format == "pytorch":
+        return YOLO(model_path)
+
+    # Exports don't know which task they were trained for
+    return YOLO(export_yolo_model(model_path, model_format), task="detect")
+
+def export_yolo_model(model_path, model_format="pytorch"):
+    """
+    Returns the path of the file load_yolo_model runs for the given format, exporting
+    it first if needed. Pools of worker processes call this before starting the
+    workers, so they all find the export instead of writing it at the same time.
+
+    :param model_path: path to the YOLO weights (.pt)
+    :param model_format: one of MODEL_FORMATS
+    """
+    if model_format not in MODEL_FORMATS:
+        raise ValueError(f"Unknown model format: {model_format}")
+
+    if model_format == "pytorch":
+        return model_path
+
+    onnx_path = get_onnx_export(model_path)
+
+    if model_format == "onnx_int8":
+        onnx_path = get_int8_export(onnx_path)
+
+    return onnx_path
+
+def is_outdated(export_path, source_path):
+    """
+    Returns whether export_path is missing or older than the file it was made from.
+    """
+    return not os.path.exists(export_path) or os.path.getmtime(export_path) < os.path.getmtime(source_path)
+
+def get_onnx_export(model_path):
+    """
+    Returns the path of the ONNX export of model_path, exporting it first if needed.
+    """
+    onnx_path = os.path.splitext(model_path)[0] + ".onnx"
+
+    if is_outdated(onnx_path, model_path):
+        # ultralytics writes the export next to the weights it was given, so a copy of
+        # them is exported in a temporary directory and the finished file is renamed,
+        # a process loading the export never sees a half written file
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(onnx_path))) as export_dir:
+            weights_copy_path = os.path.join(export_dir, os.path.basename(model_path))
+            shutil.copyfile(model_path, weights_copy_path)
+
+            exported_path = YOLO(weights_copy_path).export(format="onnx", dynamic=True, simplify=True)
+            os.replace(exported_path, onnx_path)
+
+    return onnx_path
+
+def get_int8_export(onnx_path):
+    """
+    Returns the path of the dynamically quantized copy of an ONNX export, quantizing
+    it first if needed. Dynamic quantization stores the weights as 8 bit integers
+    and quantizes the activations on the fly, so it needs no calibration images.
+    """
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    int8_path = os.path.splitext(onnx_path)[0] + "_int8.onnx"
+
+    if is_outdated(int8_path, onnx_path):
+        # Quantized into a temporary directory and renamed when done, see get_onnx_export
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(int8_path))) as export_dir:
+            quantized_path = os.path.join(export_dir, os.path.basename(int8_path))
+
+            # ONNX Runtime's CPU kernels for integer convolutions take unsigned weights
+            quantize_dynamic(onnx_path, quantized_path, weight_type=QuantType.QUInt8)
+            os.replace(quantized_path, int8_path)
+
+    return int8_path
+
+def create_tracker(tracker_config="botsort.yaml", frame_rate=30):
+    """
+    Returns a new tracker like the one model.track makes on its first call (BoT-SORT
+    with ultralytics' default settings, at the frame rate it assumes for images),
+    for tracking boxes that don't come straight out of the model, e.g. cached ones.
+
+    :param tracker_config: ultralytics tracker configuration
+    :param frame_rate: frame rate the tracker scales how long lost tracks are kept by
+    """
+    from ultralytics.trackers.track import TRACKER_MAP
+    from ultralytics.utils import IterableSimpleNamespace, YAML
+    from ultralytics.utils.checks import check_yaml
+
+    config = IterableSimpleNamespace(**YAML.load(check_yaml(tracker_config)))
+
+    return TRACKER_MAP[config.tracker_type](args=config, frame_rate=frame_rate)
+
+def update_tracker(tracker, boxes, frame):
+    """
+    Returns the (N, 8) tracks of the next frame (x min, y min, x max, y max, track ID,
+    confidence, class, index of the box) after feeding its boxes to a tracker made
+    by create_tracker, the same way model.track does.
+
+    :param tracker: tracker returned by create_tracker
+    :param boxes: (N, 6) array of x min, y min, x max, y max, confidence and class
+    :param frame: NumPy array of the frame, BoT-SORT follows the camera's motion on it
+    """
+    from ultralytics.engine.results import Boxes
+
+    return tracker.update(Boxes(boxes, frame.shape[:2]), frame)
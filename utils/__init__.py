@@ -1,9 +1,28 @@
-from .video_utils import read_video, save_video
+from .video_utils import (read_video,
+                          read_video_frames,
+                          read_video_chunks,
+                          batch_frames,
+                          save_video,
+                          get_video_frame_count,
+                          get_video_fps,
+                          concatenate_videos)
+from .video_io import VideoDecoder, VideoEncoder
 from .bounding_box_utils import (get_center_of_box,
                                  distance_between_points,
                                  get_foot_position,
                                  get_closest_keypoint_index,
                                  get_bounding_box_height,
-                                 measure_xy_distance)
+                                 measure_xy_distance,
+                                 get_centers_of_boxes,
+                                 distances_between_points,
+                                 get_foot_positions,
+                                 get_closest_keypoint_indices,
+                                 get_bounding_box_heights,
+                                 measure_xy_distances)
 from .conversions import convert_meters_to_pixels, convert_pixels_to_meters
-from .draw_player_stats import draw_player_stats
\ No newline at end of file
+from .draw_player_stats import draw_player_stats
+from .detections import Detections, as_detections
+from .window_utils import sliding_window_max
+from .overlay_sprite import OverlaySprite
+from .court_keypoints import CourtKeypoints, as_court_keypoints
+from .frame_scaler import FrameScaler
@@ -1,44 +1,91 @@
-import math
+import numpy as np
 
-def get_center_of_box(bounding_box):
-    x1, y1, x2, y2 = bounding_box
-    center_x = int((x1 + x2) / 2)
-    center_y = int((y1 + y2) / 2)
-    
-    return (center_x, center_y)
+# Array versions work on all boxes or points at once: boxes are (..., 4) arrays
+# of (x min, y min, x max, y max) and points are (..., 2) arrays of (x, y), so
+# one call covers every detection of a video. The single box versions below
+# them are thin wrappers kept for code that handles one detection at a time,
+# except measure_xy_distance and get_bounding_box_height, which are a
+# subtraction each and stay plain Python
 
-def distance_between_points(p1, p2):
-    x1, y1 = p1
-    x2, y2 = p2
+def get_centers_of_boxes(bounding_boxes):
+    """
+    Returns the (..., 2) centers of (..., 4) bounding boxes, truncated like int() does.
+    """
+    bounding_boxes = np.asarray(bounding_boxes, dtype=np.float64)
+    x1, y1, x2, y2 = np.moveaxis(bounding_boxes, -1, 0)
 
-    distance = math.sqrt(math.pow(x2 - x1, 2) + math.pow(y2 - y1, 2))
+    return np.trunc(np.stack([(x1 + x2) / 2, (y1 + y2) / 2], axis=-1))
 
-    return distance
+def distances_between_points(points_1, points_2):
+    """
+    Returns the distances between (..., 2) arrays of points, broadcast against
+    each other, e.g. (N, 1, 2) and (1, 14, 2) points give the (N, 14) distances
+    of N players to 14 keypoints.
+    """
+    differences = np.subtract(points_2, points_1).astype(np.float64)
 
-def measure_xy_distance(p1, p2):
-    return abs(p1[0] - p2[0]), abs(p1[1] - p2[1])
+    return np.sqrt(np.sum(differences ** 2, axis=-1))
 
-def get_foot_position(player_bounding_box):
-    x1, y1, x2, y2 = player_bounding_box
+def measure_xy_distances(points_1, points_2):
+    """
+    Returns the (..., 2) absolute x and y distances between (..., 2) arrays of points.
+    """
+    return np.abs(np.subtract(points_1, points_2))
 
-    return (int((x1 + x2) / 2), y2)
+def get_foot_positions(bounding_boxes):
+    """
+    Returns the (..., 2) feet of (..., 4) player bounding boxes, the middle of
+    the bottom edge with x truncated like int() does.
+    """
+    bounding_boxes = np.asarray(bounding_boxes, dtype=np.float64)
+    x1, _, x2, y2 = np.moveaxis(bounding_boxes, -1, 0)
 
-def get_closest_keypoint_index(point, court_keypoints, keypoint_indices):
-    closest_distance = float("inf")
+    return np.stack([np.trunc((x1 + x2) / 2), y2], axis=-1)
 
-    # Candidate for closest keypoint index
-    keypoint_index = keypoint_indices[0]
+def get_closest_keypoint_indices(points, court_keypoints, keypoint_indices):
+    """
+    Returns the index of the keypoint closest to each point in y, out of
+    keypoint_indices. The first one wins on ties.
 
-    for index in keypoint_indices:
-        # Retrieve x and y coordinates
-        keypoint = court_keypoints[index * 2], court_keypoints[index * 2 + 1]
-        distance = abs(point[1] - keypoint[1])
+    :param points: (N, 2) array of points
+    :param court_keypoints: flat array of (x, y) keypoint coordinates shared by all
+                            points, or an (N, 28) array with the keypoints of each point
+    :param keypoint_indices: indices of the keypoints to choose from
+    """
+    points = np.asarray(points)
+    keypoint_indices = np.asarray(keypoint_indices)
+    court_keypoints = np.asarray(court_keypoints)
 
-        if distance < closest_distance:
-            closest_distance = distance
-            keypoint_index = index
+    keypoints_y = court_keypoints[..., keypoint_indices * 2 + 1]
+
+    return keypoint_indices[np.argmin(np.abs(points[:, 1:2] - keypoints_y), axis=-1)]
+
+def get_bounding_box_heights(bounding_boxes):
+    """
+    Returns the heights of (..., 4) bounding boxes.
+    """
+    bounding_boxes = np.asarray(bounding_boxes)
+
+    return bounding_boxes[..., 3] - bounding_boxes[..., 1]
+
+def get_center_of_box(bounding_box):
+    center_x, center_y = get_centers_of_boxes(bounding_box)
 
-    return keypoint_index
+    return (int(center_x), int(center_y))
+
+def distance_between_points(p1, p2):
+    return float(distances_between_points(p1, p2))
+
+def measure_xy_distance(p1, p2):
+    return abs(p1[0] - p2[0]), abs(p1[1] - p2[1])
+
+def get_foot_position(player_bounding_box):
+    foot_x, _ = get_foot_positions(player_bounding_box)
+
+    return (int(foot_x), player_bounding_box[3])
+
+def get_closest_keypoint_index(point, court_keypoints, keypoint_indices):
+    return int(get_closest_keypoint_indices([point], court_keypoints, keypoint_indices)[0])
 
 def get_bounding_box_height(bounding_box):
-    return bounding_box[3] - bounding_box[1]
\ No newline at end of file
+    return bounding_box[3] - bounding_box[1]
@@ -0,0 +1,87 @@
+from bisect import bisect_right
+import numpy as np
+
+class CourtKeypoints:
+    """
+    Court keypoints of every frame of a video, stored once per camera segment.
+    A segment starts at a frame where the view changed (camera cut, replay,
+    zoom) and all its frames share the same keypoints.
+    """
+    def __init__(self, segment_starts=None, keypoints=None):
+        """
+        :param segment_starts: sorted list of the first frame number of each segment
+        :param keypoints: list of flat keypoint arrays, one per segment
+        """
+        self.segment_starts = list(segment_starts) if segment_starts is not None else []
+        self.keypoints = list(keypoints) if keypoints is not None else []
+
+    def add_segment(self, start_frame, keypoints):
+        """
+        Starts a new segment at start_frame. Segments have to be added in order.
+        """
+        self.segment_starts.append(start_frame)
+        self.keypoints.append(keypoints)
+
+    def get(self, frame_num):
+        """
+        Returns the flat keypoints of frame_num.
+        """
+        return self.keypoints[max(bisect_right(self.segment_starts, frame_num) - 1, 0)]
+
+    def get_per_frame(self, frame_indices):
+        """
+        Returns a (N, 28) array with the keypoints of each frame in frame_indices.
+
+        :param frame_indices: (N,) array of frame numbers
+        """
+        segment_indices = np.searchsorted(self.segment_starts, np.asarray(frame_indices), side="right") - 1
+
+        return np.stack(self.keypoints)[np.maximum(segment_indices, 0)]
+
+    def get_segment_indices(self, frame_indices):
+        """
+        Returns the index of the segment each frame in frame_indices belongs to.
+        """
+        return np.maximum(np.searchsorted(self.segment_starts, np.asarray(frame_indices), side="right") - 1, 0)
+
+    def save(self, path):
+        """
+        Saves the segments to a .npz file.
+        """
+        np.savez(path,
+                 segment_starts=np.asarray(self.segment_starts, dtype=np.int64),
+                 keypoints=np.asarray(self.keypoints))
+
+    @classmethod
+    def load(cls, path):
+        """
+        Loads segments saved with save().
+        """
+        with np.load(path) as arrays:
+            return cls(arrays["segment_starts"].tolist(), list(arrays["keypoints"]))
+
+    @classmethod
+    def concatenate(cls, court_keypoints):
+        """
+        Joins CourtKeypoints of consecutive parts of a video, numbered by their
+        frames in the whole video, into one.
+        """
+        joined = cls()
+
+        for part in court_keypoints:
+            for start_frame, keypoints in zip(part.segment_starts, part.keypoints):
+                joined.add_segment(start_frame, keypoints)
+
+        return joined
+
+def as_court_keypoints(court_keypoints):
+    """
+    Returns court keypoints as a CourtKeypoints object. Flat keypoints are used
+    for every frame, like for a video from a single static camera.
+
+    :param court_keypoints: CourtKeypoints object or flat array of keypoint coordinates
+    """
+    if isinstance(court_keypoints, CourtKeypoints):
+        return court_keypoints
+
+    return CourtKeypoints([0], [np.asarray(court_keypoints)])
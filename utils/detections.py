@@ -0,0 +1,268 @@
+import os
+import pickle
+import shutil
+import tempfile
+import numpy as np
+
+class Detections:
+    """
+    Columnar store of per-frame detections. Instead of one dictionary per frame,
+    all detections of a video live in three contiguous NumPy arrays:
+
+    frame_offsets: (num_frames + 1,) array, the detections of frame f are the
+                   rows frame_offsets[f]:frame_offsets[f + 1] of the other arrays
+    track_ids: (N,) array of the ID of each detection
+    coords: (N, 4) array of bounding boxes (x min, y min, x max, y max) or
+            (N, 2) array of points (x, y)
+
+    Indexing a frame returns the old dictionary form ({id: coordinates}) and
+    iterating yields one dictionary per frame, so code written for the list of
+    dictionaries keeps working.
+    """
+    def __init__(self, frame_offsets, track_ids, coords):
+        self.frame_offsets = frame_offsets
+        self.track_ids = track_ids
+        self.coords = coords
+
+    @classmethod
+    def from_dicts(cls, detections, num_coords=4):
+        """
+        Builds Detections from a list of dictionaries of IDs to coordinates.
+
+        :param detections: list of dictionaries, one per frame
+        :param num_coords: number of coordinates per detection (4 for boxes, 2 for points)
+        """
+        frame_offsets = np.zeros(len(detections) + 1, dtype=np.int64)
+        track_ids = []
+        coords = []
+
+        for frame_num, detection_dict in enumerate(detections):
+            frame_offsets[frame_num + 1] = frame_offsets[frame_num] + len(detection_dict)
+            track_ids.extend(detection_dict.keys())
+            coords.extend(detection_dict.values())
+
+        track_ids = np.array(track_ids, dtype=np.int64)
+        coords = np.array(coords, dtype=np.float64).reshape(-1, num_coords)
+
+        return cls(frame_offsets, track_ids, coords)
+
+    @classmethod
+    def from_arrays(cls, frame_indices, track_ids, coords, num_frames):
+        """
+        Builds Detections from one row per detection.
+
+        :param frame_indices: (N,) array of the frame number of each detection, sorted
+        :param track_ids: (N,) array of the ID of each detection
+        :param coords: (N, k) array of the coordinates of each detection
+        :param num_frames: number of frames in the video
+        """
+        # Number of detections in each frame, then the running total gives the offsets
+        detections_per_frame = np.bincount(np.asarray(frame_indices, dtype=np.int64), minlength=num_frames)
+        frame_offsets = np.concatenate(([0], np.cumsum(detections_per_frame))).astype(np.int64)
+
+        return cls(frame_offsets,
+                   np.asarray(track_ids, dtype=np.int64),
+                   np.asarray(coords, dtype=np.float64))
+
+    @classmethod
+    def from_dense(cls, dense_coords, track_id=1):
+        """
+        Builds Detections for a single ID from a (num_frames, k) array with one row
+        per frame. Rows containing NaN are frames without a detection.
+
+        :param dense_coords: (num_frames, k) array of coordinates
+        :param track_id: ID given to every detection
+        """
+        dense_coords = np.asarray(dense_coords, dtype=np.float64)
+        detected = ~np.isnan(dense_coords).any(axis=1)
+        frame_indices = np.flatnonzero(detected)
+
+        return cls.from_arrays(frame_indices,
+                               np.full(len(frame_indices), track_id, dtype=np.int64),
+                               dense_coords[detected],
+                               len(dense_coords))
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        """
+        Loads detections saved with save(). The arrays are memory-mapped by default,
+        so loading is zero-copy and only the parts that are used get read from disk.
+        Pickle stubs (.pkl) holding the old list of dictionaries are still supported,
+        and are picked up in place of a missing directory (path + ".pkl").
+
+        :param path: directory written by save() or a .pkl stub
+        :param mmap_mode: mmap_mode passed to np.load, None reads the arrays into memory
+        """
+        if not path.endswith(".pkl") and not os.path.isdir(path) and os.path.exists(path + ".pkl"):
+            path += ".pkl"
+
+        if path.endswith(".pkl"):
+            with open(path, "rb") as f:
+                return cls.from_dicts(pickle.load(f))
+
+        arrays = [np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+                  for name in ("frame_offsets", "track_ids", "coords")]
+
+        return cls(*arrays)
+
+    @staticmethod
+    def is_saved(path, key=None):
+        """
+        Returns whether detections were saved at path, see load. When key is given,
+        only detections saved with the same key count, so a stub made from another
+        video or model isn't mistaken for this one's. Pickle stubs have no key.
+
+        :param path: directory written by save() or a .pkl stub
+        :param key: string the detections were saved with, e.g. from get_stub_key
+        """
+        if key is None:
+            return os.path.exists(path) or os.path.exists(path + ".pkl")
+
+        key_path = os.path.join(path, "key.txt")
+
+        if not os.path.isfile(key_path):
+            return False
+
+        with open(key_path) as f:
+            return f.read() == key
+
+    def save(self, path, key=None):
+        """
+        Saves the detections as one .npy file per array inside the directory path.
+        A path ending in .pkl writes the old pickled list of dictionaries instead.
+
+        :param path: directory to save the arrays to
+        :param key: optional string saved along, see is_saved
+        """
+        if path.endswith(".pkl"):
+            with open(path, "wb") as f:
+                pickle.dump(self.to_dicts(), f)
+
+            return
+
+        parent_dir = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent_dir, exist_ok=True)
+
+        # Everything is written to a temporary directory next to path that is renamed
+        # into place once complete, so path never holds detections cut off while
+        # saving or the key of earlier ones. Detections loaded (memory-mapped) from
+        # path can be saved back to it, their files are never overwritten
+        save_dir = tempfile.mkdtemp(dir=parent_dir, prefix=".detections_")
+
+        try:
+            np.save(os.path.join(save_dir, "frame_offsets.npy"), self.frame_offsets)
+            np.save(os.path.join(save_dir, "track_ids.npy"), self.track_ids)
+            np.save(os.path.join(save_dir, "coords.npy"), self.coords)
+
+            if key is not None:
+                with open(os.path.join(save_dir, "key.txt"), "w") as f:
+                    f.write(key)
+
+            # A directory can only be renamed onto an empty one, so earlier detections
+            # are moved out of the way first and deleted once the new ones are in place
+            old_dir = None
+
+            if os.path.isdir(path):
+                old_dir = tempfile.mkdtemp(dir=parent_dir, prefix=".detections_")
+                os.replace(path, old_dir)
+
+            os.replace(save_dir, path)
+        except BaseException:
+            shutil.rmtree(save_dir, ignore_errors=True)
+            raise
+
+        if old_dir is not None:
+            shutil.rmtree(old_dir, ignore_errors=True)
+
+    @property
+    def num_frames(self):
+        return len(self.frame_offsets) - 1
+
+    @property
+    def frame_indices(self):
+        """
+        (N,) array of the frame number of each detection.
+        """
+        return np.repeat(np.arange(self.num_frames), np.diff(self.frame_offsets))
+
+    def __len__(self):
+        return self.num_frames
+
+    def __getitem__(self, index):
+        # Slicing keeps the columnar form, e.g. the detections of a chunk of frames
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.num_frames)
+
+            if step != 1:
+                raise ValueError("Detections only supports contiguous slices")
+
+            stop = max(start, stop)
+            first_row = self.frame_offsets[start]
+            last_row = self.frame_offsets[stop]
+
+            return Detections(self.frame_offsets[start:stop + 1] - first_row,
+                              self.track_ids[first_row:last_row],
+                              self.coords[first_row:last_row])
+
+        if index < 0:
+            index += self.num_frames
+
+        if not 0 <= index < self.num_frames:
+            raise IndexError("frame index out of range")
+
+        rows = slice(self.frame_offsets[index], self.frame_offsets[index + 1])
+
+        return {int(track_id): coords.tolist()
+                for track_id, coords in zip(self.track_ids[rows], self.coords[rows])}
+
+    def __iter__(self):
+        for frame_num in range(self.num_frames):
+            yield self[frame_num]
+
+    def to_dicts(self):
+        """
+        Returns the old list of dictionaries of IDs to coordinates, one per frame.
+        """
+        return list(self)
+
+    def to_dense(self, track_id):
+        """
+        Returns a (num_frames, k) array with the coordinates of track_id in each
+        frame, NaN where track_id wasn't detected.
+
+        :param track_id: ID to extract
+        """
+        dense_coords = np.full((self.num_frames, self.coords.shape[1]), np.nan)
+        rows = self.track_ids == track_id
+
+        # Later detections of the same ID in a frame overwrite earlier ones,
+        # like assigning into a dictionary did
+        dense_coords[self.frame_indices[rows]] = self.coords[rows]
+
+        return dense_coords
+
+    def filter_track_ids(self, track_ids):
+        """
+        Returns the detections that belong to one of the given IDs.
+
+        :param track_ids: IDs to keep
+        """
+        keep = np.isin(self.track_ids, list(track_ids))
+
+        return Detections.from_arrays(self.frame_indices[keep],
+                                      self.track_ids[keep],
+                                      self.coords[keep],
+                                      self.num_frames)
+
+def as_detections(detections, num_coords=4):
+    """
+    Returns detections as a Detections object, converting the old list of
+    dictionaries of IDs to coordinates if needed.
+
+    :param detections: Detections object or list of dictionaries, one per frame
+    :param num_coords: number of coordinates per detection (4 for boxes, 2 for points)
+    """
+    if isinstance(detections, Detections):
+        return detections
+
+    return Detections.from_dicts(detections, num_coords=num_coords)
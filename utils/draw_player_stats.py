@@ -1,57 +1,158 @@
 import numpy as np
 import cv2
+from .overlay_sprite import OverlaySprite
+from instrumentation import profiled
 
-def draw_player_stats(output_video_frames, player_stats):
-    for index, row in player_stats.iterrows():
-        player_1_shot_speed = row["player_1_last_shot_speed"]
-        player_2_shot_speed = row["player_2_last_shot_speed"]
-        player_1_speed = row["player_1_last_player_speed"]
-        player_2_speed = row["player_2_last_player_speed"]
+# Stats shown in the panel, in the order they are drawn
+PLAYER_STATS_COLUMNS = ["player_1_last_shot_speed",
+                        "player_2_last_shot_speed",
+                        "player_1_last_player_speed",
+                        "player_2_last_player_speed",
+                        "player_1_average_shot_speed",
+                        "player_2_average_shot_speed",
+                        "player_1_average_player_speed",
+                        "player_2_average_player_speed"]
 
-        player_1_avg_shot_speed = row["player_1_average_shot_speed"]
-        player_2_avg_shot_speed = row["player_2_average_shot_speed"]
-        player_1_avg_speed = row["player_1_average_player_speed"]
-        player_2_avg_speed = row["player_2_average_player_speed"]
+class PlayerStatsPanel:
+    """
+    Draws the translucent player stats panel in the bottom right of each frame.
 
-        frame = output_video_frames[index]
-        shapes = np.zeros_like(frame, dtype=np.uint8)
+    Only the panel's region of the frame is darkened, and the text is drawn
+    once into a sprite that is reused until the stats change, which only
+    happens on ball hits.
+    """
+    def __init__(self):
+        self.width = 350
+        self.height = 230
 
-        width = 350
-        height = 230
+        # (frame shape and stats, sprite of the panel's text drawn for them), one
+        # tuple so threads drawing different frames see both change together
+        self.text_sprite = (None, None)
 
-        start_x = frame.shape[1]-400
-        start_y = frame.shape[0]-500
-        end_x = start_x+width
-        end_y = start_y+height
+    def get_panel_position(self, frame_shape):
+        """
+        Returns the (x, y) position of the panel's top left corner.
+        """
+        return frame_shape[1] - 400, frame_shape[0] - 500
 
-        overlay = frame.copy()
-        cv2.rectangle(overlay, (start_x, start_y), (end_x, end_y), (0, 0, 0), -1)
-        alpha = 0.5 
-        cv2.addWeighted(overlay, alpha, frame, 1 - alpha, 0, frame)
-        output_video_frames[index] = frame
+    def draw_panel_text(self, image, stats, start_x, start_y):
+        """
+        Draws the titles and the values of stats onto image, with the panel's
+        top left corner at (start_x, start_y).
+
+        :param stats: the values of PLAYER_STATS_COLUMNS for one frame
+        """
+        (player_1_shot_speed, player_2_shot_speed,
+         player_1_speed, player_2_speed,
+         player_1_avg_shot_speed, player_2_avg_shot_speed,
+         player_1_avg_speed, player_2_avg_speed) = stats
 
         text = "     Player 1     Player 2"
-        output_video_frames[index] = cv2.putText(output_video_frames[index], text, (start_x+80, start_y+30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-        
+        cv2.putText(image, text, (start_x+80, start_y+30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+
         text = "Shot Speed"
-        output_video_frames[index] = cv2.putText(output_video_frames[index], text, (start_x+10, start_y+80), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1)
+        cv2.putText(image, text, (start_x+10, start_y+80), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1)
         text = f"{player_1_shot_speed:.1f} km/h    {player_2_shot_speed:.1f} km/h"
-        output_video_frames[index] = cv2.putText(output_video_frames[index], text, (start_x+130, start_y+80), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
+        cv2.putText(image, text, (start_x+130, start_y+80), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
 
         text = "Player Speed"
-        output_video_frames[index] = cv2.putText(output_video_frames[index], text, (start_x+10, start_y+120), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1)
+        cv2.putText(image, text, (start_x+10, start_y+120), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1)
         text = f"{player_1_speed:.1f} km/h    {player_2_speed:.1f} km/h"
-        output_video_frames[index] = cv2.putText(output_video_frames[index], text, (start_x+130, start_y+120), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
-        
-        
+        cv2.putText(image, text, (start_x+130, start_y+120), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
+
         text = "avg. S. Speed"
-        output_video_frames[index] = cv2.putText(output_video_frames[index], text, (start_x+10, start_y+160), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1)
+        cv2.putText(image, text, (start_x+10, start_y+160), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1)
         text = f"{player_1_avg_shot_speed:.1f} km/h    {player_2_avg_shot_speed:.1f} km/h"
-        output_video_frames[index] = cv2.putText(output_video_frames[index], text, (start_x+130, start_y+160), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
-        
+        cv2.putText(image, text, (start_x+130, start_y+160), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
+
         text = "avg. P. Speed"
-        output_video_frames[index] = cv2.putText(output_video_frames[index], text, (start_x+10, start_y+200), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1)
+        cv2.putText(image, text, (start_x+10, start_y+200), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 255), 1)
         text = f"{player_1_avg_speed:.1f} km/h    {player_2_avg_speed:.1f} km/h"
-        output_video_frames[index] = cv2.putText(output_video_frames[index], text, (start_x+130, start_y+200), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
-    
-    return output_video_frames
\ No newline at end of file
+        cv2.putText(image, text, (start_x+130, start_y+200), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2)
+
+        return image
+
+    def get_text_sprite(self, frame_shape, stats):
+        """
+        Returns the sprite of the panel's text for stats, drawing it only if the
+        stats or the frame shape changed since the last call.
+        """
+        sprite_key = (frame_shape, stats.tobytes())
+        key, text_sprite = self.text_sprite
+
+        if key != sprite_key:
+            start_x, start_y = self.get_panel_position(frame_shape)
+
+            # The text is drawn onto a canvas covering the frame from the panel's
+            # corner to the bottom right, so text running past the panel still shows
+            canvas_x = max(start_x, 0)
+            canvas_y = max(start_y, 0)
+            canvas_shape = (frame_shape[0] - canvas_y, frame_shape[1] - canvas_x, frame_shape[2])
+
+            text_sprite = OverlaySprite(canvas_shape,
+                                        lambda image: self.draw_panel_text(image, stats,
+                                                                           start_x - canvas_x,
+                                                                           start_y - canvas_y),
+                                        offset=(canvas_x, canvas_y))
+            self.text_sprite = (sprite_key, text_sprite)
+
+        return text_sprite
+
+    def draw(self, output_video_frames, player_stats, start_frame=0):
+        """
+        Draws the panel onto each frame in place.
+
+        :param output_video_frames: list of NumPy arrays representing video frames
+        :param player_stats: columns of player stats, one value per frame of the video.
+                             A dictionary of column names to arrays or a dataframe
+        :param start_frame: frame number of the first frame in output_video_frames
+        """
+        # (num_frames, 8) array of the stats of the frames that were passed in
+        stats = self.get_stats_rows(player_stats, start_frame, start_frame + len(output_video_frames))
+
+        for index, frame_stats in enumerate(stats):
+            self.draw_frame(output_video_frames[index], frame_stats)
+
+        return output_video_frames
+
+    def get_stats_rows(self, player_stats, start_frame, end_frame):
+        """
+        Returns the (end_frame - start_frame, 8) array of the stats of frames
+        [start_frame, end_frame), in the order of PLAYER_STATS_COLUMNS.
+        """
+        return np.column_stack([np.asarray(player_stats[column], dtype=np.float64)[start_frame:end_frame]
+                                for column in PLAYER_STATS_COLUMNS])
+
+    def draw_frame(self, frame, frame_stats):
+        """
+        Draws the panel onto a single frame in place and returns it. Safe to call
+        from several threads at once.
+
+        :param frame: NumPy array representing a video frame
+        :param frame_stats: array of the frame's values of PLAYER_STATS_COLUMNS
+        """
+        start_x, start_y = self.get_panel_position(frame.shape)
+
+        # Darken only the panel's region (both corners are included in the panel)
+        roi = (slice(max(start_y, 0), start_y + self.height + 1), slice(max(start_x, 0), start_x + self.width + 1))
+        alpha = 0.5
+        frame[roi] = cv2.addWeighted(np.zeros_like(frame[roi]), alpha, frame[roi], 1 - alpha, 0)
+
+        return self.get_text_sprite(frame.shape, frame_stats).draw(frame)
+
+# Shared by every call so the text sprite is reused across chunks of the video
+player_stats_panel = PlayerStatsPanel()
+
+@profiled("draw_player_stats", frames=0)
+def draw_player_stats(output_video_frames, player_stats, start_frame=0):
+    """
+    Draws the player stats panel onto each frame. output_video_frames can be a
+    chunk of the video starting at frame start_frame, in which case only the
+    matching entries of player_stats are drawn.
+
+    :param output_video_frames: list of NumPy arrays representing video frames
+    :param player_stats: columns of player stats, one value per frame of the video.
+                         A dictionary of column names to arrays or a dataframe
+    :param start_frame: frame number of the first frame in output_video_frames
+    """
+    return player_stats_panel.draw(output_video_frames, player_stats, start_frame=start_frame)
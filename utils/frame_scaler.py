@@ -0,0 +1,121 @@
+import cv2
+import numpy as np
+from .detections import Detections
+
+class FrameScaler:
+    """
+    Makes the downscaled copy of each frame that all detectors run on and maps
+    their boxes and keypoints back to the source frame's pixel space.
+
+    The YOLO models resize every frame to 640 pixels and the keypoints CNN to
+    224 anyway, so on 1080p or 4K sources most of the time spent handing them
+    full resolution frames goes into moving pixels they throw away. Shrinking
+    each frame once, with area averaging, and giving the same copy to every
+    detector leaves the source frame to the rendering.
+
+    The aspect ratio is kept, YOLO letterboxes the copy itself and the keypoints
+    CNN was trained on stretched frames, so the copy isn't padded. Its size is
+    rounded to whole pixels, which is why x and y have their own scale.
+    """
+    def __init__(self, max_size=None):
+        """
+        :param max_size: longest side in pixels of the copies, None (or a size at least
+                         as large as the frames) hands the detectors the source frames
+        """
+        self.max_size = max_size
+
+        # (width, height) of the source frames and of their copies, set by downscale
+        self.source_size = None
+        self.size = None
+
+        # Source pixels per pixel of the copy, along x and y
+        self.scale = np.ones(2)
+
+    def get_size(self, frame_shape):
+        """
+        Returns the (width, height) of the copy of a frame of the given shape.
+        """
+        height, width = frame_shape[:2]
+
+        if self.max_size is None or max(width, height) <= self.max_size:
+            return (width, height)
+
+        ratio = self.max_size / max(width, height)
+
+        return (max(1, round(width * ratio)), max(1, round(height * ratio)))
+
+    def downscale(self, frame):
+        """
+        Returns the copy of a frame the detectors run on, the frame itself when it
+        isn't larger than max_size. All frames of a video have the same size.
+
+        :param frame: NumPy array representing a video frame
+        """
+        height, width = frame.shape[:2]
+
+        if self.source_size != (width, height):
+            self.source_size = (width, height)
+            self.size = self.get_size(frame.shape)
+            self.scale = np.array([width / self.size[0], height / self.size[1]])
+
+        if self.size == self.source_size:
+            return frame
+
+        return cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+
+    def downscale_frames(self, frames):
+        """
+        Yields the copy of every frame, see downscale.
+
+        :param frames: iterable of NumPy arrays representing video frames
+        """
+        for frame in frames:
+            yield self.downscale(frame)
+
+    @property
+    def enabled(self):
+        """
+        Whether frames are actually shrunk, only known once a frame was downscaled.
+        """
+        return self.size is not None and self.size != self.source_size
+
+    def remap_coords(self, coords):
+        """
+        Returns (..., 4) boxes (x min, y min, x max, y max) or (..., 2) points (x, y)
+        in the copy's pixel space mapped to the source frame's.
+        """
+        coords = np.asarray(coords, dtype=np.float64)
+
+        return coords * np.tile(self.scale, coords.shape[-1] // 2)
+
+    def remap_keypoints(self, keypoints):
+        """
+        Returns flat (x, y) court keypoints of the copy mapped to the source frame,
+        with the same dtype.
+        """
+        keypoints = np.asarray(keypoints)
+
+        if not self.enabled:
+            return keypoints
+
+        return self.remap_coords(keypoints.reshape(-1, 2)).ravel().astype(keypoints.dtype)
+
+    def remap_detections(self, detections):
+        """
+        Returns Detections of the copies mapped to the source frames.
+        """
+        if not self.enabled:
+            return detections
+
+        return Detections(detections.frame_offsets, detections.track_ids, self.remap_coords(detections.coords))
+
+    def remap_dicts(self, detection_dicts):
+        """
+        Returns dictionaries of IDs to coordinates of the copies mapped to the
+        source frames, one per frame.
+        """
+        if not self.enabled:
+            return detection_dicts
+
+        return [{track_id: self.remap_coords(coords).tolist() for track_id, coords in detection_dict.items()}
+                for detection_dict in detection_dicts]
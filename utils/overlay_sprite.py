@@ -0,0 +1,73 @@
+import cv2
+import numpy as np
+
+class OverlaySprite:
+    """
+    Static graphics (lines, circles, text) rasterized once and stamped onto
+    every frame. Only the regions around the pixels that were drawn on are
+    kept, so stamping a frame costs as much as the graphics' area instead of
+    the whole frame.
+    """
+    def __init__(self, frame_shape, draw, offset=(0, 0)):
+        """
+        :param frame_shape: shape of the canvas the graphics are drawn onto, by default
+                            the shape of the frames the sprite will be stamped onto
+        :param draw: function drawing the graphics onto the canvas it is given
+        :param offset: (x, y) position of the canvas' top left corner in the frame,
+                       so graphics covering a small part of the frame can be drawn
+                       onto a small canvas
+        """
+        # Draw onto an all black and an all white canvas. For every pixel:
+        #   black canvas = alpha * color (the color already multiplied by its alpha)
+        #   white canvas - black canvas = (1 - alpha) * 255 (how much of the frame shows through)
+        # A black line doesn't change the black canvas, which is why both are needed
+        black_canvas = np.zeros(frame_shape, dtype=np.uint8)
+        white_canvas = np.full(frame_shape, 255, dtype=np.uint8)
+        draw(black_canvas)
+        draw(white_canvas)
+
+        transparency = white_canvas - black_canvas
+
+        # Graphics can be spread out (e.g. court keypoints), so nearby drawn pixels
+        # are grouped into regions and only the regions are blended, not the
+        # whole area between them
+        drawn = (transparency != 255).any(axis=2)
+        grouped = cv2.dilate(drawn.astype(np.uint8), np.ones((15, 15), dtype=np.uint8))
+        num_labels, labels = cv2.connectedComponents(grouped)
+
+        offset_x, offset_y = offset
+        self.regions = []
+
+        for label in range(1, num_labels):
+            region_drawn = drawn & (labels == label)
+            rows = np.flatnonzero(region_drawn.any(axis=1))
+            cols = np.flatnonzero(region_drawn.any(axis=0))
+
+            if len(rows) == 0:
+                continue
+
+            canvas_roi = (slice(rows[0], rows[-1] + 1), slice(cols[0], cols[-1] + 1))
+            frame_roi = (slice(rows[0] + offset_y, rows[-1] + 1 + offset_y),
+                         slice(cols[0] + offset_x, cols[-1] + 1 + offset_x))
+
+            # Pixels of other regions inside this region's rectangle are left
+            # untouched (color 0, transparency 255), so they aren't blended twice
+            in_region = region_drawn[canvas_roi][:, :, np.newaxis]
+            colors = np.where(in_region, black_canvas[canvas_roi], 0).astype(np.uint8)
+            region_transparency = np.where(in_region, transparency[canvas_roi], 255).astype(np.uint8)
+
+            self.regions.append((frame_roi, colors, region_transparency))
+
+    def draw(self, frame):
+        """
+        Stamps the sprite onto frame in place and returns it.
+
+        :param frame: NumPy array representing a video frame
+        """
+        for roi, colors, transparency in self.regions:
+            # colors + frame * transparency / 255, rounded to the nearest value. Opaque
+            # pixels (transparency 0) are replaced, pixels that weren't drawn on
+            # (transparency 255) keep their value
+            frame[roi] = cv2.add(colors, cv2.multiply(frame[roi], transparency, scale=1 / 255))
+
+        return frame
@@ -0,0 +1,291 @@
+import queue
+import shutil
+import subprocess
+import threading
+import warnings
+from collections import deque
+import cv2
+import numpy as np
+from instrumentation import profile_stage
+
+class VideoDecoder:
+    """
+    Decodes a video on a background thread, up to prefetch frames ahead of the
+    caller, so decoding overlaps with whatever the caller does with the frames
+    (OpenCV releases the GIL while decoding).
+
+    Frames are decoded into a ring of arrays. With num_held set the arrays are
+    reused: only the num_held most recently returned frames stay valid, older
+    ones get overwritten by frames decoded later. Without it every frame is a
+    new array the caller can keep.
+    """
+    def __init__(self, video_path, start_frame=0, end_frame=None, prefetch=8, num_held=None):
+        """
+        :param video_path: path to the video file
+        :param start_frame: frame number of the first frame to read
+        :param end_frame: frame number to stop before, None reads to the end of the video
+        :param prefetch: number of frames decoded ahead of the caller
+        :param num_held: number of most recent frames the caller keeps using (at least 1),
+                         None to get a new array for every frame
+        """
+        if num_held is not None and num_held < 1:
+            raise ValueError(f"num_held must be at least 1, got {num_held}")
+
+        self.video_path = video_path
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.prefetch = prefetch
+        self.num_held = num_held
+
+    def __iter__(self):
+        """
+        Yields the frames of the video in order. The decoder thread stops when the
+        video ends or the caller stops iterating.
+        """
+        num_buffers = self.prefetch + (self.num_held or 0)
+        buffers = [None] * num_buffers
+
+        # Buffers the decoder may write to, and buffers holding decoded frames in order
+        free_buffers = queue.Queue()
+        decoded_buffers = queue.Queue()
+
+        for index in range(num_buffers):
+            free_buffers.put(index)
+
+        stop_event = threading.Event()
+        thread = threading.Thread(target=self.decode, args=(buffers, free_buffers, decoded_buffers, stop_event),
+                                  daemon=True)
+        thread.start()
+
+        held_buffers = deque()
+
+        try:
+            while True:
+                index = decoded_buffers.get()
+
+                if index is None:
+                    break
+
+                if isinstance(index, Exception):
+                    raise index
+
+                frame = buffers[index]
+
+                if self.num_held is None:
+                    # The caller owns the frame, the next frame is decoded into a new array
+                    buffers[index] = None
+                    free_buffers.put(index)
+                else:
+                    held_buffers.append(index)
+
+                    # The oldest frame the caller may still use is given back to the decoder
+                    if len(held_buffers) > self.num_held:
+                        free_buffers.put(held_buffers.popleft())
+
+                yield frame
+        finally:
+            # Runs even if the caller stops iterating early, wakes a decoder waiting for a buffer
+            stop_event.set()
+            free_buffers.put(None)
+            thread.join()
+
+    def decode(self, buffers, free_buffers, decoded_buffers, stop_event):
+        """
+        Decoder thread. Reads frames into free buffers and queues their indices,
+        then None at the end. An error is queued for the caller to raise.
+        """
+        cap = self.open_at_start_frame()
+
+        try:
+            frame_num = self.start_frame
+
+            while self.end_frame is None or frame_num < self.end_frame:
+                index = free_buffers.get()
+
+                if index is None or stop_event.is_set():
+                    break
+
+                # Decodes into the buffer's array if it has one of the right size
+                with profile_stage("VideoDecoder.read", frames=1):
+                    ret, frame = cap.read(buffers[index])
+
+                if not ret:
+                    break
+
+                buffers[index] = frame
+                decoded_buffers.put(index)
+                frame_num += 1
+        except Exception as error:
+            decoded_buffers.put(error)
+        finally:
+            cap.release()
+            decoded_buffers.put(None)
+
+    def open_at_start_frame(self):
+        """
+        Returns a VideoCapture whose next frame is start_frame. Seeking decodes
+        forward from the keyframe before the target, which isn't frame accurate in
+        every container (no index, variable frame rate, timestamps not starting at
+        0). The seek is checked by reading the frame before start_frame, after
+        which OpenCV has to report start_frame as its position. If it doesn't, the
+        video is decoded from its first frame instead, the one position that is
+        always right, skipping the frames before start_frame.
+        """
+        cap = cv2.VideoCapture(self.video_path)
+
+        if self.start_frame <= 0:
+            return cap
+
+        cap.set(cv2.CAP_PROP_POS_FRAMES, self.start_frame - 1)
+
+        if cap.grab() and int(cap.get(cv2.CAP_PROP_POS_FRAMES)) == self.start_frame:
+            return cap
+
+        cap.release()
+        cap = cv2.VideoCapture(self.video_path)
+
+        # grab() decodes without converting the frame, the cheapest way to skip it
+        for _ in range(self.start_frame):
+            if not cap.grab():
+                break
+
+        return cap
+
+class VideoEncoder:
+    """
+    Encodes frames on a background thread. write() copies the frame into one of
+    queue_size preallocated arrays and returns, so the caller can draw the next
+    frame while this one is encoded. It only waits when the encoder is a whole
+    queue behind.
+
+    A four character codec (MJPG, mp4v, XVID, avc1) is encoded by OpenCV, any
+    other codec is taken as an ffmpeg encoder (libx264, libx265, mpeg4) and the
+    raw frames are piped to ffmpeg. The container follows the file extension.
+    Without ffmpeg installed, ffmpeg codecs fall back to OpenCV's mp4v with a
+    RuntimeWarning.
+
+    Can be used as a context manager, which closes the video on exit.
+    """
+    def __init__(self, output_video_path, fps=24, codec="MJPG", queue_size=8):
+        """
+        :param output_video_path: path of the video file to write
+        :param fps: frame rate stored in the video
+        :param codec: four character code for OpenCV or name of an ffmpeg encoder
+        :param queue_size: number of frames waiting to be encoded at most
+        """
+        self.output_video_path = output_video_path
+        self.fps = fps
+        self.codec = codec
+        self.queue_size = queue_size
+
+        # Created with the first frame, which gives the frame size
+        self.buffers = None
+        self.free_buffers = queue.Queue()
+        self.encode_queue = queue.Queue()
+        self.thread = None
+        self.writer = None
+        self.process = None
+        self.error = None
+
+    def open(self, frame):
+        """
+        Opens the video for frames like frame and starts the encoder thread.
+        """
+        height, width = frame.shape[:2]
+        codec = self.codec
+
+        if len(codec) != 4 and shutil.which("ffmpeg") is None:
+            warnings.warn(f"ffmpeg not found, encoding {self.output_video_path} with mp4v instead of {codec}",
+                          RuntimeWarning)
+            codec = "mp4v"
+
+        if len(codec) == 4:
+            self.writer = cv2.VideoWriter(self.output_video_path, cv2.VideoWriter_fourcc(*codec), self.fps,
+                                          (width, height))
+
+            if not self.writer.isOpened():
+                raise RuntimeError(f"Could not open {self.output_video_path} for writing with codec {codec}")
+        else:
+            self.process = subprocess.Popen(["ffmpeg", "-y", "-loglevel", "error",
+                                             "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}",
+                                             "-r", str(self.fps), "-i", "-",
+                                             "-an", "-c:v", codec, "-pix_fmt", "yuv420p",
+                                             self.output_video_path],
+                                            stdin=subprocess.PIPE)
+
+        self.buffers = [np.empty_like(frame) for _ in range(self.queue_size)]
+
+        for index in range(self.queue_size):
+            self.free_buffers.put(index)
+
+        self.thread = threading.Thread(target=self.encode, daemon=True)
+        self.thread.start()
+
+    def write(self, frame):
+        """
+        Queues a frame for encoding. The frame is copied, so the caller may change
+        or reuse it right away.
+        """
+        if self.thread is None:
+            self.open(frame)
+
+        # Time spent here is the copy plus waiting for the encoder to catch up
+        with profile_stage("VideoEncoder.write", frames=1):
+            index = self.free_buffers.get()
+
+            if self.error is not None:
+                raise self.error
+
+            np.copyto(self.buffers[index], frame)
+            self.encode_queue.put(index)
+
+    def encode(self):
+        """
+        Encoder thread. Writes queued frames until None is queued. After an error
+        frames are only handed back, so write() never waits forever.
+        """
+        while True:
+            index = self.encode_queue.get()
+
+            if index is None:
+                break
+
+            try:
+                if self.error is None:
+                    with profile_stage("VideoEncoder.encode", frames=1):
+                        if self.writer is not None:
+                            self.writer.write(self.buffers[index])
+                        else:
+                            self.process.stdin.write(self.buffers[index].data)
+            except Exception as error:
+                self.error = error
+
+            self.free_buffers.put(index)
+
+    def close(self):
+        """
+        Waits for the queued frames to be encoded and closes the video.
+        """
+        if self.thread is None:
+            return
+
+        self.encode_queue.put(None)
+        self.thread.join()
+        self.thread = None
+
+        if self.writer is not None:
+            self.writer.release()
+        else:
+            self.process.stdin.close()
+
+            if self.process.wait() != 0 and self.error is None:
+                self.error = RuntimeError(f"ffmpeg failed to encode {self.output_video_path}")
+
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
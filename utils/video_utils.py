@@ -1,4 +1,10 @@
 import cv2
+import os
+import shutil
+import subprocess
+import tempfile
+from itertools import chain
+from .video_io import VideoDecoder, VideoEncoder
 
 def read_video(video_path):
     """
@@ -6,25 +12,130 @@ def read_video(video_path):
     as a list. Each frame in the list is a NumPy array. The shape of a
     frame is (height, width, channels)
     """
-    cap = cv2.VideoCapture(video_path)
-    frames = []
+    return list(read_video_frames(video_path))
+
+def read_video_frames(video_path, start_frame=0, end_frame=None, prefetch=8):
+    """
+    Lazily reads in a video from a specified video path, yielding one frame
+    at a time. Only the frames currently being processed (and up to prefetch
+    frames decoded ahead on a background thread) are kept in memory, so this
+    works for videos of any length. Every frame is a new array the caller can keep.
+
+    :param video_path: path to the video file
+    :param start_frame: frame number of the first frame to read
+    :param end_frame: frame number to stop before, None reads to the end of the video
+    :param prefetch: number of frames decoded ahead of the caller
+    """
+    return iter(VideoDecoder(video_path, start_frame, end_frame, prefetch=prefetch))
 
-    while True:
-        ret, frame = cap.read()
+def get_video_frame_count(video_path):
+    """
+    Returns the number of frames in a video as reported by its container.
+
+    :param video_path: path to the video file
+    """
+    cap = cv2.VideoCapture(video_path)
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
 
-        if not ret:
-            break
+    return frame_count
 
-        frames.append(frame)
+def get_video_fps(video_path):
+    """
+    Returns the frame rate of a video, 24 if the container doesn't report one.
 
+    :param video_path: path to the video file
+    """
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
     cap.release()
-    return frames
 
-def save_video(output_video_frames, output_video_path):
-    fourcc = cv2.VideoWriter_fourcc(*'MJPG')
-    out = cv2.VideoWriter(output_video_path, fourcc, 24, (output_video_frames[0].shape[1], output_video_frames[0].shape[0]))
+    return fps or 24
+
+def batch_frames(frames, batch_size):
+    """
+    Groups an iterable of frames into lists of at most batch_size frames.
+    The last batch holds whatever frames are left over.
+
+    :param frames: iterable of NumPy arrays representing video frames
+    :param batch_size: maximum number of frames per batch
+    """
+    batch = []
+
+    for frame in frames:
+        batch.append(frame)
+
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+def read_video_chunks(video_path, chunk_size, start_frame=0, end_frame=None, prefetch=8):
+    """
+    Lazily reads in a video in fixed-size chunks. Yields (start_frame, frames)
+    tuples where start_frame is the frame number of the first frame in the chunk.
+
+    The frames are decoded ahead on a background thread into a fixed ring of
+    chunk_size + prefetch arrays that is reused for the whole video, so the
+    frames of a chunk are only valid until the next chunk is requested. Copy
+    any frame that has to live longer.
+
+    :param video_path: path to the video file
+    :param chunk_size: maximum number of frames per chunk
+    :param start_frame: frame number of the first frame to read
+    :param end_frame: frame number to stop before, None reads to the end of the video
+    :param prefetch: number of frames decoded ahead of the caller
+    """
+    frames = VideoDecoder(video_path, start_frame, end_frame, prefetch=prefetch, num_held=chunk_size)
+
+    for chunk in batch_frames(frames, chunk_size):
+        yield start_frame, chunk
+        start_frame += len(chunk)
+
+def save_video(output_video_frames, output_video_path, fps=24, codec="MJPG"):
+    """
+    Writes frames to a video file. output_video_frames can be a list or any
+    iterable (e.g. a generator), in which case frames are encoded as they are
+    produced and never held in memory all at once. Encoding runs on a background
+    thread while the next frames are produced, see VideoEncoder.
+
+    :param output_video_frames: iterable of NumPy arrays representing video frames
+    :param output_video_path: path of the video file to write
+    :param fps: frame rate stored in the video, usually the input video's
+    :param codec: four character code for OpenCV (MJPG, mp4v, ...) or name of an
+                  ffmpeg encoder (libx264, ...)
+    """
+    # The encoder needs the frame size, so the video is opened once the first frame arrives
+    with VideoEncoder(output_video_path, fps=fps, codec=codec) as encoder:
+        for frame in output_video_frames:
+            encoder.write(frame)
+
+def concatenate_videos(video_paths, output_video_path, fps=24, codec="MJPG"):
+    """
+    Joins videos with the same frame size and codec into one video. Uses ffmpeg
+    to copy the encoded frames without re-encoding when it is installed,
+    otherwise the frames are decoded and encoded again with fps and codec.
+
+    :param video_paths: list of paths of the videos to join, in order
+    :param output_video_path: path of the video file to write
+    :param fps: frame rate of the videos, only used when re-encoding
+    :param codec: codec to re-encode with, see save_video
+    """
+    if shutil.which("ffmpeg") is None:
+        # Every frame is encoded before the next one is decoded, so the buffers can be reused
+        frames = chain.from_iterable(VideoDecoder(video_path, num_held=1) for video_path in video_paths)
+        save_video(frames, output_video_path, fps=fps, codec=codec)
+        return
+
+    # The concat demuxer reads the list of videos from a text file
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+        for video_path in video_paths:
+            f.write(f"file '{os.path.abspath(video_path)}'\n")
 
-    for frame in output_video_frames:
-        out.write(frame)
-        
-    out.release()
\ No newline at end of file
+    try:
+        subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-f", "concat", "-safe", "0",
+                        "-i", f.name, "-c", "copy", output_video_path], check=True)
+    finally:
+        os.remove(f.name)
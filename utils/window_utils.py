@@ -0,0 +1,34 @@
+import numpy as np
+
+def sliding_window_max(values, before, after):
+    """
+    Returns, for every index i, the max of values[i - before : i + after + 1]
+    (clipped to the array). NaN values are ignored; windows without any
+    values give -inf.
+
+    Uses the van Herk/Gil-Werman algorithm: the array is split into blocks of
+    the window length, and the max of any window is the max of one block's
+    suffix max and the next block's prefix max. That is O(n) no matter how
+    large the window is.
+
+    :param values: (n,) array of values
+    :param before: number of values before i in the window
+    :param after: number of values after i in the window
+    """
+    values = np.asarray(values, dtype=np.float64)
+    num_values = len(values)
+    window_length = before + after + 1
+
+    # Pad so the window of index i starts at padded index i, then round up
+    # to a whole number of blocks
+    num_blocks = -(-(num_values + window_length - 1) // window_length)
+    padded = np.full(num_blocks * window_length, -np.inf)
+    padded[before:before + num_values] = np.where(np.isnan(values), -np.inf, values)
+
+    blocks = padded.reshape(num_blocks, window_length)
+    prefix_max = np.maximum.accumulate(blocks, axis=1).ravel()
+    suffix_max = np.maximum.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()
+
+    window_starts = np.arange(num_values)
+
+    return np.maximum(suffix_max[window_starts], prefix_max[window_starts + window_length - 1])